@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compares durations read by `probe_duration` from headers with mutagen over a
+corpus of recordings, in agreement and probing time per file."""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from jadio_feeder.duration import MP3_SUFFIXES, MP4_SUFFIXES, probe_duration
+from jadio_feeder.podcast import _media_path_to_duration_by_mutagen
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "paths", type=Path, nargs="+", help="Media files or directories of them"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Maximum difference from mutagen in seconds",
+    )
+    parser.add_argument(
+        "--max-files", type=int, default=None, help="Number of files to probe"
+    )
+    return parser.parse_args()
+
+
+def find_media(paths: List[Path], max_files: Optional[int]) -> List[Path]:
+    suffixes = MP3_SUFFIXES + MP4_SUFFIXES
+    ret = []
+    for path in paths:
+        if path.is_dir():
+            ret += sorted(x for x in path.rglob("*") if x.suffix in suffixes)
+        else:
+            ret.append(path)
+    return ret[:max_files]
+
+
+def measure(
+    fn: Callable[[Path], float], path: Path
+) -> Tuple[Optional[float], float, Optional[str]]:
+    start = time.perf_counter()
+    try:
+        duration, error = fn(path), None
+    except Exception as err:
+        duration, error = None, f"{type(err).__name__}: {err}"
+    return duration, time.perf_counter() - start, error
+
+
+def main():
+    args = parse_args()
+    paths = find_media(args.paths, args.max_files)
+    elapsed = {"probe": 0.0, "mutagen": 0.0}
+    counts: Dict[str, int] = {"agreed": 0, "mismatched": 0, "fallback": 0}
+    for path in paths:
+        # NOTE: mutagen runs second so that the probe does not benefit from
+        # the page cache warmed by mutagen
+        probed, probe_time, probe_error = measure(probe_duration, path)
+        expected, mutagen_time, mutagen_error = measure(
+            _media_path_to_duration_by_mutagen, path
+        )
+        elapsed["probe"] += probe_time
+        elapsed["mutagen"] += mutagen_time
+        if probe_error is not None or expected is None:
+            counts["fallback"] += 1
+            print(f"{path}: {probe_error or ''} / mutagen: {mutagen_error or ''}")
+        elif abs(probed - expected) > args.tolerance:
+            counts["mismatched"] += 1
+            print(f"{path}: {probed:.3f} != {expected:.3f} [s]")
+        else:
+            counts["agreed"] += 1
+
+    num_files = max(len(paths), 1)
+    print(f"{len(paths)} files, " + ", ".join(f"{k}: {v}" for k, v in counts.items()))
+    for name, value in elapsed.items():
+        print(f"{name:<8} {value:8.3f} [s] {value / num_files * 1e3:8.3f} [ms/file]")
+    if elapsed["probe"] > 0:
+        print(f"speedup  {elapsed['mutagen'] / elapsed['probe']:8.1f}x")
+    sys.exit(1 if counts["mismatched"] else 0)
+
+
+if __name__ == "__main__":
+    main()
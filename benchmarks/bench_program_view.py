@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Compares `Program.from_dict` of full documents with `ProgramView` of projected
+documents, in deserialization time and peak memory per feed."""
+import argparse
+import datetime as dt
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from bson import ObjectId
+from jadio import Program
+
+from jadio_feeder.program import PROGRAM_FIELDS, ProgramView
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num-programs", type=int, default=20000, help="Number of programs in a feed"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def create_document(index: int) -> Dict[str, Any]:
+    datetime = dt.datetime(2020, 1, 1) + dt.timedelta(hours=index)
+    return dict(
+        _id=ObjectId(),
+        platform_id="radiko.jp",
+        station_id="TBS",
+        id=f"TBS-{index}",
+        name="JUNK",
+        episode_id=index,
+        episode_name=datetime.strftime("%Y/%m/%d %H:%M"),
+        description="description " * random.randint(10, 50),
+        information="information " * random.randint(10, 200),
+        performers=[f"person{random.randint(0, 100)}" for _ in range(3)],
+        guests=[f"guest{random.randint(0, 1000)}" for _ in range(2)],
+        copyright="copyright",
+        image_url="https://example.com/image.png",
+        url="https://example.com/",
+        datetime=datetime,
+        duration=7200,
+        is_video=False,
+        raw_data=dict(html="<html>" + "x" * random.randint(1000, 5000) + "</html>"),
+    )
+
+
+def read_fields(programs: List[Any]) -> None:
+    # read fields like `PodcastItem.from_program` does
+    for program in programs:
+        for key in PROGRAM_FIELDS:
+            getattr(program, key)
+
+
+def measure(name: str, fn: Callable[[], List[Any]]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    programs = fn()
+    read_fields(programs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<24} {elapsed:8.3f} [s] {peak / 1024**2:8.1f} [MiB]")
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    documents = [create_document(i) for i in range(args.num_programs)]
+    projected = [
+        {key: doc[key] for key in ["_id"] + PROGRAM_FIELDS if key in doc}
+        for doc in documents
+    ]
+
+    print(f"{args.num_programs} programs")
+    measure("Program.from_dict", lambda: [Program.from_dict(x) for x in documents])
+    measure("ProgramView (projected)", lambda: [ProgramView(x) for x in projected])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Compares results of `run_benchmarks.py` with a baseline and flags regressions.
+
+Exits with status 1 if the time or peak memory of any stage grows more than the
+threshold from the baseline.
+
+Examples:
+    $ python benchmarks/compare_benchmarks.py baseline.json benchmark.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from tabulate import tabulate
+
+METRICS = ["seconds", "peak_mib"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline", type=Path, help="Baseline JSON path")
+    parser.add_argument("current", type=Path, help="Current JSON path")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed ratio of growth from the baseline, e.g. 0.2 for +20%%",
+    )
+    return parser.parse_args()
+
+
+def load_results(path: Path) -> Dict[str, Dict[str, Any]]:
+    report = json.loads(path.read_text())
+    return report["results"]
+
+
+def _ratio(baseline: Optional[float], current: Optional[float]) -> Optional[float]:
+    if baseline is None or current is None or baseline <= 0:
+        return None
+    return current / baseline - 1.0
+
+
+def compare(
+    baseline: Dict[str, Dict[str, Any]],
+    current: Dict[str, Dict[str, Any]],
+    threshold: float,
+) -> List[Dict[str, Any]]:
+    """Compares metrics of stages in both results.
+
+    Returns:
+        list of dict: Rows of stages and metrics with `regression` flags.
+    """
+    ret = []
+    for stage in current:
+        if stage not in baseline:
+            continue
+        for metric in METRICS:
+            ratio = _ratio(baseline[stage].get(metric), current[stage].get(metric))
+            if ratio is None:
+                continue
+            ret.append(
+                dict(
+                    stage=stage,
+                    metric=metric,
+                    baseline=baseline[stage][metric],
+                    current=current[stage][metric],
+                    change=f"{ratio:+.1%}",
+                    regression=ratio > threshold,
+                )
+            )
+    return ret
+
+
+def main():
+    args = parse_args()
+    baseline = load_results(args.baseline)
+    current = load_results(args.current)
+    rows = compare(baseline, current, args.threshold)
+    print(tabulate(rows, headers="keys", floatfmt=".3f"))
+
+    regressions = [row for row in rows if row["regression"]]
+    for row in regressions:
+        print(f"regression: {row['stage']} {row['metric']} {row['change']}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Load-tests `jadio-feeder serve` with synthetic programs on a stand-in database.
+
+`FeedServer` is started on a local port with MongoDB replaced by an in-memory
+mongomock client, and feeds of random configs are requested concurrently in
+three phases: cold requests rendering every feed, warm requests hitting the
+cache, and conditional requests answered by `304 Not Modified`.
+
+Examples:
+    $ python benchmarks/load_test_server.py --num-programs 20000 --num-configs 200 \\
+        --requests 5000 --concurrency 16 --gzip
+"""
+import argparse
+import datetime as dt
+import random
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from stand_in import stand_in_databases
+from synthetic import create_configs, create_media_tree, create_programs
+
+from jadio_feeder.config import Config
+from jadio_feeder.feeder import Feeder
+from jadio_feeder.server import FeedCache, FeedServer
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num-programs", type=int, default=5000, help="Number of programs"
+    )
+    parser.add_argument("--num-configs", type=int, default=50, help="Number of configs")
+    parser.add_argument(
+        "--num-series", type=int, default=200, help="Number of program series"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=1000, help="Number of warm requests"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Number of concurrent clients"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=64, help="Memory cache size in MiB"
+    )
+    parser.add_argument("--gzip", action="store_true", help="Accept gzip responses")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def request(url: str, headers: Dict[str, str]) -> tuple:
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(
+            urllib.request.Request(url, headers=headers)
+        ) as res:
+            status, etag = res.status, res.headers.get("ETag")
+            res.read()
+    except urllib.error.HTTPError as err:
+        status, etag = err.code, err.headers.get("ETag")
+    return time.perf_counter() - start, status, etag
+
+
+def run_phase(
+    name: str,
+    urls: List[str],
+    concurrency: int,
+    headers: Dict[str, str],
+    etags: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    def fetch(url: str) -> tuple:
+        phase_headers = dict(headers)
+        if etags is not None and url in etags:
+            phase_headers["If-None-Match"] = etags[url]
+        return url, request(url, phase_headers)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fetch, urls))
+    seconds = time.perf_counter() - start
+
+    latencies = sorted(result[0] for _, result in results)
+    statuses = {}
+    for _, (_, status, _) in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    p50 = statistics.median(latencies) * 1e3
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1e3
+    print(
+        f"{name:<12} {len(urls):6d} requests {len(urls) / seconds:9.1f} [req/s] "
+        f"p50 {p50:7.2f} [ms] p95 {p95:7.2f} [ms] status {statuses}"
+    )
+    return {url: etag for url, (_, _, etag) in results if etag}
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    programs = create_programs(args.num_programs, args.num_series)
+    configs = [
+        Config.from_dict(config).to_dict(
+            serialize=True, unserialized_types=[dt.datetime]
+        )
+        for config in create_configs(args.num_configs, args.num_series)
+    ]
+    headers = {"Accept-Encoding": "gzip"} if args.gzip else {}
+
+    with tempfile.TemporaryDirectory() as temp_dir, stand_in_databases():
+        work_dir = Path(temp_dir)
+        media_root = work_dir / "media"
+        create_media_tree(media_root, programs)
+        with Feeder(rss_feed_root=work_dir / "rss", media_root=media_root) as feeder:
+            feeder.recorder_db.recorded_programs.insert_many(programs)
+            config_ids = feeder.feeder_db.configs.insert_many(configs).inserted_ids
+            feeder.update_search_index()
+
+            cache = FeedCache(
+                max_bytes=args.cache_size * 1024 * 1024, cache_dir=work_dir / "cache"
+            )
+            server = FeedServer(feeder, cache).create_server("127.0.0.1", 0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            host, port = server.server_address
+            urls = [
+                f"http://{host}:{port}/rss/{config_id}.xml" for config_id in config_ids
+            ]
+
+            etags = run_phase("cold", urls, args.concurrency, headers)
+            warm_urls = random.choices(urls, k=args.requests)
+            run_phase("warm", warm_urls, args.concurrency, headers)
+            run_phase("conditional", warm_urls, args.concurrency, headers, etags)
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Benchmarks stages of building RSS feeds with synthetic programs and media files.
+
+MongoDB is replaced by an in-memory mongomock client, so the absolute time of
+queries differs from a real server, but it is comparable between runs. Results
+are written to JSON to be compared with a baseline by `compare_benchmarks.py`.
+
+Examples:
+    $ python benchmarks/run_benchmarks.py --num-programs 100000 --num-configs 2000 \\
+        --output baseline.json
+"""
+import argparse
+import datetime as dt
+import gc
+import io
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from stand_in import stand_in_databases
+from synthetic import create_configs, create_media_tree, create_programs
+
+from jadio_feeder.config import Config
+from jadio_feeder.feeder import Feeder
+from jadio_feeder.media import MediaProbeCache
+from jadio_feeder.podcast import PodcastItem, PodcastRssFeedGenCreator
+from jadio_feeder.program import PROGRAM_FIELDS, ProgramView
+from jadio_feeder.stream import PodcastRssStreamWriter
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num-programs", type=int, default=10000, help="Number of programs"
+    )
+    parser.add_argument(
+        "--num-configs", type=int, default=200, help="Number of configs"
+    )
+    parser.add_argument(
+        "--num-series", type=int, default=500, help="Number of program series"
+    )
+    parser.add_argument(
+        "--num-query-configs",
+        type=int,
+        default=100,
+        help="Number of configs whose queries are timed",
+    )
+    parser.add_argument(
+        "--feed-size", type=int, default=2000, help="Number of programs in a feed"
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        default=None,
+        help="Directory of media files and RSS feeds. A temporary one if not given",
+    )
+    parser.add_argument(
+        "--output", type=Path, default="benchmark.json", help="Output JSON path"
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip the second run of each stage to trace peak memory",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def measure(name: str, fn: Callable[[], int], memory: bool = True) -> Dict[str, Any]:
+    """Times `fn` returning the number of processed items, and traces its peak
+    memory by another run since tracemalloc slows it down."""
+    gc.collect()
+    start = time.perf_counter()
+    num_items = fn()
+    seconds = time.perf_counter() - start
+
+    ret = dict(seconds=seconds, items=num_items)
+    if num_items:
+        ret["us_per_item"] = seconds / num_items * 1e6
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        ret["peak_mib"] = peak / 1024**2
+    peak_mib = f"{ret['peak_mib']:8.1f} [MiB]" if memory else ""
+    print(f"{name:<32} {seconds:9.3f} [s] {num_items:8d} items {peak_mib}")
+    return ret
+
+
+def run(args: argparse.Namespace, work_dir: Path) -> Dict[str, Any]:
+    random.seed(args.seed)
+    programs = create_programs(args.num_programs, args.num_series)
+    configs = [
+        Config.from_dict(config).to_dict(
+            serialize=True, unserialized_types=[dt.datetime]
+        )
+        for config in create_configs(args.num_configs, args.num_series)
+    ]
+    media_root = work_dir / "media"
+    rss_root = work_dir / "rss"
+    create_media_tree(media_root, programs)
+
+    memory = not args.no_memory
+    results = {}
+    with stand_in_databases():
+        feeder = Feeder(rss_feed_root=rss_root, media_root=media_root)
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        feeder.feeder_db.configs.insert_many(configs)
+        feeder.update_search_index()
+        collection = feeder.recorder_db.recorded_programs
+
+        def execute_queries() -> int:
+            ret = 0
+            for config in configs[: args.num_query_configs]:
+                query = Config.from_dict(dict(config)).query
+                ret += len(list(collection.find(feeder._to_mongo_query(query), [])))
+            return ret
+
+        results["query"] = measure("query", execute_queries, memory)
+
+        documents = list(
+            collection.find({}, PROGRAM_FIELDS, sort=[("_id", 1)]).limit(args.feed_size)
+        )
+        pairs = [(ProgramView(document), document["_id"]) for document in documents]
+
+        def from_program(media_cache: Optional[MediaProbeCache] = None) -> int:
+            for program, program_id in pairs:
+                PodcastItem.from_program(
+                    program, program_id, "http://localhost", media_root, media_cache
+                )
+            return len(pairs)
+
+        results["from_program"] = measure("from_program", from_program, memory)
+        feeder.warm_media_cache()
+        results["from_program_cached"] = measure(
+            "from_program_cached",
+            lambda: from_program(feeder._media_cache),
+            memory,
+        )
+
+        creator = PodcastRssFeedGenCreator(
+            "http://localhost", media_root, media_cache=feeder._media_cache
+        )
+        results["create"] = measure(
+            "create", lambda: len(creator.create(pairs).entry()), memory
+        )
+        feed_generator = creator.create(pairs)
+
+        def render_feedgen() -> int:
+            feed_generator.rss_str(pretty=True)
+            return len(feed_generator.entry())
+
+        results["render_feedgen"] = measure("render_feedgen", render_feedgen, memory)
+
+        # items are built while rendering by the stream writer
+        writer = PodcastRssStreamWriter(
+            "http://localhost", media_root, media_cache=feeder._media_cache
+        )
+        channel = Config.from_dict(dict(configs[0])).channel
+        results["render_stream"] = measure(
+            "render_stream",
+            lambda: writer.write(io.BytesIO(), pairs, channel),
+            memory,
+        )
+        feeder.close()
+
+        for backend, engine in [("feedgen", "mongo"), ("stream", "snapshot")]:
+            name = f"update_feeds[{backend},{engine}]"
+            with Feeder(
+                rss_feed_root=rss_root, media_root=media_root, backend=backend
+            ) as feeder:
+
+                def update_feeds() -> int:
+                    feeder.update_feeds(force_update=True, engine=engine)
+                    return len(configs)
+
+                results[name] = measure(name, update_feeds, memory)
+    return results
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or Path(temp_dir)
+        results = run(args, work_dir)
+
+    report = dict(
+        meta=dict(
+            created_at=dt.datetime.now().isoformat(),
+            python=sys.version,
+            platform=platform.platform(),
+            args={
+                key: value
+                for key, value in vars(args).items()
+                if key not in ["work_dir", "output"]
+            },
+        ),
+        results=results,
+    )
+    args.output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"save results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""In-memory stand-in of MongoDB clients by mongomock."""
+import contextlib
+from typing import Iterator, Optional
+from unittest import mock
+
+import mongomock
+
+
+@contextlib.contextmanager
+def stand_in_databases(
+    client: Optional[mongomock.MongoClient] = None,
+) -> Iterator[mongomock.MongoClient]:
+    """Makes `Feeder` use one in-memory mongomock client for both databases.
+
+    Examples:
+        >>> with stand_in_databases() as client:
+        ...     with Feeder(...) as feeder:
+        ...         feeder.update_feeds()
+    """
+    client = client or mongomock.MongoClient()
+    with mock.patch(
+        "jadio_feeder.connection.create_client", lambda host, options: client
+    ):
+        yield client
@@ -0,0 +1,139 @@
+"""Generators of synthetic recorded programs, configs and dummy media trees."""
+import datetime as dt
+import random
+import struct
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bson import ObjectId
+
+STATIONS = {
+    "radiko.jp": ["TBS", "LFR", "QRR", "FMT", "INT", "JORF", "BAYFM78", "NACK5"],
+    "onsen.ag": ["onsen"],
+    "hibiki-radio.jp": ["hibiki"],
+}
+WORDS = [
+    "JUNK",
+    "オールナイトニッポン",
+    "ｱﾆﾒ",
+    "ラジオ",
+    "深夜",
+    "スペシャル",
+    "ニュース",
+    "音楽",
+    "声優",
+    "ゲーム",
+]
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo without padding
+MP3_FRAME_HEADER = b"\xff\xfb\x90\x00"
+MP3_FRAME_SIZE = 417
+
+
+def create_program(index: int, num_series: int) -> Dict[str, Any]:
+    series = index % num_series
+    platform_id = list(STATIONS)[series % len(STATIONS)]
+    stations = STATIONS[platform_id]
+    station_id = stations[series % len(stations)]
+    datetime = dt.datetime(2020, 1, 1) + dt.timedelta(minutes=30 * index)
+    words = random.sample(WORDS, 2)
+    is_radiko = platform_id == "radiko.jp"
+    return dict(
+        _id=ObjectId(f"{index:024x}"),
+        platform_id=platform_id,
+        station_id=station_id,
+        id=f"{station_id}-{index}",
+        name=f"{words[0]} series{series}",
+        # unique per series, so that consecutive programs in a feed of many series
+        # are not removed as duplicates
+        episode_id=f"{series}-{index // num_series}",
+        episode_name=f"{words[1]} #{index // num_series}",
+        description="description " * random.randint(5, 20),
+        information="information " * random.randint(5, 50),
+        performers=[f"person{random.randint(0, num_series)}" for _ in range(2)],
+        guests=[f"guest{random.randint(0, 10 * num_series)}"],
+        copyright="copyright",
+        image_url="https://example.com/image.png",
+        url="https://example.com/",
+        datetime=datetime,
+        # durations of onsen.ag and hibiki-radio.jp are probed from media files
+        duration=1800 if is_radiko else None,
+        is_video=not is_radiko and index % 3 == 0,
+        raw_data=dict(html="<html>" + "x" * random.randint(500, 2000) + "</html>"),
+    )
+
+
+def create_programs(num_programs: int, num_series: int) -> List[Dict[str, Any]]:
+    return [create_program(i, num_series) for i in range(num_programs)]
+
+
+def create_config(index: int, num_series: int) -> Dict[str, Any]:
+    """Creates configs of stations, series, persons and words in turn."""
+    kind = index % 4
+    platform_id = list(STATIONS)[index % len(STATIONS)]
+    if kind == 0:
+        query = dict(station_ids=[random.choice(STATIONS[platform_id])])
+    elif kind == 1:
+        query = dict(
+            platform_ids=[platform_id],
+            words=[f"series{random.randint(0, num_series - 1)}$"],
+        )
+    elif kind == 2:
+        query = dict(persons=[f"person{random.randint(0, num_series)}"])
+    else:
+        query = dict(words=random.sample(WORDS, 2))
+    return dict(
+        query=query,
+        channel=dict(title=f"config{index}", description=f"config{index}"),
+        max_items=100 if index % 8 == 0 else None,
+    )
+
+
+def create_configs(num_configs: int, num_series: int) -> List[Dict[str, Any]]:
+    return [create_config(i, num_series) for i in range(num_configs)]
+
+
+def write_mp3(path: Path, duration: float) -> None:
+    """Writes a sparse MP3 of a few frames whose size implies the duration."""
+    frame = MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    with path.open("wb") as f:
+        f.write(frame * 8)
+        f.truncate(int(duration * 128000 / 8))
+
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+def write_mp4(path: Path, duration: float, mdat_size: int = 1 << 20) -> None:
+    """Writes a sparse MP4 of `ftyp`, `moov.mvhd` and an empty `mdat`."""
+    timescale = 1000
+    mvhd = (
+        bytes(4)  # version and flags
+        + struct.pack(">IIII", 0, 0, timescale, int(duration * timescale))
+        + struct.pack(">IH", 0x00010000, 0x0100)  # rate and volume
+        + bytes(10)
+        + struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+        + bytes(24)
+        + struct.pack(">I", 2)  # next track id
+    )
+    ftyp = _box(b"ftyp", b"M4A " + bytes(4) + b"M4A isommp42")
+    header = ftyp + _box(b"moov", _box(b"mvhd", mvhd))
+    with path.open("wb") as f:
+        f.write(header + struct.pack(">I", 8 + mdat_size) + b"mdat")
+        f.truncate(len(header) + 8 + mdat_size)
+
+
+def create_media_tree(
+    media_root: Path, programs: List[Dict[str, Any]], duration: float = 1800.0
+) -> None:
+    """Creates `<media-root>/<platform_id>/<station_id>/<_id>/media.*`."""
+    for program in programs:
+        media_dir = media_root.joinpath(
+            program["platform_id"], program["station_id"], str(program["_id"])
+        )
+        media_dir.mkdir(parents=True, exist_ok=True)
+        if program["platform_id"] == "radiko.jp":
+            write_mp3(media_dir.joinpath("media.mp3"), duration)
+        else:
+            write_mp4(media_dir.joinpath("media.mp4"), duration)
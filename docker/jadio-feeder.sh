@@ -1,7 +1,8 @@
 #!/bin/bash
 
-jadio-feeder update-feeds \
+exec jadio-feeder serve-scheduler \
     --base-url="${BASE_URL}" \
     --rss-root=/data/rss \
     --media-root=/data/media \
+    --gzip \
     --database-host="${MONGO_HOST}"
@@ -60,12 +60,13 @@ def main():
         # extract all channel-ids (station-ids) for grouping
         channel_ids = set(program["station_id"] for program in programs)
 
+        configs = []
         for channel_id in channel_ids:
             # fetch target channel's programs
             query = Query(platform_ids=[platform_id], station_ids=[channel_id])
             programs = find_recorded_programs(query)
             if len(programs) == 0:
-                return
+                continue
 
             # create Podcast channel information
             programs = list(sorted(programs, key=lambda x: x["episode_id"]))
@@ -76,8 +77,10 @@ def main():
                 cat="Leisure", sub="Animation &amp; Manga"
             )
 
-            # register config for creating RSS feed
-            feeder.register_config(Config(query, channel))
+            configs.append(Config(query, channel))
+
+        # register configs for creating RSS feeds at once
+        feeder.register_configs(configs)
 
 
 if __name__ == "__main__":
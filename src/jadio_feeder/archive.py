@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+from bson import ObjectId
+
+
+def archive_page_name(number: int) -> str:
+    return f"archive-{number}.xml"
+
+
+@dataclass
+class ArchivePage:
+    """Archive page of a paged RSS feed (RFC 5005).
+
+    Pages are numbered from the oldest, and each page holds `page_size` programs
+    when it is completed. Programs of completed pages are stored, so that a page
+    never changes once it is complete, even if its programs are removed or older
+    programs are recorded later, except for its `next-archive` link added when
+    the next page is completed.
+
+    Attributes:
+        number (int): Page number starting from 1 for the oldest programs.
+        program_ids (list of `ObjectId`): Ids of programs from the oldest.
+        has_prev (bool): Whether the older page exists.
+        has_next (bool): Whether the newer page exists.
+    """
+
+    number: int
+    program_ids: List[ObjectId]
+    has_prev: bool = False
+    has_next: bool = False
+
+    @property
+    def name(self) -> str:
+        return archive_page_name(self.number)
+
+    @property
+    def prev_name(self) -> Optional[str]:
+        return archive_page_name(self.number - 1) if self.has_prev else None
+
+    @property
+    def next_name(self) -> Optional[str]:
+        return archive_page_name(self.number + 1) if self.has_next else None
+
+    def to_key(self, salt: Any = None) -> str:
+        """Returns a hash of the page content to detect pages to be rewritten.
+
+        Args:
+            salt (any): JSON serializable values affecting the content other than
+                programs, e.g. the config hash and rendering options.
+        """
+        data = dict(
+            program_ids=[str(program_id) for program_id in self.program_ids],
+            has_prev=self.has_prev,
+            has_next=self.has_next,
+            salt=salt,
+        )
+        data = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def paginate(
+    program_ids: List[ObjectId],
+    page_size: int,
+    completed: Sequence[List[ObjectId]] = (),
+) -> List[ArchivePage]:
+    """Splits programs from the oldest into complete archive pages.
+
+    Programs not in `completed` pages are appended to new pages in the given
+    order, and programs not filling the last page are left to the head feed.
+
+    Args:
+        completed (list of list of `ObjectId`): Program ids of pages completed
+            before, which are kept as they are.
+    """
+    if page_size <= 0:
+        raise ValueError(f"page_size must be positive: {page_size}")
+    archived = {program_id for page in completed for program_id in page}
+    remaining = [program_id for program_id in program_ids if program_id not in archived]
+    page_ids = list(completed) + [
+        remaining[i * page_size : (i + 1) * page_size]
+        for i in range(len(remaining) // page_size)
+    ]
+    return [
+        ArchivePage(
+            number=i + 1,
+            program_ids=list(ids),
+            has_prev=i > 0,
+            has_next=i + 1 < len(page_ids),
+        )
+        for i, ids in enumerate(page_ids)
+    ]
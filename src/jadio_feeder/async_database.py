@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Optional
+
+try:
+    import motor.motor_asyncio
+except ImportError as err:
+    raise ImportError(
+        "motor is required by AsyncFeeder. Please install jadio-feeder[async]"
+    ) from err
+
+from .database import FeederDatabase
+
+
+class AsyncFeederDatabase(FeederDatabase):
+    """`FeederDatabase` on motor, whose collections are awaited."""
+
+    def __init__(self, host: Optional[str] = None) -> None:
+        host = host or "mongodb://localhost:27017/"
+        self._client = motor.motor_asyncio.AsyncIOMotorClient(host)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class AsyncRecorderDatabase:
+    """Read-only counterpart of `jadio_recorder.RecorderDatabase` on motor."""
+
+    def __init__(self, host: Optional[str] = None) -> None:
+        host = host or "mongodb://localhost:27017/"
+        self._client = motor.motor_asyncio.AsyncIOMotorClient(host)
+
+    def close(self) -> None:
+        self._client.close()
+
+    @property
+    def recorded_programs(self) -> motor.motor_asyncio.AsyncIOMotorCollection:
+        database = self._client.get_database("recorder")
+        return database.get_collection("recorded_programs")
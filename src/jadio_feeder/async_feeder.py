@@ -0,0 +1,586 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+from logging import getLogger
+from pathlib import Path
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import pymongo
+from bson import ObjectId
+
+from .async_database import AsyncFeederDatabase, AsyncRecorderDatabase
+from .config import Config, Query
+from .feeder import UpdateResult, _BaseFeeder, _summary_pipeline, _to_summary
+from .media import AsyncMediaProbeCache
+from .output import write_manifest
+from .pipeline import is_pipeline_unsupported, to_feed_pipeline
+from .podcast import PodcastChannel, _datetime_to_pub_data, _resolve_sort_by
+from .program import PROGRAM_FIELDS, ProgramView
+from .search import AsyncSearchIndex
+
+logger = getLogger(__name__)
+
+WriteFeed = Callable[[BinaryIO], int]
+
+
+class AsyncFeeder(_BaseFeeder):
+    """Asyncio counterpart of `Feeder` on motor.
+
+    Queries are awaited on motor, and rendering, which stats and probes media
+    files by mutagen and writes feeds, is offloaded to threads. Feeds are
+    rendered from the same programs by the same code as `Feeder`, so their
+    outputs are identical. Unlike the "stream" backend of `Feeder`, programs of
+    a feed are fetched into memory before rendering.
+
+    Examples:
+        >>> async with AsyncFeeder(rss_feed_root="rss", media_root="media") as feeder:
+        ...     await feeder.update_feeds()
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost",
+        rss_feed_root: Union[str, Path] = ".",
+        media_root: Union[str, Path] = ".",
+        feeder_database_host: Optional[str] = None,
+        recorder_database_host: Optional[str] = None,
+        backend: str = "feedgen",
+        sidecars: Sequence[str] = (),
+        use_search_index: bool = True,
+        concurrency: int = 8,
+    ) -> None:
+        """
+        Args:
+            concurrency (int): Max number of feeds built concurrently by
+                `AsyncFeeder.update_feeds`.
+
+        See `Feeder` for the other args.
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be positive: {concurrency}")
+        super().__init__(
+            base_url=base_url,
+            rss_feed_root=rss_feed_root,
+            media_root=media_root,
+            backend=backend,
+            sidecars=sidecars,
+            use_search_index=use_search_index,
+        )
+        self._concurrency = concurrency
+
+        self._feeder_database = AsyncFeederDatabase(feeder_database_host)
+        self._recorder_database = AsyncRecorderDatabase(recorder_database_host)
+        self._media_cache = AsyncMediaProbeCache(self._feeder_database.media_probes)
+        self._search_index = AsyncSearchIndex(self._feeder_database.search_index)
+
+    @property
+    def feeder_db(self) -> AsyncFeederDatabase:
+        return self._feeder_database
+
+    @property
+    def recorder_db(self) -> AsyncRecorderDatabase:
+        return self._recorder_database
+
+    async def __aenter__(self) -> AsyncFeeder:
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self._media_cache.flush()
+        self.feeder_db.close()
+        self.recorder_db.close()
+
+    async def update_search_index(self, rebuild: bool = False) -> int:
+        """Indexes recorded programs for search incrementally.
+
+        Returns:
+            int: Number of indexed programs.
+        """
+        return await self._search_index.update(
+            self.recorder_db.recorded_programs, rebuild=rebuild
+        )
+
+    async def _to_mongo_query(self, query: Query) -> Dict[str, Any]:
+        words_condition = None
+        if self._use_search_index and query.words:
+            await self._search_index.prefetch(query.words)
+            words_condition = self._search_index.to_words_condition(query.words)
+        return query.to_mongo_format(words_condition=words_condition)
+
+    async def _find_programs_summary(self, config: Config) -> Dict[str, Any]:
+        pipeline = _summary_pipeline(await self._to_mongo_query(config.query))
+        cursor = self.recorder_db.recorded_programs.aggregate(pipeline)
+        summaries = await cursor.to_list(None)
+        return _to_summary(summaries[0] if summaries else None)
+
+    async def _resolve_sort_by(self, config: Config, query: Dict[str, Any]) -> str:
+        if config.sort_by is not None:
+            return _resolve_sort_by(config.sort_by, [], None)
+        collection = self.recorder_db.recorded_programs
+        platform_ids = await collection.distinct("platform_id", query)
+        station_ids = await collection.distinct("station_id", query)
+        return _resolve_sort_by(
+            None, station_ids, platform_ids[0] if platform_ids else None
+        )
+
+    async def _aggregate_programs(
+        self,
+        query: Dict[str, Any],
+        sort_by: str,
+        descending: bool,
+        remove_duplicates: bool,
+        limit: Optional[int] = None,
+        limit_latest: bool = False,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """See `Feeder._aggregate_programs`."""
+        if not self._use_pipeline:
+            return None
+        pipeline = to_feed_pipeline(
+            query,
+            sort_by,
+            descending,
+            remove_duplicates,
+            limit=limit,
+            limit_latest=limit_latest,
+        )
+        try:
+            cursor = self.recorder_db.recorded_programs.aggregate(
+                pipeline, allowDiskUse=True
+            )
+            return await cursor.to_list(None)
+        except Exception as err:
+            if not is_pipeline_unsupported(err):
+                raise
+            self._disable_pipeline(err)
+            return None
+
+    async def _find_latest_pairs(
+        self, config: Config, query: Dict[str, Any], sort_by: str, max_items: int
+    ) -> List[Tuple[ProgramView, ObjectId]]:
+        """See `Feeder._find_latest_pairs`."""
+        programs = await self._aggregate_programs(
+            query,
+            sort_by,
+            not config.from_oldest,
+            config.remove_duplicates,
+            limit=max_items,
+            limit_latest=True,
+        )
+        if programs is not None:
+            ret = list(self._to_pairs(programs))
+            return ret[::-1] if config.from_oldest else ret
+
+        collection = self.recorder_db.recorded_programs
+        limit = max_items
+        while True:
+            cursor = collection.find(
+                query,
+                PROGRAM_FIELDS,
+                sort=self._latest_sort(config, sort_by),
+                limit=limit,
+                allow_disk_use=True,
+            )
+            programs = await cursor.to_list(None)
+            ret = self._to_latest_pairs(config, programs, limit, max_items)
+            if ret is not None:
+                return ret
+            limit *= 2
+
+    async def _find_latest_program(
+        self, query: Dict[str, Any], sort_by: str
+    ) -> Optional[ProgramView]:
+        program = await self.recorder_db.recorded_programs.find_one(
+            query,
+            PROGRAM_FIELDS,
+            sort=[(sort_by, pymongo.DESCENDING), ("_id", pymongo.DESCENDING)],
+        )
+        return ProgramView(program) if program else None
+
+    async def _find_programs_by_ids(
+        self, program_ids: List[ObjectId]
+    ) -> Dict[ObjectId, Dict[str, Any]]:
+        cursor = self.recorder_db.recorded_programs.find(
+            {"_id": {"$in": program_ids}}, PROGRAM_FIELDS
+        )
+        return {program["_id"]: program async for program in cursor}
+
+    async def _load_media_probes(
+        self, program_and_id_pairs: Iterable[Tuple[ProgramView, ObjectId]]
+    ) -> None:
+        """Fetches media probes of the programs before rendering them in a thread."""
+        await self._media_cache.load_programs(program_and_id_pairs, self._media_index)
+
+    async def _prepare_feed_feedgen(
+        self,
+        config: Config,
+        query: Dict[str, Any],
+        pretty: bool,
+        last_build_date: str,
+    ) -> WriteFeed:
+        sort_by = config.sort_by
+        remove_duplicates = config.remove_duplicates
+        programs = None
+        if config.max_items:
+            sort_by = await self._resolve_sort_by(config, query)
+            program_and_id_pairs = await self._find_latest_pairs(
+                config, query, sort_by, config.max_items
+            )
+        elif self._use_pipeline:
+            programs = await self._aggregate_programs(
+                query,
+                await self._resolve_sort_by(config, query),
+                not config.from_oldest,
+                remove_duplicates,
+            )
+        if programs is not None:
+            program_and_id_pairs = list(self._to_pairs(programs))
+        elif not config.max_items:
+            cursor = self.recorder_db.recorded_programs.find(query, PROGRAM_FIELDS)
+            program_and_id_pairs = [
+                (ProgramView(program), program["_id"]) async for program in cursor
+            ]
+            await self._load_media_probes(program_and_id_pairs)
+            return lambda f: self._render_feedgen(
+                f,
+                config,
+                program_and_id_pairs,
+                sort_by,
+                remove_duplicates,
+                pretty,
+                last_build_date,
+            )
+        await self._load_media_probes(program_and_id_pairs)
+        # programs are already sorted and deduplicated
+        return lambda f: self._render_feedgen(
+            f,
+            config,
+            program_and_id_pairs,
+            sort_by,
+            False,
+            pretty,
+            last_build_date,
+            presorted=True,
+        )
+
+    async def _prepare_feed_stream(
+        self,
+        config: Config,
+        query: Dict[str, Any],
+        pretty: bool,
+        last_build_date: str,
+    ) -> WriteFeed:
+        sort_by = await self._resolve_sort_by(config, query)
+        programs = None
+        presorted = False
+        if config.max_items:
+            latest_pairs = await self._find_latest_pairs(
+                config, query, sort_by, config.max_items
+            )
+        else:
+            programs = await self._aggregate_programs(
+                query, sort_by, not config.from_oldest, config.remove_duplicates
+            )
+            presorted = programs is not None
+        if not config.max_items and not presorted:
+            # sort programs in the same order as `PodcastRssFeedGenCreator.create`
+            direction = pymongo.ASCENDING if config.from_oldest else pymongo.DESCENDING
+            cursor = self.recorder_db.recorded_programs.find(
+                query,
+                PROGRAM_FIELDS,
+                sort=[(sort_by, direction), ("_id", pymongo.ASCENDING)],
+                allow_disk_use=True,
+            )
+            programs = await cursor.to_list(None)
+        if programs is None:
+            await self._load_media_probes(latest_pairs)
+        else:
+            await self._load_media_probes(self._to_pairs(programs))
+        latest_program = None
+        if not config.channel and config.from_oldest:
+            latest_program = await self._find_latest_program(query, sort_by)
+
+        def write_feed(f: BinaryIO) -> int:
+            if programs is None:
+                program_and_id_pairs = iter(latest_pairs)
+            elif presorted:
+                program_and_id_pairs = self._to_pairs(programs)
+            else:
+                program_and_id_pairs = self._to_sorted_pairs(config, programs)
+            return self._render_stream_feed(
+                f,
+                config,
+                program_and_id_pairs,
+                lambda: latest_program,
+                pretty,
+                last_build_date,
+            )
+
+        return write_feed
+
+    async def _prepare_feed_paged(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        query: Dict[str, Any],
+        pretty: bool,
+        last_build_date: str,
+    ) -> Tuple[WriteFeed, Optional[Dict[str, Any]]]:
+        """Fetches programs of the head feed and changed archive pages.
+
+        Returns:
+            tuple: Function writing archive pages and the head feed, and the state
+                of archive pages to be stored, if any programs are found.
+        """
+        collection = self.recorder_db.recorded_programs
+        sort_by = await self._resolve_sort_by(config, query)
+        direction = pymongo.ASCENDING if config.from_oldest else pymongo.DESCENDING
+        cursor = collection.find(
+            query,
+            list({sort_by, "datetime", "episode_id"}),
+            sort=[(sort_by, direction), ("_id", pymongo.ASCENDING)],
+            allow_disk_use=True,
+        )
+        datetimes = self._to_datetimes(config, await cursor.to_list(None))
+        if not datetimes:
+
+            def remove_archive_pages(f: BinaryIO) -> int:
+                self._remove_archive_pages(config_id)
+                return 0
+
+            return remove_archive_pages, None
+        # from the oldest
+        program_ids = list(datetimes)
+        if not config.from_oldest:
+            program_ids.reverse()
+
+        channel = config.channel
+        if not channel:
+            channel = PodcastChannel.from_program(
+                ProgramView(
+                    await collection.find_one({"_id": program_ids[-1]}, PROGRAM_FIELDS)
+                )
+            )
+
+        state = await self.feeder_db.feeds.find_one({"_id": config_id}, ["archive"])
+        pages, archive_state, changed_pages = await asyncio.to_thread(
+            self._plan_archive_pages,
+            config,
+            config_id,
+            program_ids,
+            (state or {}).get("archive", {}),
+            pretty,
+        )
+        head_program_ids, links = self._plan_head_feed(
+            config, config_id, program_ids, pages
+        )
+        fetched_ids = set(head_program_ids)
+        for page in changed_pages:
+            fetched_ids.update(page.program_ids)
+        programs = await self._find_programs_by_ids(sorted(fetched_ids))
+        await self._load_media_probes(
+            (ProgramView(program), program_id)
+            for program_id, program in programs.items()
+        )
+
+        def write_feed(f: BinaryIO) -> int:
+            for page in changed_pages:
+                self._write_archive_page(
+                    config, config_id, channel, page, datetimes, programs, pretty
+                )
+            self._remove_archive_pages(config_id, len(pages))
+            return self._render_programs(
+                f,
+                config,
+                channel,
+                head_program_ids,
+                programs,
+                pretty,
+                last_build_date,
+                links,
+            )
+
+        return write_feed, archive_state
+
+    async def update_feed(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        pretty: bool = True,
+        program_ids: Optional[List[ObjectId]] = None,
+        last_datetime: Optional[dt.datetime] = None,
+    ) -> bool:
+        """Updates RSS feed of the config. See `Feeder.update_feed`.
+
+        Returns:
+            bool: Whether the RSS feed file was changed or not.
+        """
+        logger.debug(f"update RSS feed: {config}")
+        if program_ids is None:
+            query = await self._to_mongo_query(config.query)
+        else:
+            query = {"_id": {"$in": program_ids}}
+        if last_datetime is None:
+            last_datetime = (await self._find_programs_summary(config))["max_datetime"]
+        last_build_date = _datetime_to_pub_data(last_datetime or dt.datetime.min)
+
+        # fetch programs, and render and save RSS feed file in a thread
+        archive_state = None
+        if config.page_size:
+            write_feed, archive_state = await self._prepare_feed_paged(
+                config, config_id, query, pretty, last_build_date
+            )
+        elif self._backend == "stream":
+            write_feed = await self._prepare_feed_stream(
+                config, query, pretty, last_build_date
+            )
+        else:
+            write_feed = await self._prepare_feed_feedgen(
+                config, query, pretty, last_build_date
+            )
+        output = await asyncio.to_thread(self._save_rss_feed, config_id, write_feed)
+
+        feeds = self.feeder_db.feeds
+        if archive_state is not None:
+            await feeds.update_one(
+                {"_id": config_id}, {"$set": {"archive": archive_state}}, upsert=True
+            )
+        archive_root = self._archive_root(config_id)
+        if not config.page_size and await asyncio.to_thread(archive_root.exists):
+            # forget archive pages of the config written before
+            await asyncio.to_thread(self._remove_archive_pages, config_id)
+            await feeds.update_one({"_id": config_id}, {"$unset": {"archive": ""}})
+        if output is None:
+            return False
+
+        changed = output.pop("changed")
+        await feeds.update_one(
+            {"_id": config_id},
+            {"$set": {f"output.{key}": value for key, value in output.items()}},
+            upsert=True,
+        )
+        return changed
+
+    async def update_feed_if_changed(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        pretty: bool = True,
+        force_update: bool = False,
+    ) -> bool:
+        """Updates RSS feed only if its fingerprint differs from the last update.
+
+        See `Feeder.update_feed_if_changed`.
+        """
+        summary = await self._find_programs_summary(config)
+        fingerprint = self._create_fingerprint(config, summary, pretty)
+        state = await self.feeder_db.feeds.find_one({"_id": config_id})
+        if (
+            not force_update
+            and state
+            and state.get("fingerprint") == fingerprint
+            and await asyncio.to_thread(self._rss_feed_path(config_id).exists)
+        ):
+            logger.debug(f"skip updates to unchanged RSS feed: {config_id}")
+            return False
+
+        updated = await self.update_feed(
+            config,
+            config_id,
+            pretty=pretty,
+            last_datetime=summary["max_datetime"],
+        )
+        await self.feeder_db.feeds.update_one(
+            {"_id": config_id},
+            {"$set": {"fingerprint": fingerprint, "updated_at": dt.datetime.now()}},
+            upsert=True,
+        )
+        return updated
+
+    async def _update_feed_from_dict(
+        self,
+        config: Dict[str, Any],
+        pretty: bool = True,
+        force_update: bool = False,
+    ) -> UpdateResult:
+        config = dict(config)
+        config_id = config.pop("_id")
+        try:
+            updated = await self.update_feed_if_changed(
+                Config.from_dict(config),
+                config_id,
+                pretty=pretty,
+                force_update=force_update,
+            )
+            return UpdateResult(config_id, updated=updated)
+        except Exception as err:
+            logger.error(f"error: {err}\n{config}", stack_info=True)
+            return UpdateResult(config_id, error=str(err))
+
+    async def _write_manifest(self) -> None:
+        cursor = self.feeder_db.feeds.find({"output": {"$exists": True}})
+        feeds = self._to_manifest_feeds(await cursor.to_list(None))
+        await asyncio.to_thread(
+            write_manifest, self._rss_feed_root / "manifest.json", feeds
+        )
+
+    async def update_feeds(
+        self, force_update: bool = False, pretty: bool = True
+    ) -> List[Config]:
+        """Updates RSS feeds of all registered configs concurrently.
+
+        At most `concurrency` feeds are built at once, scheduled in the same order
+        as `Feeder.update_feeds`.
+
+        Args:
+            force_update (bool): If True, rebuild feeds even if they are unchanged.
+            pretty (bool): If False, write compact XML without indentation.
+
+        Returns:
+            list of `Config`: Configs whose RSS feeds were updated.
+        """
+        cursor = self.feeder_db.configs.find({})
+        configs = {config["_id"]: config async for config in cursor}
+        if self._use_search_index:
+            await self.update_search_index()
+        await asyncio.to_thread(self._media_index.refresh)
+
+        cursor = self.feeder_db.feeds.find({}, {"fingerprint.num_programs": 1})
+        num_programs = self._to_num_programs(await cursor.to_list(None))
+        ordered_configs = self._order_configs(configs, num_programs)
+
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def update_feed(config: Dict[str, Any]) -> UpdateResult:
+            async with semaphore:
+                return await self._update_feed_from_dict(
+                    config, pretty=pretty, force_update=force_update
+                )
+
+        results = await asyncio.gather(
+            *(update_feed(config) for config in ordered_configs)
+        )
+        ret, errors = self._collect_results(configs, results)
+
+        # probes are written back after all feeds are rendered in threads, and
+        # they are fetched again by the next run
+        await self._media_cache.clear()
+        # forget fingerprints of removed configs
+        await self.feeder_db.feeds.delete_many({"_id": {"$nin": list(configs)}})
+        await self._write_manifest()
+        self._media_index.log_report()
+        logger.info(f"Finish updating {len(ret)} feeds ({len(errors)} error(s))")
+        return ret
@@ -1,18 +1,16 @@
 import argparse
+import importlib
 import logging
-from logging import getLogger
 from pathlib import Path
-from typing import Any, Optional
+from typing import Callable
 
-from tabulate import tabulate
-
-from .config import Config
-from .feeder import Feeder
+# NOTE: only the standard library is imported here so that `--help` and
+# subcommands needing few dependencies start quickly. Handlers are given as
+# "<module>:<function>" of `jadio_feeder.commands` and imported by `main`.
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s: %(message)s"
 )
-logger = getLogger(__file__)
 
 
 def add_argument_common(parser: argparse.ArgumentParser):
@@ -22,19 +20,82 @@ def add_argument_common(parser: argparse.ArgumentParser):
         default="mongodb://localhost:27017/",
         help="MongoDB host",
     )
+    # NOTE: options left None are read from JADIO_FEEDER_MONGO_* environment
+    # variables, see `connection.ConnectionOptions.from_env`
+    group = parser.add_argument_group("MongoDB connection")
+    group.add_argument(
+        "--mongo-max-pool-size",
+        type=int,
+        default=None,
+        help="Maximum number of connections per server (default: 100)",
+    )
+    group.add_argument(
+        "--mongo-min-pool-size",
+        type=int,
+        default=None,
+        help="Number of connections kept open per server (default: 0)",
+    )
+    group.add_argument(
+        "--mongo-server-selection-timeout-ms",
+        type=int,
+        default=None,
+        help="Timeout to find a server for an operation (default: 30000)",
+    )
+    group.add_argument(
+        "--mongo-socket-timeout-ms",
+        type=int,
+        default=None,
+        help="Timeout of each operation (default: none)",
+    )
+    group.add_argument(
+        "--mongo-compressors",
+        type=str,
+        default=None,
+        help="Comma-separated wire compressors in the order of preference, "
+        "e.g. 'zstd,snappy' (requires jadio-feeder[compression])",
+    )
+    group.add_argument(
+        "--mongo-read-preference",
+        type=str,
+        default=None,
+        choices=[
+            "primary",
+            "primaryPreferred",
+            "secondary",
+            "secondaryPreferred",
+            "nearest",
+        ],
+        help="Read preference of queries of recorded programs (default: primary)",
+    )
+    group.add_argument(
+        "--mongo-batch-size",
+        type=int,
+        default=None,
+        help="Number of recorded programs per batch of cursors "
+        "(default: server default)",
+    )
 
 
 def add_argument_register_config(parser: argparse.ArgumentParser):
-    parser.set_defaults(handler=register_config)
+    parser.set_defaults(handler="feeds:register_config")
     parser.add_argument("config", type=Path, help="Input config path (JSON or YAML)")
 
 
+def add_argument_register_configs(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="feeds:register_configs")
+    parser.add_argument(
+        "paths",
+        type=Path,
+        nargs="+",
+        help="Input config paths (JSON or multi-document YAML) or directories",
+    )
+
+
 def add_argument_show_configs(parser: argparse.ArgumentParser):
-    parser.set_defaults(handler=show_configs)
+    parser.set_defaults(handler="configs:show_configs")
 
 
-def add_argument_update_feeds(parser: argparse.ArgumentParser):
-    parser.set_defaults(handler=update_feeds)
+def add_argument_feed_options(parser: argparse.ArgumentParser):
     parser.add_argument(
         "--base-url", type=str, default="http://localhost", help="Base URL of httpd"
     )
@@ -44,18 +105,165 @@ def add_argument_update_feeds(parser: argparse.ArgumentParser):
     parser.add_argument(
         "--media-root", type=Path, default="./media", help="Media root directory"
     )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="feedgen",
+        choices=["feedgen", "stream"],
+        help="Writer of RSS feeds. "
+        "'stream' writes items one by one with constant memory",
+    )
+    parser.add_argument(
+        "--compact", action="store_true", help="Write RSS feeds without indentation"
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write precompressed <config-id>.xml.gz alongside each feed",
+    )
+    parser.add_argument(
+        "--brotli",
+        action="store_true",
+        help="Write precompressed <config-id>.xml.br alongside each feed "
+        "(requires jadio-feeder[brotli])",
+    )
+    parser.add_argument(
+        "--ensure-indexes",
+        action="store_true",
+        help="Create indexes used by the feeder at startup",
+    )
+    parser.add_argument(
+        "--no-search-index",
+        action="store_true",
+        help="Match words of configs by $regex instead of the search index, which "
+        "catches up with edited or removed programs only within a day unless "
+        "rebuilt by update-search-index --rebuild",
+    )
+    parser.add_argument(
+        "--no-item-store",
+        action="store_true",
+        help="Build and render every item of every feed instead of reusing items "
+        "stored in the database",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        type=Path,
+        default=None,
+        help="Write a JSON run report and a Prometheus textfile (jadio_feeder.prom) "
+        "of time spent in each stage to the directory",
+    )
+
+
+def add_argument_update_feeds(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="feeds:update_feeds")
+    add_argument_feed_options(parser)
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Number of processes to update feeds"
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        default="mongo",
+        choices=["mongo", "snapshot", "facet"],
+        help="How to match programs of configs. "
+        "'snapshot' matches all configs with one scan of recorded programs, and "
+        "'facet' matches chunks of configs with one aggregation per chunk",
+    )
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="Share the work with runs on other hosts by claiming configs from "
+        "the work queue in the feeder database",
+    )
+
+
+def add_argument_serve_scheduler(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="serve:serve_scheduler")
+    add_argument_feed_options(parser)
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=60.0,
+        help="Interval in seconds to poll configs and recorded programs",
+    )
+
+
+def add_argument_serve(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="serve:serve")
+    add_argument_feed_options(parser)
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Address to listen on"
+    )
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        help="Maximum size in MiB of rendered feeds cached in memory",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Directory of rendered feeds evicted from memory "
+        "(default: <rss-root>/.cache)",
+    )
+
+
+def add_argument_ensure_indexes(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="feeds:ensure_indexes")
+
+
+def add_argument_explain_config(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="feeds:explain_config")
+    parser.add_argument(
+        "config_ids",
+        type=str,
+        nargs="*",
+        help="Ids of configs to explain. All configs are explained if not given",
+    )
+
+
+def add_argument_update_search_index(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="feeds:update_search_index")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Index all programs again to forget removed and catch edited programs",
+    )
+
+
+def add_argument_warm_cache(parser: argparse.ArgumentParser):
+    parser.set_defaults(handler="feeds:warm_cache")
+    parser.add_argument(
+        "--media-root", type=Path, default="./media", help="Media root directory"
+    )
+    parser.add_argument(
+        "--evict",
+        action="store_true",
+        help="Remove cached probes whose media files no longer exist",
+    )
+
+
+SUBCOMMANDS = [
+    ("register-config", add_argument_register_config),
+    ("register-configs", add_argument_register_configs),
+    ("show-configs", add_argument_show_configs),
+    ("update-feeds", add_argument_update_feeds),
+    ("serve-scheduler", add_argument_serve_scheduler),
+    ("serve", add_argument_serve),
+    ("warm-cache", add_argument_warm_cache),
+    ("ensure-indexes", add_argument_ensure_indexes),
+    ("update-search-index", add_argument_update_search_index),
+    ("explain-config", add_argument_explain_config),
+]
 
 
 def parse_args() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers()
 
-    name_and_fn_pairs = [
-        ("register-config", add_argument_register_config),
-        ("show-configs", add_argument_show_configs),
-        ("update-feeds", add_argument_update_feeds),
-    ]
-    for name, add_arument_fn in name_and_fn_pairs:
+    for name, add_arument_fn in SUBCOMMANDS:
         sub_parser = subparsers.add_parser(name, help=f"see `{name} -h`")
         add_arument_fn(sub_parser)
         add_argument_common(sub_parser)
@@ -63,70 +271,18 @@ def parse_args() -> argparse.ArgumentParser:
     return parser
 
 
-def register_config(args: argparse.Namespace) -> None:
-    config: Config = Config.from_file(args.config)
-
-    with Feeder(
-        feeder_database_host=args.database_host,
-        recorder_database_host=args.database_host,
-    ) as feeder:
-        feeder.register_config(config)
-
-
-def show_configs(args: argparse.Namespace) -> None:
-    with Feeder(
-        feeder_database_host=args.database_host,
-        recorder_database_host=args.database_host,
-    ) as feeder:
-        table = []
-        configs = feeder.feeder_db.configs.find({})
-        for config in configs:
-            config_id = config.get("_id", None)
-            config = Config.from_dict(config)
-            query, channel = config.query, config.channel
-
-            datetime_range = query.datetime_range
-            if datetime_range:
-                datetime_range = tuple(dt.strftime("%Y-%m-%d") for dt in datetime_range)
-            else:
-                datetime_range = ""
-
-            def pretty_list(x: Optional[Any] = None) -> str:
-                return ", ".join(x) if x else ""
-
-            row = {
-                "config_id": str(config_id),
-                "query.platform_ids": pretty_list(query.platform_ids),
-                "query.station_ids": pretty_list(query.station_ids),
-                "query.persons": pretty_list(query.persons),
-                "query.words": pretty_list(query.words),
-                "query.datetime_range": datetime_range,
-                "channel.title": channel.title,
-            }
-            table.append(row)
-
-    table = sorted(
-        table, key=lambda x: (x["query.platform_ids"], x["query.station_ids"])
-    )
-    print(tabulate(table, headers="keys"))
-
-
-def update_feeds(args: argparse.Namespace) -> None:
-    with Feeder(
-        args.base_url,
-        rss_feed_root=args.rss_root,
-        media_root=args.media_root,
-        feeder_database_host=args.database_host,
-        recorder_database_host=args.database_host,
-    ) as feeder:
-        feeder.update_feeds()
+def resolve_handler(handler: str) -> Callable[[argparse.Namespace], None]:
+    """Imports the handler of a subcommand given as "<module>:<function>"."""
+    module_name, function_name = handler.split(":")
+    module = importlib.import_module(f"{__package__}.commands.{module_name}")
+    return getattr(module, function_name)
 
 
 def main():
     parser = parse_args()
     args = parser.parse_args()
     if hasattr(args, "handler"):
-        args.handler(args)
+        resolve_handler(args.handler)(args)
     else:
         parser.print_help()
 
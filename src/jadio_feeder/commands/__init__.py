@@ -0,0 +1,21 @@
+"""Handlers of subcommands of `jadio_feeder.cli`.
+
+Handlers are grouped into modules by what they import, and each module is
+imported only when one of its subcommands runs.
+"""
+import argparse
+
+from ..connection import ConnectionOptions
+
+
+def connection_options(args: argparse.Namespace) -> ConnectionOptions:
+    """Returns options of MongoDB clients given by CLI or environment variables."""
+    return ConnectionOptions.from_env(
+        max_pool_size=args.mongo_max_pool_size,
+        min_pool_size=args.mongo_min_pool_size,
+        server_selection_timeout_ms=args.mongo_server_selection_timeout_ms,
+        socket_timeout_ms=args.mongo_socket_timeout_ms,
+        compressors=args.mongo_compressors,
+        recorder_read_preference=args.mongo_read_preference,
+        batch_size=args.mongo_batch_size,
+    )
@@ -0,0 +1,44 @@
+"""Subcommands reading configs without `Feeder`."""
+import argparse
+from typing import Any, Optional
+
+from tabulate import tabulate
+
+from ..config import Config
+from ..database import FeederDatabase
+from . import connection_options
+
+
+def show_configs(args: argparse.Namespace) -> None:
+    with FeederDatabase(args.database_host, connection_options(args)) as feeder_db:
+        table = []
+        configs = feeder_db.configs.find({})
+        for config in configs:
+            config_id = config.get("_id", None)
+            config = Config.from_dict(config)
+            query, channel = config.query, config.channel
+
+            datetime_range = query.datetime_range
+            if datetime_range:
+                datetime_range = tuple(dt.strftime("%Y-%m-%d") for dt in datetime_range)
+            else:
+                datetime_range = ""
+
+            def pretty_list(x: Optional[Any] = None) -> str:
+                return ", ".join(x) if x else ""
+
+            row = {
+                "config_id": str(config_id),
+                "query.platform_ids": pretty_list(query.platform_ids),
+                "query.station_ids": pretty_list(query.station_ids),
+                "query.persons": pretty_list(query.persons),
+                "query.words": pretty_list(query.words),
+                "query.datetime_range": datetime_range,
+                "channel.title": channel.title,
+            }
+            table.append(row)
+
+    table = sorted(
+        table, key=lambda x: (x["query.platform_ids"], x["query.station_ids"])
+    )
+    print(tabulate(table, headers="keys"))
@@ -0,0 +1,127 @@
+"""Subcommands building feeds and maintaining the databases by `Feeder`."""
+import argparse
+
+from ..config import Config, load_config_documents
+from ..feeder import Feeder
+from . import connection_options
+
+
+def register_config(args: argparse.Namespace) -> None:
+    config: Config = Config.from_file(args.config)
+
+    with Feeder(
+        feeder_database_host=args.database_host,
+        recorder_database_host=args.database_host,
+        connection_options=connection_options(args),
+    ) as feeder:
+        feeder.register_config(config)
+
+
+def register_configs(args: argparse.Namespace) -> None:
+    documents = []
+    for path in args.paths:
+        documents += load_config_documents(path)
+
+    with Feeder(
+        feeder_database_host=args.database_host,
+        recorder_database_host=args.database_host,
+        connection_options=connection_options(args),
+    ) as feeder:
+        res = feeder.register_configs(documents)
+
+    from tabulate import tabulate
+
+    table = [
+        {"config_id": str(config_id), "status": status}
+        for status in ["inserted", "updated", "duplicated"]
+        for config_id in getattr(res, status)
+    ]
+    if table:
+        print(tabulate(table, headers="keys"))
+    print(
+        f"inserted: {len(res.inserted)}, updated: {len(res.updated)}, "
+        f"unchanged: {len(res.unchanged)}, duplicated: {len(res.duplicated)}"
+    )
+
+
+def create_feeder(args: argparse.Namespace) -> Feeder:
+    sidecars = []
+    if args.gzip:
+        sidecars.append("gzip")
+    if args.brotli:
+        sidecars.append("br")
+
+    return Feeder(
+        args.base_url,
+        rss_feed_root=args.rss_root,
+        media_root=args.media_root,
+        feeder_database_host=args.database_host,
+        recorder_database_host=args.database_host,
+        connection_options=connection_options(args),
+        backend=args.backend,
+        sidecars=sidecars,
+        ensure_indexes=args.ensure_indexes,
+        use_search_index=not args.no_search_index,
+        metrics_dir=args.metrics_dir,
+        use_item_store=not args.no_item_store,
+    )
+
+
+def update_feeds(args: argparse.Namespace) -> None:
+    with create_feeder(args) as feeder:
+        feeder.update_feeds(
+            jobs=args.jobs,
+            engine=args.engine,
+            pretty=not args.compact,
+            use_queue=args.queue,
+        )
+
+
+def warm_cache(args: argparse.Namespace) -> None:
+    with Feeder(
+        media_root=args.media_root,
+        feeder_database_host=args.database_host,
+        recorder_database_host=args.database_host,
+        connection_options=connection_options(args),
+    ) as feeder:
+        feeder.warm_media_cache(evict=args.evict)
+
+
+def ensure_indexes(args: argparse.Namespace) -> None:
+    with Feeder(
+        feeder_database_host=args.database_host,
+        recorder_database_host=args.database_host,
+        connection_options=connection_options(args),
+    ) as feeder:
+        feeder.ensure_indexes()
+
+
+def update_search_index(args: argparse.Namespace) -> None:
+    with Feeder(
+        feeder_database_host=args.database_host,
+        recorder_database_host=args.database_host,
+        connection_options=connection_options(args),
+    ) as feeder:
+        feeder.update_search_index(rebuild=args.rebuild)
+
+
+def explain_config(args: argparse.Namespace) -> None:
+    with Feeder(
+        feeder_database_host=args.database_host,
+        recorder_database_host=args.database_host,
+        connection_options=connection_options(args),
+    ) as feeder:
+        config_ids = args.config_ids or [
+            config["_id"] for config in feeder.feeder_db.configs.find({}, ["_id"])
+        ]
+        table = []
+        for config_id in config_ids:
+            row = {"config_id": str(config_id)}
+            row.update(feeder.explain_config(config_id))
+            table.append(row)
+
+    from tabulate import tabulate
+
+    # show configs doing collection scans and examining many docs first
+    table = sorted(table, key=lambda x: (x["collscan"], x["docs_examined"] or 0))
+    print(tabulate(table[::-1], headers="keys"))
@@ -0,0 +1,41 @@
+"""Long-running subcommands serving feeds."""
+import argparse
+import signal
+import threading
+from logging import getLogger
+
+from ..scheduler import FeedScheduler
+from ..server import FeedCache, FeedServer
+from .feeds import create_feeder
+
+logger = getLogger(__name__)
+
+
+def serve_scheduler(args: argparse.Namespace) -> None:
+    stop_event = threading.Event()
+    for signum in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(signum, lambda *_: stop_event.set())
+
+    with create_feeder(args) as feeder:
+        scheduler = FeedScheduler(
+            feeder, poll_interval=args.poll_interval, pretty=not args.compact
+        )
+        scheduler.run(stop_event)
+
+
+def serve(args: argparse.Namespace) -> None:
+    with create_feeder(args) as feeder:
+        cache = FeedCache(
+            max_bytes=args.cache_size * 1024 * 1024,
+            cache_dir=args.cache_dir or args.rss_root / ".cache",
+        )
+        feed_server = FeedServer(feeder, cache, pretty=not args.compact)
+        with feed_server.create_server(args.host, args.port) as server:
+            # shutdown() waits for serve_forever() to exit, so call it in another thread
+            for signum in [signal.SIGINT, signal.SIGTERM]:
+                signal.signal(
+                    signum,
+                    lambda *_: threading.Thread(target=server.shutdown).start(),
+                )
+            logger.info(f"serve RSS feeds on {args.host}:{args.port}")
+            server.serve_forever()
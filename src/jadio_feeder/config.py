@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import datetime as dt
+import hashlib
+import json
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
 
 from serdescontainer import BaseContainer
 
@@ -31,7 +34,15 @@ class Query(BaseContainer):
     words: Optional[List[str]] = None
     datetime_range: Optional[List[dt.datetime]] = None
 
-    def to_mongo_format(self) -> Dict[str, Any]:
+    def to_mongo_format(
+        self, words_condition: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Returns the query of MongoDB.
+
+        Args:
+            words_condition (dict): Condition used instead of `$regex` of `words`,
+                e.g. resolved by `SearchIndex.to_words_condition`.
+        """
         and_conditions = []
         if self.platform_ids:
             and_conditions.append({"platform_id": {"$in": self.platform_ids}})
@@ -41,7 +52,9 @@ class Query(BaseContainer):
             target_keys = ["performers", "guests"]
             or_conditions = [{key: {"$in": self.persons}} for key in target_keys]
             and_conditions.append({"$or": or_conditions})
-        if self.words:
+        if self.words and words_condition is not None:
+            and_conditions.append(words_condition)
+        elif self.words:
             target_keys = ["name", "description", "information", "episode_name"]
             or_conditions = []
             for key in target_keys:
@@ -59,11 +72,26 @@ class Query(BaseContainer):
 
 @dataclass
 class Config(BaseContainer):
+    """Config of a RSS feed.
+
+    Attributes:
+        max_items (int): Maximum number of the latest items in the feed.
+        page_size (int): If set, older items are split into immutable archive
+            pages of this size linked from the feed (RFC 5005), and the feed has
+            the latest `max_items` items, or `page_size` items if not set.
+        update_interval (int): Interval in seconds to rebuild the feed by
+            `serve-scheduler`. If not set, it is inferred from the recency of the
+            matched programs.
+    """
+
     query: Query
     channel: Optional[PodcastChannel] = None
     sort_by: Optional[str] = None
     from_oldest: bool = False
     remove_duplicates: bool = True
+    max_items: Optional[int] = None
+    page_size: Optional[int] = None
+    update_interval: Optional[int] = None
 
     def custom_types() -> List[Any]:
         """For BaseContainer.from_dict"""
@@ -72,4 +100,59 @@ class Config(BaseContainer):
     @classmethod
     def from_dict(cls, data: Dict[str, Any], **kwargs) -> Config:
         data.pop("_id", None)
+        data.pop("config_hash", None)
         return super().from_dict(data, **kwargs)
+
+    def to_hash(self) -> str:
+        """Returns a stable hash of the config, used to detect edited configs."""
+        return _hash(self.to_dict(serialize=True, unserialized_types=[dt.datetime]))
+
+    def to_pagination_hash(self) -> str:
+        """Returns a hash of the fields deciding programs of archive pages, used to
+        keep completed pages across edits of other fields, e.g. the channel."""
+        data = self.to_dict(serialize=True, unserialized_types=[dt.datetime])
+        return _hash({key: data.get(key) for key in PAGINATION_FIELDS})
+
+
+# fields of `Config` deciding which programs fall into which archive pages
+PAGINATION_FIELDS = [
+    "query",
+    "sort_by",
+    "from_oldest",
+    "remove_duplicates",
+    "page_size",
+]
+
+
+def _hash(data: Dict[str, Any]) -> str:
+    data = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+CONFIG_FILE_SUFFIXES = [".json", ".yaml", ".yml"]
+
+
+def load_config_documents(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """Loads documents of configs from a file or the files in a directory.
+
+    A YAML file may have multiple documents separated by `---`, and a JSON file
+    may have an array of configs. Documents may have `_id` of the configs to
+    replace them.
+    """
+    path = Path(path)
+    if path.is_dir():
+        paths = sorted(p for p in path.iterdir() if p.suffix in CONFIG_FILE_SUFFIXES)
+    else:
+        paths = [path]
+
+    ret = []
+    for path in paths:
+        with path.open(encoding="utf-8") as f:
+            if path.suffix == ".json":
+                data = json.load(f)
+                ret += data if isinstance(data, list) else [data]
+            else:
+                import yaml
+
+                ret += [data for data in yaml.safe_load_all(f) if data is not None]
+    return ret
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import dataclasses
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import pymongo
+
+DEFAULT_HOST = "mongodb://localhost:27017/"
+# options are read from environment variables such as
+# JADIO_FEEDER_MONGO_MAX_POOL_SIZE=200 or JADIO_FEEDER_MONGO_COMPRESSORS=zstd,snappy
+ENV_PREFIX = "JADIO_FEEDER_MONGO_"
+
+# zstd and snappy require `zstandard` and `python-snappy`, see
+# jadio-feeder[compression]
+COMPRESSORS = ["zstd", "snappy", "zlib"]
+READ_PREFERENCES = {
+    "primary": pymongo.ReadPreference.PRIMARY,
+    "primaryPreferred": pymongo.ReadPreference.PRIMARY_PREFERRED,
+    "secondary": pymongo.ReadPreference.SECONDARY,
+    "secondaryPreferred": pymongo.ReadPreference.SECONDARY_PREFERRED,
+    "nearest": pymongo.ReadPreference.NEAREST,
+}
+
+
+@dataclass(frozen=True)
+class ConnectionOptions:
+    """Options of MongoDB clients and of queries of recorded programs.
+
+    Attributes:
+        max_pool_size (int): Maximum number of connections per server of a client.
+        min_pool_size (int): Number of connections kept open per server.
+        server_selection_timeout_ms (int): Timeout to find a server for an
+            operation.
+        socket_timeout_ms (int): Timeout of each operation, or None to wait
+            forever.
+        compressors (tuple of str): Wire compressors in the order of preference,
+            "zstd", "snappy" and/or "zlib".
+        recorder_read_preference (str): Read preference of queries of recorded
+            programs, e.g. "secondaryPreferred" to offload them from the primary.
+        batch_size (int): Number of recorded programs returned per batch of
+            cursors, or 0 to use the default of the server.
+    """
+
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    server_selection_timeout_ms: int = 30000
+    socket_timeout_ms: Optional[int] = None
+    compressors: Tuple[str, ...] = ()
+    recorder_read_preference: str = "primary"
+    batch_size: int = 0
+
+    def __post_init__(self) -> None:
+        unknown = set(self.compressors) - set(COMPRESSORS)
+        if unknown:
+            raise ValueError(f"unknown compressors: {sorted(unknown)}")
+        if self.recorder_read_preference not in READ_PREFERENCES:
+            raise ValueError(
+                f"unknown read preference: {self.recorder_read_preference}"
+            )
+        if self.batch_size < 0:
+            raise ValueError(f"batch_size must be >= 0: {self.batch_size}")
+
+    @classmethod
+    def from_env(
+        cls, environ: Optional[Mapping[str, str]] = None, **kwargs
+    ) -> ConnectionOptions:
+        """Creates options from `JADIO_FEEDER_MONGO_*` environment variables.
+
+        Args:
+            environ (dict): Environment variables. Defaults to `os.environ`.
+            **kwargs: Options overriding the environment variables unless None,
+                e.g. given by CLI.
+        """
+        environ = os.environ if environ is None else environ
+        values: Dict[str, Any] = {}
+        for field in dataclasses.fields(cls):
+            value = kwargs.get(field.name)
+            if value is None:
+                value = environ.get(ENV_PREFIX + field.name.upper())
+                if value is None:
+                    continue
+            if field.name == "compressors":
+                if isinstance(value, str):
+                    value = [name.strip() for name in value.split(",")]
+                value = tuple(name for name in value if name)
+            elif field.name != "recorder_read_preference":
+                value = int(value)
+            values[field.name] = value
+        return cls(**values)
+
+    @property
+    def read_preference(self):
+        return READ_PREFERENCES[self.recorder_read_preference]
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        """Returns kwargs of `pymongo.MongoClient`."""
+        ret: Dict[str, Any] = dict(
+            maxPoolSize=self.max_pool_size,
+            minPoolSize=self.min_pool_size,
+            serverSelectionTimeoutMS=self.server_selection_timeout_ms,
+            socketTimeoutMS=self.socket_timeout_ms,
+        )
+        if self.compressors:
+            ret["compressors"] = ",".join(self.compressors)
+        return ret
+
+
+def create_client(host: str, options: ConnectionOptions) -> pymongo.MongoClient:
+    return pymongo.MongoClient(host, appname="jadio-feeder", **options.client_kwargs())
+
+
+class ConnectionManager:
+    """Shares one `MongoClient` per URI and client options within a process.
+
+    Clients are acquired by `FeederDatabase` and `RecorderDatabase`, so that both
+    databases on the same URI share one client and its connection pool, and
+    a client is closed when it is released by all of them. Clients inherited by
+    a forked process are neither used nor closed there; the child creates its
+    own clients.
+
+    Examples:
+        >>> client = manager.acquire("mongodb://localhost:27017/", options)
+        >>> manager.release(client)
+    """
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, Tuple], pymongo.MongoClient] = {}
+        self._refs: Dict[Tuple[str, Tuple], int] = {}
+        self._pid = os.getpid()
+
+    def _check_pid(self) -> None:
+        # NOTE: sockets of clients copied from the parent must not be touched in
+        # the child, so the clients are just forgotten
+        if self._pid != os.getpid():
+            self._clients = {}
+            self._refs = {}
+            self._pid = os.getpid()
+
+    def acquire(
+        self, host: Optional[str] = None, options: Optional[ConnectionOptions] = None
+    ) -> pymongo.MongoClient:
+        host = host or DEFAULT_HOST
+        options = options or ConnectionOptions()
+        key = (host, tuple(sorted(options.client_kwargs().items())))
+        with self._lock:
+            self._check_pid()
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = create_client(host, options)
+                self._refs[key] = 0
+            self._refs[key] += 1
+            return client
+
+    def release(self, client: pymongo.MongoClient) -> None:
+        with self._lock:
+            self._check_pid()
+            key = next((k for k, c in self._clients.items() if c is client), None)
+            if key is None:
+                return
+            self._refs[key] -= 1
+            if self._refs[key] > 0:
+                return
+            del self._clients[key], self._refs[key]
+        client.close()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+_manager = ConnectionManager()
+if hasattr(os, "register_at_fork"):
+    # the lock may be held by another thread of the parent at fork
+    os.register_at_fork(after_in_child=_manager._reset)
+
+
+def acquire(
+    host: Optional[str] = None, options: Optional[ConnectionOptions] = None
+) -> pymongo.MongoClient:
+    """Acquires the client shared in the process. See `ConnectionManager`."""
+    return _manager.acquire(host, options)
+
+
+def release(client: pymongo.MongoClient) -> None:
+    _manager.release(client)
@@ -4,13 +4,18 @@ from typing import Optional
 
 import pymongo
 import pymongo.collation
+import pymongo.collection
 import pymongo.database
 
+from . import connection
+from .connection import ConnectionOptions
+
 
 class FeederDatabase:
-    def __init__(self, host: Optional[str] = None) -> None:
-        host = host or "mongodb://localhost:27017/"
-        self._client = pymongo.MongoClient(host)
+    def __init__(
+        self, host: Optional[str] = None, options: Optional[ConnectionOptions] = None
+    ) -> None:
+        self._client = connection.acquire(host, options)
 
     def __enter__(self) -> FeederDatabase:
         return self
@@ -19,7 +24,7 @@ class FeederDatabase:
         self.close()
 
     def close(self) -> None:
-        self._client.close()
+        connection.release(self._client)
 
     @property
     def _database(self) -> pymongo.database.Database:
@@ -30,5 +35,51 @@ class FeederDatabase:
         return self._database.get_collection("configs")
 
     @property
-    def timestamp(self) -> pymongo.collation.Collation:
-        return self._database.get_collection("timestamp")
+    def feeds(self) -> pymongo.collation.Collation:
+        return self._database.get_collection("feeds")
+
+    @property
+    def media_probes(self) -> pymongo.collation.Collation:
+        return self._database.get_collection("media_probes")
+
+    @property
+    def items(self) -> pymongo.collation.Collation:
+        return self._database.get_collection("items")
+
+    @property
+    def queue(self) -> pymongo.collation.Collation:
+        return self._database.get_collection("queue")
+
+    @property
+    def search_index(self) -> pymongo.collation.Collation:
+        return self._database.get_collection("search_index")
+
+
+class RecorderDatabase:
+    """Counterpart of `jadio_recorder.RecorderDatabase` used by the feeder.
+
+    Its client is shared with `FeederDatabase` on the same URI, and recorded
+    programs are read by `ConnectionOptions.recorder_read_preference`.
+    """
+
+    def __init__(
+        self, host: Optional[str] = None, options: Optional[ConnectionOptions] = None
+    ) -> None:
+        options = options or ConnectionOptions()
+        self._client = connection.acquire(host, options)
+        self._database = self._client.get_database(
+            "recorder", read_preference=options.read_preference
+        )
+
+    def __enter__(self) -> RecorderDatabase:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        connection.release(self._client)
+
+    @property
+    def recorded_programs(self) -> pymongo.collection.Collection:
+        return self._database.get_collection("recorded_programs")
@@ -0,0 +1,204 @@
+"""Durations of media files read from their headers only.
+
+Unlike mutagen, which parses whole atom trees of MP4 files and may scan frames
+of MP3 files, only a few bounded reads are made here: the `moov.mvhd` box of
+MP4/M4A/MOV files, and the first frame of MP3 files with its Xing or VBRI
+header, or the file size for CBR streams.
+"""
+from __future__ import annotations
+
+import struct
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple, Union
+
+# MP3 frames are searched for in this many bytes after ID3v2 tags
+MP3_SYNC_WINDOW = 64 * 1024
+# MP4 boxes visited at most before giving up, e.g. on a broken file
+MP4_MAX_BOXES = 4096
+
+MP3_SUFFIXES = [".mp3"]
+MP4_SUFFIXES = [".m4a", ".mp4", ".mov"]
+
+# kbps by (version, layer), where MPEG 2.5 shares the bitrates of MPEG 2
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Hz by version, where 25 denotes MPEG 2.5
+_MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    25: [11025, 12000, 8000],
+}
+_MP3_MONO = 3
+
+
+def probe_duration(path: Union[str, Path]) -> float:
+    """Reads the duration of a media file in seconds from its headers.
+
+    Raises:
+        ValueError: If the file type is not supported or its headers are not
+            found, in which case the caller may fall back to mutagen.
+    """
+    path = Path(path)
+    with path.open("rb") as f:
+        try:
+            if path.suffix in MP3_SUFFIXES:
+                return _probe_mp3(f)
+            elif path.suffix in MP4_SUFFIXES:
+                return _probe_mp4(f)
+        except struct.error as err:
+            raise ValueError(f"{path} is truncated: {err}") from err
+    raise ValueError(f"{path.suffix} is not supported file type")
+
+
+def _read_box_header(f: BinaryIO, end: int) -> Optional[Tuple[bytes, int, int]]:
+    """Reads the type, start and end of the box at the position of `f`."""
+    start = f.tell()
+    if start + 8 > end:
+        return None
+    size, kind = struct.unpack(">I4s", f.read(8))
+    if size == 1:
+        (size,) = struct.unpack(">Q", f.read(8))
+    elif size == 0:
+        # the last box extends to the end of the file
+        size = end - start
+    if size < f.tell() - start or start + size > end:
+        raise ValueError(f"invalid size of {kind!r} box at {start}")
+    return kind, f.tell(), start + size
+
+
+def _find_box(f: BinaryIO, kind: bytes, start: int, end: int) -> Tuple[int, int]:
+    """Returns the payload range of the first `kind` box in [start, end)."""
+    f.seek(start)
+    for _ in range(MP4_MAX_BOXES):
+        header = _read_box_header(f, end)
+        if header is None:
+            break
+        box_kind, payload_start, box_end = header
+        if box_kind == kind:
+            return payload_start, box_end
+        f.seek(box_end)
+    raise ValueError(f"{kind!r} box is not found")
+
+
+def _probe_mp4(f: BinaryIO) -> float:
+    file_size = f.seek(0, 2)
+    # NOTE: `moov` often follows `mdat` of recordings, which is skipped by seeking
+    moov_start, moov_end = _find_box(f, b"moov", 0, file_size)
+    mvhd_start, mvhd_end = _find_box(f, b"mvhd", moov_start, moov_end)
+    f.seek(mvhd_start)
+    (version,) = struct.unpack(">B3x", f.read(4))
+    if version == 0:
+        _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+        unknown = duration == 0xFFFFFFFF
+    elif version == 1:
+        _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+        unknown = duration == 0xFFFFFFFFFFFFFFFF
+    else:
+        raise ValueError(f"unknown version of mvhd box: {version}")
+    if f.tell() > mvhd_end or timescale == 0 or unknown:
+        raise ValueError("invalid mvhd box")
+    return duration / timescale
+
+
+def _skip_id3(f: BinaryIO) -> int:
+    # some writers stack multiple ID3v2 tags
+    offset = 0
+    while True:
+        f.seek(offset)
+        header = f.read(10)
+        if len(header) < 10 or not header.startswith(b"ID3"):
+            return offset
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        if size == 0:
+            return offset
+        offset += 10 + size
+
+
+class _Mp3Frame:
+    def __init__(self, header: bytes) -> None:
+        (value,) = struct.unpack(">I", header)
+        version = (value >> 19) & 0x3
+        layer = (value >> 17) & 0x3
+        bitrate = (value >> 12) & 0xF
+        sample_rate = (value >> 10) & 0x3
+        if (
+            value >> 21 != 0x7FF
+            or version == 1
+            or layer == 0
+            or bitrate in [0, 0xF]
+            or sample_rate == 0x3
+        ):
+            raise ValueError("invalid MPEG frame header")
+
+        self.version = [25, None, 2, 1][version]
+        self.layer = 4 - layer
+        self.mode = (value >> 6) & 0x3
+        bitrates = _MP3_BITRATES[(min(self.version, 2), self.layer)]
+        self.bitrate = bitrates[bitrate] * 1000
+        self.sample_rate = _MP3_SAMPLE_RATES[self.version][sample_rate]
+        padding = (value >> 9) & 0x1
+        if self.layer == 1:
+            self.samples = 384
+            # Layer I counts in slots of 4 bytes, including the padding
+            self.length = (12 * self.bitrate // self.sample_rate + padding) * 4
+        else:
+            self.samples = 576 if self.version != 1 and self.layer == 3 else 1152
+            self.length = self.samples // 8 * self.bitrate // self.sample_rate + padding
+
+    @property
+    def xing_offset(self) -> int:
+        # sizes of the header and the side information
+        if self.version == 1:
+            return 21 if self.mode == _MP3_MONO else 36
+        return 13 if self.mode == _MP3_MONO else 21
+
+
+def _find_mp3_frame(f: BinaryIO, start: int) -> Tuple[int, _Mp3Frame]:
+    f.seek(start)
+    data = f.read(MP3_SYNC_WINDOW)
+    offset = data.find(b"\xff")
+    while 0 <= offset <= len(data) - 4:
+        try:
+            frame = _Mp3Frame(data[offset : offset + 4])
+        except ValueError:
+            offset = data.find(b"\xff", offset + 1)
+            continue
+        # the next frame has to follow to rule out a false sync
+        f.seek(start + offset + frame.length)
+        try:
+            _Mp3Frame(f.read(4))
+        except (ValueError, struct.error):
+            offset = data.find(b"\xff", offset + 1)
+            continue
+        return start + offset, frame
+    raise ValueError("MPEG frame is not found")
+
+
+def _probe_mp3(f: BinaryIO) -> float:
+    file_size = f.seek(0, 2)
+    frame_offset, frame = _find_mp3_frame(f, _skip_id3(f))
+    if frame.layer == 3:
+        # Xing (or Info of CBR) header with the number of frames
+        f.seek(frame_offset + frame.xing_offset)
+        data = f.read(12)
+        if data[:4] in [b"Xing", b"Info"]:
+            (flags,) = struct.unpack(">I", data[4:8])
+            if flags & 0x1:
+                (num_frames,) = struct.unpack(">I", data[8:12])
+                return num_frames * frame.samples / frame.sample_rate
+        # VBRI header of Fraunhofer encoders
+        f.seek(frame_offset + 36)
+        data = f.read(18)
+        if data[:6] == b"VBRI\x00\x01":
+            (num_frames,) = struct.unpack(">I", data[14:18])
+            return num_frames * frame.samples / frame.sample_rate
+    # CBR, estimated by the size of the stream
+    return 8 * (file_size - frame_offset) / frame.bitrate
@@ -1,37 +1,744 @@
 from __future__ import annotations
 
 import datetime as dt
+import io
+import itertools
+import multiprocessing
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from logging import getLogger
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-import tqdm
+import pymongo
 from bson import ObjectId
-from jadio import Program
-from jadio_recorder import RecorderDatabase
 
-from .config import Config
-from .database import FeederDatabase
-from .podcast import PodcastRssFeedGenCreator
+from . import metrics
+from .archive import ArchivePage, archive_page_name, paginate
+from .config import Config, Query
+from .connection import ConnectionOptions
+from .database import FeederDatabase, RecorderDatabase
+from .indexes import (
+    CONFIG_INDEXES,
+    DUPLICATE_KEY_CODE,
+    RECORDED_PROGRAM_INDEXES,
+    ensure_collection_indexes,
+    summarize_explain,
+)
+from .items import ItemStore
+from .media import PREFETCH_BATCH_SIZE, MediaProbeCache
+from .media_index import MediaIndex
+from .output import (
+    SIDECAR_SUFFIXES,
+    ChangedFileWriter,
+    check_sidecars,
+    write_manifest,
+    write_sidecars,
+)
+from .pipeline import (
+    is_document_too_large,
+    is_pipeline_unsupported,
+    to_facet_pipeline,
+    to_feed_pipeline,
+)
+from .podcast import (
+    PodcastChannel,
+    PodcastRssFeedGenCreator,
+    _datetime_to_pub_data,
+    _remove_duplicates,
+    _resolve_sort_by,
+)
+from .program import PROGRAM_FIELDS, ProgramView
+from .search import SearchIndex
+from .stream import PodcastRssStreamWriter
+from .work_queue import WorkQueue, create_owner_id
+
+if TYPE_CHECKING:
+    from .matcher import ProgramMatch
 
 logger = getLogger(__name__)
 
+# configs of each `$facet` aggregation of `Feeder.update_feeds(engine="facet")`,
+# and the estimated size of its result to stay well below the 16MB limit
+FACET_CHUNK_SIZE = 100
+FACET_MAX_BYTES = 8 * 1024 * 1024
+# estimated bytes of each program id and summary in the result of `$facet`
+FACET_ID_BYTES = 20
+FACET_BRANCH_BYTES = 128
+
+# Feeder owned by each worker process of `Feeder.update_feeds(jobs=N)`
+_worker_feeder: Optional[Feeder] = None
+
+
+def _progress(iterable: Iterable[Any], **kwargs) -> Iterable[Any]:
+    import tqdm
+
+    return tqdm.tqdm(iterable, **kwargs)
+
+
+def _init_worker(feeder_kwargs: Dict[str, Any], media_index: MediaIndex) -> None:
+    global _worker_feeder
+    _worker_feeder = Feeder(**feeder_kwargs)
+    # media files are found by the index walked once by the parent process
+    _worker_feeder._media_index = media_index
+
+
+def _update_feed_in_worker(
+    config: Dict[str, Any],
+    pretty: bool = True,
+    force_update: bool = False,
+    match: Optional[ProgramMatch] = None,
+) -> UpdateResult:
+    if _worker_feeder._metrics_dir is None:
+        return _worker_feeder._update_feed_from_dict(
+            config, pretty=pretty, force_update=force_update, match=match
+        )
+    # stats of the feed are merged into the metrics of the parent process
+    with metrics.collect() as worker_metrics:
+        ret = _worker_feeder._update_feed_from_dict(
+            config, pretty=pretty, force_update=force_update, match=match
+        )
+    ret.metrics = worker_metrics.feeds[str(ret.config_id)].to_dict()
+    return ret
+
+
+def _work_queue_in_worker(
+    pretty: bool = True, force_update: bool = False
+) -> List[UpdateResult]:
+    return list(
+        _worker_feeder._work_queue(
+            lambda config: _update_feed_in_worker(config, pretty, force_update)
+        )
+    )
+
+
+@dataclass
+class UpdateResult:
+    config_id: Union[str, ObjectId]
+    updated: bool = False
+    error: Optional[str] = None
+    metrics: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class RegisterResult:
+    """Ids of configs registered by `Feeder.register_configs`."""
+
+    inserted: List[ObjectId] = field(default_factory=list)
+    updated: List[ObjectId] = field(default_factory=list)
+    unchanged: List[ObjectId] = field(default_factory=list)
+    # ids of configs not written since the same config is registered by another id
+    duplicated: List[ObjectId] = field(default_factory=list)
+
+
+def _chunk_by_bytes(
+    keys: Sequence[Any], sizes: Dict[Any, int], max_items: int, max_bytes: int
+) -> List[List[Any]]:
+    """Splits keys into chunks of at most `max_items` keys whose total of
+    `sizes` does not exceed `max_bytes`, unless a key exceeds it by itself."""
+    chunks: List[List[Any]] = []
+    chunk: List[Any] = []
+    num_bytes = 0
+    for key in keys:
+        if chunk and (len(chunk) >= max_items or num_bytes + sizes[key] > max_bytes):
+            chunks.append(chunk)
+            chunk, num_bytes = [], 0
+        chunk.append(key)
+        num_bytes += sizes[key]
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _summary_pipeline(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": None,
+                "num_programs": {"$sum": 1},
+                "max_program_id": {"$max": "$_id"},
+                "max_datetime": {"$max": "$datetime"},
+            }
+        },
+    ]
+
+
+def _to_summary(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if summary is None:
+        return dict(num_programs=0, max_program_id=None, max_datetime=None)
+    summary.pop("_id")
+    return summary
+
+
+class _BaseFeeder:
+    """Rendering and file outputs of RSS feeds shared by `Feeder` and `AsyncFeeder`.
+
+    Methods here take programs already fetched from MongoDB, so that feeds are
+    rendered by the same code whichever driver fetches them. Subclasses set
+    `_media_cache`, and media files are found by `_media_index`.
+    """
 
-class Feeder:
     def __init__(
         self,
         base_url: str = "http://localhost",
         rss_feed_root: Union[str, Path] = ".",
         media_root: Union[str, Path] = ".",
-        feeder_database_host: Optional[str] = None,
-        recorder_database_host: Optional[str] = None,
+        backend: str = "feedgen",
+        sidecars: Sequence[str] = (),
+        use_search_index: bool = True,
     ) -> None:
+        if backend not in ["feedgen", "stream"]:
+            raise ValueError(f"'{backend}' is not supported backend")
+        check_sidecars(sidecars)
         self._base_url = base_url
         self._rss_feed_root = Path(rss_feed_root)
         self._media_root = Path(media_root)
+        self._backend = backend
+        self._sidecars = list(sidecars)
+        self._use_search_index = use_search_index
+        self._media_cache: Optional[MediaProbeCache] = None
+        self._media_index = MediaIndex(self._media_root)
+        self._item_store: Optional[ItemStore] = None
+        # sort and remove duplicates by `to_feed_pipeline` until it turns out to be
+        # unsupported by the server
+        self._use_pipeline = True
+
+    def _disable_pipeline(self, err: Exception) -> None:
+        logger.info(f"sort programs in Python instead of the pipeline: {err}")
+        self._use_pipeline = False
+
+    def _rss_feed_path(self, config_id: Union[str, ObjectId]) -> Path:
+        return self._rss_feed_root / f"{str(config_id)}.xml"
+
+    def _create_fingerprint(
+        self, config: Config, summary: Dict[str, Any], pretty: bool
+    ) -> Dict[str, Any]:
+        return dict(
+            config_hash=config.to_hash(),
+            **summary,
+            options=dict(
+                base_url=self._base_url,
+                media_root=str(self._media_root),
+                pretty=pretty,
+                backend=self._backend,
+                sidecars=self._sidecars,
+                use_search_index=self._use_search_index,
+            ),
+        )
 
-        self._feeder_database = FeederDatabase(feeder_database_host)
-        self._recorder_database = RecorderDatabase(recorder_database_host)
+    def _render_feedgen(
+        self,
+        f: BinaryIO,
+        config: Config,
+        program_and_id_pairs: List[Tuple[ProgramView, ObjectId]],
+        sort_by: Optional[str],
+        remove_duplicates: bool,
+        pretty: bool,
+        last_build_date: str,
+        presorted: bool = False,
+    ) -> int:
+        if not presorted:
+            # order by id so that programs with the same sort key are always
+            # ordered in the same way regardless of how the programs are matched
+            program_and_id_pairs.sort(key=lambda x: x[1])
+        if len(program_and_id_pairs) == 0:
+            return 0
+        logger.info(f"fetch {len(program_and_id_pairs)} program(s)")
+
+        # create FeedGenerator
+        feed_generator = PodcastRssFeedGenCreator(
+            self._base_url,
+            self._media_root,
+            media_cache=self._media_cache,
+            media_index=self._media_index,
+            item_store=self._item_store,
+        ).create(
+            program_and_id_pairs,
+            channel=config.channel,
+            sort_by=sort_by,
+            from_oldest=config.from_oldest,
+            remove_duplicates=remove_duplicates,
+            presorted=presorted,
+        )
+        feed_generator.lastBuildDate(last_build_date)
+        with metrics.stage("render"):
+            feed_generator.rss_file(f, pretty=pretty)
+        return len(feed_generator.entry())
+
+    def _render_stream(
+        self,
+        f: BinaryIO,
+        program_and_id_pairs: Iterable[Tuple[ProgramView, ObjectId]],
+        channel: PodcastChannel,
+        pretty: bool,
+        last_build_date: str,
+        links: Optional[Dict[str, str]] = None,
+        archive: bool = False,
+    ) -> int:
+        writer = PodcastRssStreamWriter(
+            self._base_url,
+            self._media_root,
+            media_cache=self._media_cache,
+            media_index=self._media_index,
+            item_store=self._item_store,
+        )
+        return writer.write(
+            f,
+            program_and_id_pairs,
+            channel,
+            pretty=pretty,
+            last_build_date=last_build_date,
+            links=links,
+            archive=archive,
+        )
+
+    def _to_latest_pairs(
+        self,
+        config: Config,
+        programs: List[Dict[str, Any]],
+        limit: int,
+        max_items: int,
+    ) -> Optional[List[Tuple[ProgramView, ObjectId]]]:
+        """Takes the latest `max_items` programs of ones fetched from the latest.
+
+        Programs are fetched in the reverse order of the feed, sorted by
+        `_latest_sort`, and duplicates are removed in the order of the feed in the
+        same way as feeds without `max_items`.
+
+        Returns:
+            list: Pairs of programs and their ids in the order of the feed, or None
+                if duplicates leave fewer than `max_items` programs out of `limit`
+                ones, i.e. more programs have to be fetched.
+        """
+        truncated = len(programs) >= limit
+        if not config.from_oldest:
+            ret = list(self._to_sorted_pairs(config, programs))
+            if len(ret) < max_items and truncated:
+                return None
+            return ret[:max_items]
+
+        ret = list(self._to_sorted_pairs(config, programs[::-1]))
+        if truncated and config.remove_duplicates and ret:
+            # whether the oldest fetched program is a duplicate depends on the
+            # previous one, which is not fetched
+            if ret[0][1] == programs[-1]["_id"]:
+                ret = ret[1:]
+        if len(ret) < max_items and truncated:
+            return None
+        return ret[-max_items:]
+
+    def _latest_sort(self, config: Config, sort_by: str) -> List[Tuple[str, int]]:
+        """Returns the exact reverse of the order of the feed of the config."""
+        id_direction = pymongo.DESCENDING if config.from_oldest else pymongo.ASCENDING
+        return [(sort_by, pymongo.DESCENDING), ("_id", id_direction)]
+
+    def _to_pairs(
+        self, programs: Iterable[Dict[str, Any]]
+    ) -> Iterator[Tuple[ProgramView, ObjectId]]:
+        return ((ProgramView(program), program["_id"]) for program in programs)
+
+    def _to_sorted_pairs(
+        self, config: Config, programs: Iterable[Dict[str, Any]]
+    ) -> Iterator[Tuple[ProgramView, ObjectId]]:
+        program_and_id_pairs = self._to_pairs(programs)
+        if config.remove_duplicates:
+            program_and_id_pairs = _remove_duplicates(program_and_id_pairs)
+        return program_and_id_pairs
+
+    def _render_stream_feed(
+        self,
+        f: BinaryIO,
+        config: Config,
+        program_and_id_pairs: Iterator[Tuple[ProgramView, ObjectId]],
+        find_latest_program: Callable[[], Optional[ProgramView]],
+        pretty: bool,
+        last_build_date: str,
+    ) -> int:
+        """Writes programs sorted in the order of the feed by the stream writer.
+
+        Args:
+            find_latest_program (callable): Returns the latest program, which is
+                called for the channel only if the feed is from the oldest.
+        """
+        first_pair = next(program_and_id_pairs, None)
+        if first_pair is None:
+            return 0
+
+        channel = config.channel
+        if not channel:
+            if config.from_oldest:
+                channel = PodcastChannel.from_program(find_latest_program())
+            else:
+                channel = PodcastChannel.from_program(first_pair[0])
+
+        return self._render_stream(
+            f,
+            itertools.chain([first_pair], program_and_id_pairs),
+            channel,
+            pretty,
+            last_build_date,
+        )
+
+    def _render_programs(
+        self,
+        f: BinaryIO,
+        config: Config,
+        channel: PodcastChannel,
+        program_ids: List[ObjectId],
+        programs: Dict[ObjectId, Dict[str, Any]],
+        pretty: bool,
+        last_build_date: str,
+        links: Dict[str, str],
+        archive: bool = False,
+    ) -> int:
+        """Writes programs given from the oldest in the order of the feed.
+
+        Args:
+            programs (dict): Map of ids to documents of the programs, which may
+                have other programs too.
+        """
+        if not config.from_oldest:
+            program_ids = program_ids[::-1]
+        program_and_id_pairs = (
+            (ProgramView(programs[program_id]), program_id)
+            for program_id in program_ids
+            if program_id in programs
+        )
+        return self._render_stream(
+            f,
+            program_and_id_pairs,
+            channel,
+            pretty,
+            last_build_date,
+            links=links,
+            archive=archive,
+        )
+
+    def _archive_root(self, config_id: Union[str, ObjectId]) -> Path:
+        return self._rss_feed_root / str(config_id)
+
+    def _rss_url(self, path: Path) -> str:
+        url = urllib.parse.quote(path.relative_to(self._rss_feed_root).as_posix())
+        return urllib.parse.urljoin(self._base_url, "rss/" + url)
+
+    def _write_archive_page(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        channel: PodcastChannel,
+        page: ArchivePage,
+        datetimes: Dict[ObjectId, Optional[dt.datetime]],
+        programs: Dict[ObjectId, Dict[str, Any]],
+        pretty: bool,
+    ) -> None:
+        archive_root = self._archive_root(config_id)
+        links = {"current": self._rss_url(self._rss_feed_path(config_id))}
+        if page.has_prev:
+            links["prev-archive"] = self._rss_url(archive_root / page.prev_name)
+        if page.has_next:
+            links["next-archive"] = self._rss_url(archive_root / page.next_name)
+        # programs of a completed page may have been removed since
+        last_datetime = max(
+            (x for x in map(datetimes.get, page.program_ids) if x is not None),
+            default=dt.datetime.min,
+        )
+
+        path = archive_root / page.name
+        with ChangedFileWriter(path) as f:
+            self._render_programs(
+                f,
+                config,
+                channel,
+                page.program_ids,
+                programs,
+                pretty,
+                _datetime_to_pub_data(last_datetime),
+                links,
+                archive=True,
+            )
+        if f.changed:
+            logger.info(f"save archive page to {path}")
+        write_sidecars(path, self._sidecars)
+
+    def _remove_archive_pages(
+        self, config_id: Union[str, ObjectId], num_pages: int = 0
+    ) -> None:
+        """Removes archive pages numbered after `num_pages` with their sidecars."""
+        names = {archive_page_name(i + 1) for i in range(num_pages)}
+        archive_root = self._archive_root(config_id)
+        for path in sorted(archive_root.glob("archive-*.xml*")):
+            name = path.name
+            for suffix in SIDECAR_SUFFIXES.values():
+                name = name[: -len(suffix)] if name.endswith(suffix) else name
+            if name not in names:
+                logger.info(f"remove archive page: {path}")
+                path.unlink()
+
+    def _to_datetimes(
+        self,
+        config: Config,
+        programs: Iterable[Dict[str, Any]],
+    ) -> Dict[ObjectId, Optional[dt.datetime]]:
+        """Maps ids of light documents of programs in the order of the feed to
+        their datetimes, removing duplicates if `config.remove_duplicates`."""
+        return {
+            program_id: program.datetime
+            for program, program_id in self._to_sorted_pairs(config, programs)
+        }
+
+    def _plan_archive_pages(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        program_ids: List[ObjectId],
+        prev_state: Dict[str, Any],
+        pretty: bool,
+    ) -> Tuple[List[ArchivePage], Dict[str, Any], List[ArchivePage]]:
+        """Paginates programs given from the oldest into archive pages.
+
+        Pages completed before are kept as stored in `prev_state`, and programs
+        not archived yet are appended to new pages, unless fields of the config
+        deciding the pages were edited.
+
+        Returns:
+            tuple: All archive pages, the state of the archive to be stored in
+                `feeder.feeds`, and pages whose contents changed since
+                `prev_state` or whose files are missing.
+        """
+        pagination_hash = config.to_pagination_hash()
+        completed = []
+        if prev_state.get("pagination_hash") == pagination_hash:
+            completed = prev_state.get("pages", [])
+        pages = paginate(program_ids, config.page_size, completed)
+        prev_keys = prev_state.get("keys", [])
+        salt = dict(
+            config_hash=config.to_hash(),
+            base_url=self._base_url,
+            media_root=str(self._media_root),
+            pretty=pretty,
+        )
+        keys = []
+        changed_pages = []
+        for page in pages:
+            keys.append(page.to_key(salt))
+            path = self._archive_root(config_id) / page.name
+            if page.number <= len(prev_keys) and prev_keys[page.number - 1] == keys[-1]:
+                if path.exists():
+                    continue
+            changed_pages.append(page)
+        state = dict(
+            pagination_hash=pagination_hash,
+            pages=[page.program_ids for page in pages],
+            keys=keys,
+        )
+        return pages, state, changed_pages
+
+    def _plan_head_feed(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        program_ids: List[ObjectId],
+        pages: List[ArchivePage],
+    ) -> Tuple[List[ObjectId], Dict[str, str]]:
+        """Returns ids of programs in the head feed of a paged feed and its links."""
+        links = {}
+        if pages:
+            archive_path = self._archive_root(config_id) / pages[-1].name
+            links["prev-archive"] = self._rss_url(archive_path)
+        # programs not archived, which may be older ones recorded after their pages
+        # were completed, are always in the head feed
+        archived = {program_id for page in pages for program_id in page.program_ids}
+        remaining = {x for x in program_ids if x not in archived}
+        start = len(program_ids) - max(
+            config.max_items or config.page_size, len(remaining)
+        )
+        head_program_ids = [
+            program_id
+            for i, program_id in enumerate(program_ids)
+            if i >= start or program_id in remaining
+        ]
+        return head_program_ids, links
+
+    def _save_rss_feed(
+        self,
+        config_id: Union[str, ObjectId],
+        write_feed: Callable[[BinaryIO], int],
+    ) -> Optional[Dict[str, Any]]:
+        """Writes RSS feed by `write_feed` returning the number of items.
+
+        The feed is rendered to a temporary file, and it replaces the existing feed
+        atomically only if the content changed.
+
+        Returns:
+            dict: Hash, size, number of items and last changed time of the feed
+                with whether it was changed, or None if the feed has no items.
+        """
+        rss_feed_path = self._rss_feed_path(config_id)
+        with ChangedFileWriter(rss_feed_path) as f:
+            num_items = write_feed(f)
+            if num_items == 0:
+                f.discard()
+        if num_items == 0:
+            logger.info("find no programs. RSS feed is not created")
+            return None
+
+        if f.changed:
+            logger.info(f"save RSS feed of {num_items} item(s) to {rss_feed_path}")
+        else:
+            logger.info(f"RSS feed is unchanged: {rss_feed_path}")
+        write_sidecars(rss_feed_path, self._sidecars)
+        # the file is replaced only if changed, so its mtime is the last changed time
+        return dict(
+            sha256=f.sha256,
+            size=f.size,
+            num_items=num_items,
+            last_changed=dt.datetime.fromtimestamp(rss_feed_path.stat().st_mtime),
+            changed=f.changed,
+        )
+
+    def _to_num_programs(self, states: Iterable[Dict[str, Any]]) -> Dict[Any, int]:
+        """Returns the number of programs at the last update of each feed in
+        `states` of `feeder.feeds`."""
+        return {
+            state["_id"]: state["fingerprint"]["num_programs"]
+            for state in states
+            if "fingerprint" in state
+        }
+
+    def _order_configs(
+        self, configs: Dict[Any, Dict[str, Any]], num_programs: Dict[Any, int]
+    ) -> List[Dict[str, Any]]:
+        """Orders configs to schedule feeds expected to be longest first by the
+        number of programs at the last update, and feeds never built before come
+        first of all."""
+        config_ids = sorted(
+            configs,
+            key=lambda x: num_programs.get(x, float("inf")),
+            reverse=True,
+        )
+        return [configs[config_id] for config_id in config_ids]
+
+    def _collect_results(
+        self,
+        configs: Dict[Any, Dict[str, Any]],
+        results: Iterable[UpdateResult],
+    ) -> Tuple[List[Config], List[UpdateResult]]:
+        """Returns configs of updated feeds and failed results, logging errors."""
+        ret = []
+        errors = []
+        for result in results:
+            if result.error is not None:
+                errors.append(result)
+            elif result.updated and result.config_id in configs:
+                # NOTE: configs claimed from the work queue may be registered
+                # after `configs` were loaded
+                ret.append(Config.from_dict(dict(configs[result.config_id])))
+        for result in errors:
+            logger.error(
+                f"failed to update RSS feed {result.config_id}: {result.error}"
+            )
+        return ret, errors
+
+    def _to_manifest_feeds(
+        self, states: Iterable[Dict[str, Any]]
+    ) -> Dict[str, Dict[str, Any]]:
+        feeds = {}
+        for state in states:
+            output = dict(state["output"])
+            output["last_changed"] = output["last_changed"].isoformat()
+            if state.get("archive"):
+                output["archive_pages"] = len(state["archive"]["keys"])
+            feeds[self._rss_feed_path(state["_id"]).name] = output
+        return feeds
+
+
+class Feeder(_BaseFeeder):
+    def __init__(
+        self,
+        base_url: str = "http://localhost",
+        rss_feed_root: Union[str, Path] = ".",
+        media_root: Union[str, Path] = ".",
+        feeder_database_host: Optional[str] = None,
+        recorder_database_host: Optional[str] = None,
+        backend: str = "feedgen",
+        sidecars: Sequence[str] = (),
+        ensure_indexes: bool = False,
+        use_search_index: bool = True,
+        metrics_dir: Optional[Union[str, Path]] = None,
+        use_item_store: bool = True,
+        connection_options: Optional[ConnectionOptions] = None,
+    ) -> None:
+        """
+        Args:
+            backend (str): Writer of RSS feeds. "feedgen" builds the whole feed by
+                `PodcastRssFeedGenCreator`, and "stream" writes items one by one from
+                a sorted cursor by `PodcastRssStreamWriter`.
+            sidecars (list of str): Encodings of precompressed feeds written
+                alongside each feed, "gzip" (`.xml.gz`) and/or "br" (`.xml.br`).
+            ensure_indexes (bool): If True, create indexes used by the feeder at
+                startup. See `Feeder.ensure_indexes`.
+            use_search_index (bool): If True, resolve `words` of queries by the
+                normalized n-gram `SearchIndex` instead of `$regex`.
+            metrics_dir (str or `Path`): If given, time stages of each run of
+                `Feeder.update_feeds` and write a JSON run report and a Prometheus
+                textfile to the directory. See `metrics.Metrics`.
+            use_item_store (bool): If True, reuse items and their XML fragments
+                stored in `feeder.items` across feeds and runs. See `ItemStore`.
+            connection_options (`ConnectionOptions`): Options of MongoDB clients,
+                which are shared by both databases on the same host, and of
+                queries of recorded programs. Defaults to
+                `ConnectionOptions.from_env()`.
+        """
+        super().__init__(
+            base_url=base_url,
+            rss_feed_root=rss_feed_root,
+            media_root=media_root,
+            backend=backend,
+            sidecars=sidecars,
+            use_search_index=use_search_index,
+        )
+        self._feeder_database_host = feeder_database_host
+        self._recorder_database_host = recorder_database_host
+        self._metrics_dir = Path(metrics_dir) if metrics_dir else None
+        self._connection_options = connection_options or ConnectionOptions.from_env()
+        self._batch_size = self._connection_options.batch_size
+
+        self._feeder_database = FeederDatabase(
+            feeder_database_host, self._connection_options
+        )
+        self._recorder_database = RecorderDatabase(
+            recorder_database_host, self._connection_options
+        )
+        self._media_cache = MediaProbeCache(self._feeder_database.media_probes)
+        self._search_index = SearchIndex(self._feeder_database.search_index)
+        self._use_item_store = use_item_store
+        # whether configs registered by older versions have been given hashes
+        self._configs_migrated = False
+        if use_item_store:
+            self._item_store = ItemStore(
+                self._feeder_database.items,
+                self._base_url,
+                self._media_root,
+                media_cache=self._media_cache,
+                media_index=self._media_index,
+            )
+        if ensure_indexes:
+            self.ensure_indexes()
 
     @property
     def feeder_db(self) -> FeederDatabase:
@@ -48,84 +755,1031 @@ class Feeder:
         self.close()
 
     def close(self) -> None:
+        self._flush_caches()
         self.feeder_db.close()
         self.recorder_db.close()
 
-    def _update_timestamp(self, name: str) -> None:
-        timestamp = dt.datetime.now()
-        self.feeder_db.timestamp.update_one(
-            {"name": name}, {"$set": {"datetime": timestamp}}, upsert=True
+    def _flush_caches(self) -> None:
+        self._media_cache.flush()
+        if self._item_store is not None:
+            self._item_store.flush()
+
+    def _worker_kwargs(self) -> Dict[str, Any]:
+        """Returns kwargs to create an equivalent Feeder in worker processes."""
+        return dict(
+            base_url=self._base_url,
+            rss_feed_root=self._rss_feed_root,
+            media_root=self._media_root,
+            feeder_database_host=self._feeder_database_host,
+            recorder_database_host=self._recorder_database_host,
+            backend=self._backend,
+            sidecars=self._sidecars,
+            use_search_index=self._use_search_index,
+            metrics_dir=self._metrics_dir,
+            use_item_store=self._use_item_store,
+            connection_options=self._connection_options,
+        )
+
+    def update_search_index(self, rebuild: bool = False) -> int:
+        """Indexes recorded programs for search incrementally by `SearchIndex`.
+
+        Returns:
+            int: Number of indexed programs.
+        """
+        return self._search_index.update(
+            self.recorder_db.recorded_programs, rebuild=rebuild
         )
 
+    def _to_mongo_query(self, query: Query) -> Dict[str, Any]:
+        words_condition = None
+        if self._use_search_index and query.words:
+            words_condition = self._search_index.to_words_condition(query.words)
+        return query.to_mongo_format(words_condition=words_condition)
+
+    def _poll_recorder(self) -> Tuple[Any, ...]:
+        """Returns the latest `_id` and the count of recorded programs cheaply."""
+        collection = self.recorder_db.recorded_programs
+        latest = collection.find_one({}, ["_id"], sort=[("_id", pymongo.DESCENDING)])
+        latest_id = latest["_id"] if latest else None
+        # NOTE: the count catches deleted programs
+        return latest_id, collection.estimated_document_count()
+
+    def _find_programs_summary(self, config: Config) -> Dict[str, Any]:
+        """Summarizes programs matched by the config with one cheap aggregation.
+
+        The count catches deleted programs and the max `_id` / `datetime` catch
+        newly recorded ones, without transferring any program documents.
+        """
+        pipeline = _summary_pipeline(self._to_mongo_query(config.query))
+        with metrics.stage("program_query"):
+            summary = next(self.recorder_db.recorded_programs.aggregate(pipeline), None)
+        return _to_summary(summary)
+
+    def ensure_indexes(self) -> None:
+        """Creates indexes of recorded programs and configs if they are missing."""
+        ensure_collection_indexes(
+            self.recorder_db.recorded_programs, RECORDED_PROGRAM_INDEXES
+        )
+        self._ensure_config_indexes()
+
+    def _ensure_config_indexes(self) -> None:
+        ensure_collection_indexes(self.feeder_db.configs, CONFIG_INDEXES)
+        self._migrate_configs()
+        self._configs_migrated = True
+
+    def _migrate_configs(self) -> int:
+        """Stores `config_hash` in configs registered by older versions.
+
+        Returns:
+            int: Number of migrated configs.
+        """
+        collection = self.feeder_db.configs
+        requests = []
+        config_ids = []
+        for data in collection.find({"config_hash": {"$exists": False}}):
+            try:
+                config_hash = Config.from_dict(dict(data)).to_hash()
+            except Exception as err:
+                logger.warning(f"failed to load config {data['_id']}: {err}")
+                continue
+            requests.append(
+                pymongo.UpdateOne(
+                    {"_id": data["_id"], "config_hash": {"$exists": False}},
+                    {"$set": {"config_hash": config_hash}},
+                )
+            )
+            config_ids.append(data["_id"])
+        if not requests:
+            return 0
+        try:
+            ret = collection.bulk_write(requests, ordered=False).modified_count
+        except pymongo.errors.BulkWriteError as err:
+            errors = err.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY_CODE for error in errors):
+                raise
+            # the same config registered twice keeps only one hash
+            ret = err.details["nModified"]
+            logger.warning(
+                "skip config(s) registered by other ids: "
+                + ", ".join(str(config_ids[error["index"]]) for error in errors)
+            )
+        logger.info(f"store hashes of {ret} config(s) registered by older versions")
+        return ret
+
+    def explain_config(self, config_id: Union[str, ObjectId]) -> Dict[str, Any]:
+        """Explains the query of the config to find its programs.
+
+        Returns:
+            dict: Summary of the execution by `summarize_explain`.
+        """
+        if isinstance(config_id, str) and ObjectId.is_valid(config_id):
+            config_id = ObjectId(config_id)
+        data = self.feeder_db.configs.find_one({"_id": config_id})
+        if data is None:
+            raise ValueError(f"config is not registered: {config_id}")
+        query = self._to_mongo_query(Config.from_dict(data).query)
+        explain = self.recorder_db.recorded_programs.find(query).explain()
+        return summarize_explain(explain)
+
     def register_config(self, config: Config) -> None:
-        config = config.to_dict(serialize=True, unserialized_types=[dt.datetime])
-        res = self.feeder_db.configs.update_one(config, {"$set": config}, upsert=True)
-        if res.upserted_id is not None:
-            logger.debug(f"registered config: {res.upserted_id}\n{config}")
+        self.register_configs([config])
+
+    def register_configs(
+        self, configs: Iterable[Union[Config, Dict[str, Any]]]
+    ) -> RegisterResult:
+        """Registers configs with one bulk write keyed by their content hashes.
+
+        Configs are matched with registered ones by `Config.to_hash` stored in
+        the indexed `config_hash` field, so registering the same config again
+        leaves it unchanged. A document with `_id`, e.g. loaded by
+        `load_config_documents`, replaces the registered config of the id.
+        Matched configs whose stored documents differ are rewritten. Configs
+        registered by older versions without `config_hash` are given it once per
+        feeder, or by `Feeder.ensure_indexes`. A document with `_id`
+        whose config is registered by another id is not written, since
+        `config_hash` is unique.
+
+        Args:
+            configs (list of `Config` or dict): Configs or their documents.
+
+        Returns:
+            `RegisterResult`: Ids of inserted, updated, unchanged and duplicated
+                configs.
+        """
+        collection = self.feeder_db.configs
+        if not self._configs_migrated:
+            self._ensure_config_indexes()
+
+        documents = {}
+        for config in configs:
+            config_id = None
+            if isinstance(config, dict):
+                config_id = config.get("_id")
+                if isinstance(config_id, str) and ObjectId.is_valid(config_id):
+                    config_id = ObjectId(config_id)
+                config = Config.from_dict(dict(config))
+            document = config.to_dict(serialize=True, unserialized_types=[dt.datetime])
+            document["config_hash"] = config.to_hash()
+            if config_id is not None:
+                document["_id"] = config_id
+            documents[config_id or document["config_hash"]] = document
+
+        config_ids = [doc["_id"] for doc in documents.values() if "_id" in doc]
+        config_hashes = [doc["config_hash"] for doc in documents.values()]
+        registered = collection.find(
+            {
+                "$or": [
+                    {"_id": {"$in": config_ids}},
+                    {"config_hash": {"$in": config_hashes}},
+                ]
+            }
+        )
+        registered_by_id = {}
+        registered_by_hash = {}
+        for data in registered:
+            registered_by_id[data["_id"]] = data
+            if "config_hash" in data:
+                registered_by_hash.setdefault(data["config_hash"], data)
+
+        ret = RegisterResult()
+        requests = []
+        # ids of configs replaced by the requests, or None if inserted by hashes
+        request_ids: List[Optional[ObjectId]] = []
+        request_hashes: List[str] = []
+        for key, document in documents.items():
+            if "_id" in document:
+                current = registered_by_id.get(key)
+            else:
+                current = registered_by_hash.get(key)
+            if current is None and "_id" in document:
+                requests.append(pymongo.ReplaceOne({"_id": key}, document, upsert=True))
+                request_ids.append(key)
+            elif current is None:
+                requests.append(
+                    pymongo.UpdateOne(
+                        {"config_hash": key}, {"$setOnInsert": document}, upsert=True
+                    )
+                )
+                request_ids.append(None)
+            elif current == dict(document, _id=current["_id"]):
+                ret.unchanged.append(current["_id"])
+                continue
+            else:
+                document = dict(document, _id=current["_id"])
+                requests.append(pymongo.ReplaceOne({"_id": current["_id"]}, document))
+                request_ids.append(current["_id"])
+            request_hashes.append(document["config_hash"])
+
+        if requests:
+            try:
+                res = collection.bulk_write(requests, ordered=False)
+                upserted_ids, failed = res.upserted_ids, set()
+            except pymongo.errors.BulkWriteError as err:
+                errors = err.details["writeErrors"]
+                if any(error["code"] != DUPLICATE_KEY_CODE for error in errors):
+                    raise
+                upserted_ids = {x["index"]: x["_id"] for x in err.details["upserted"]}
+                failed = {error["index"] for error in errors}
+            ret.inserted = [upserted_ids[i] for i in sorted(upserted_ids)]
+            for i, config_id in enumerate(request_ids):
+                if i in failed and config_id is None:
+                    # another registration of the same config won the race
+                    config_hash = request_hashes[i]
+                    winner = collection.find_one({"config_hash": config_hash}, ["_id"])
+                    ret.duplicated.append(winner["_id"] if winner else config_hash)
+                elif i in failed:
+                    ret.duplicated.append(config_id)
+                elif i not in upserted_ids and config_id is not None:
+                    ret.updated.append(config_id)
+        if ret.duplicated:
+            logger.warning(
+                "skip config(s) registered by other ids: "
+                + ", ".join(str(config_id) for config_id in ret.duplicated)
+            )
+        logger.info(
+            f"register {len(documents)} config(s): {len(ret.inserted)} inserted, "
+            f"{len(ret.updated)} updated, {len(ret.unchanged)} unchanged"
+        )
+        return ret
+
+    def _resolve_sort_by(self, config: Config, query: Dict[str, Any]) -> str:
+        if config.sort_by is not None:
+            return _resolve_sort_by(config.sort_by, [], None)
+        collection = self.recorder_db.recorded_programs
+        with metrics.stage("program_query"):
+            platform_ids = collection.distinct("platform_id", query)
+            station_ids = collection.distinct("station_id", query)
+        return _resolve_sort_by(
+            None, station_ids, platform_ids[0] if platform_ids else None
+        )
+
+    def _aggregate_programs(
+        self,
+        query: Dict[str, Any],
+        sort_by: str,
+        descending: bool,
+        remove_duplicates: bool,
+        limit: Optional[int] = None,
+        limit_latest: bool = False,
+    ) -> Optional[Iterator[Dict[str, Any]]]:
+        """Streams programs sorted and deduplicated by `to_feed_pipeline`.
+
+        Returns:
+            iterator: Programs in the order of the feed, or None if the server
+                does not support the pipeline and programs have to be sorted in
+                Python.
+        """
+        if not self._use_pipeline:
+            return None
+        pipeline = to_feed_pipeline(
+            query,
+            sort_by,
+            descending,
+            remove_duplicates,
+            limit=limit,
+            limit_latest=limit_latest,
+        )
+        try:
+            with metrics.stage("program_query"):
+                programs = self.recorder_db.recorded_programs.aggregate(
+                    pipeline, allowDiskUse=True, batchSize=self._batch_size or None
+                )
+        except Exception as err:
+            if not is_pipeline_unsupported(err):
+                raise
+            self._disable_pipeline(err)
+            return None
+        return metrics.timed(programs, "program_query")
+
+    def _find_latest_pairs(
+        self, config: Config, query: Dict[str, Any], sort_by: str, max_items: int
+    ) -> List[Tuple[ProgramView, ObjectId]]:
+        """Finds the latest `max_items` programs with the limit pushed to MongoDB.
+
+        Programs are fetched from the latest, and the limit is doubled while
+        duplicates leave fewer than `max_items` programs, unless duplicates are
+        removed by the pipeline. They are returned in the order of the feed, i.e.
+        from the oldest if `config.from_oldest`.
+        """
+        programs = self._aggregate_programs(
+            query,
+            sort_by,
+            not config.from_oldest,
+            config.remove_duplicates,
+            limit=max_items,
+            limit_latest=True,
+        )
+        if programs is not None:
+            ret = list(self._to_pairs(programs))
+            return ret[::-1] if config.from_oldest else ret
+
+        collection = self.recorder_db.recorded_programs
+        limit = max_items
+        while True:
+            programs = collection.find(
+                query,
+                PROGRAM_FIELDS,
+                sort=self._latest_sort(config, sort_by),
+                limit=limit,
+                allow_disk_use=True,
+                batch_size=self._batch_size,
+            )
+            programs = list(metrics.timed(programs, "program_query"))
+            ret = self._to_latest_pairs(config, programs, limit, max_items)
+            if ret is not None:
+                return ret
+            limit *= 2
+
+    def _write_feed_feedgen(
+        self,
+        config: Config,
+        query: Dict[str, Any],
+        f: BinaryIO,
+        pretty: bool,
+        last_build_date: str,
+    ) -> int:
+        sort_by = config.sort_by
+        remove_duplicates = config.remove_duplicates
+        programs = None
+        if config.max_items:
+            sort_by = self._resolve_sort_by(config, query)
+            program_and_id_pairs = self._find_latest_pairs(
+                config, query, sort_by, config.max_items
+            )
+        elif self._use_pipeline:
+            programs = self._aggregate_programs(
+                query,
+                self._resolve_sort_by(config, query),
+                not config.from_oldest,
+                remove_duplicates,
+            )
+        if programs is not None:
+            program_and_id_pairs = list(self._to_pairs(programs))
+        elif not config.max_items:
+            # fetch only fields to create RSS feed, and wrap them by lightweight
+            # views instead of converting all documents to `Program`
+            programs = self.recorder_db.recorded_programs.find(
+                query, PROGRAM_FIELDS, batch_size=self._batch_size
+            )
+            programs = metrics.timed(programs, "program_query")
+            program_and_id_pairs = list(self._to_pairs(programs))
+            return self._render_feedgen(
+                f,
+                config,
+                program_and_id_pairs,
+                sort_by,
+                remove_duplicates,
+                pretty,
+                last_build_date,
+            )
+        # programs are already sorted and deduplicated
+        return self._render_feedgen(
+            f,
+            config,
+            program_and_id_pairs,
+            sort_by,
+            False,
+            pretty,
+            last_build_date,
+            presorted=True,
+        )
+
+    def _find_latest_program(
+        self, query: Dict[str, Any], sort_by: str
+    ) -> Optional[ProgramView]:
+        with metrics.stage("program_query"):
+            program = self.recorder_db.recorded_programs.find_one(
+                query,
+                PROGRAM_FIELDS,
+                sort=[(sort_by, pymongo.DESCENDING), ("_id", pymongo.DESCENDING)],
+            )
+        return ProgramView(program) if program else None
+
+    def _write_feed_stream(
+        self,
+        config: Config,
+        query: Dict[str, Any],
+        f: BinaryIO,
+        pretty: bool,
+        last_build_date: str,
+    ) -> int:
+        sort_by = self._resolve_sort_by(config, query)
+        programs = None
+        if config.max_items:
+            program_and_id_pairs = iter(
+                self._find_latest_pairs(config, query, sort_by, config.max_items)
+            )
+        else:
+            programs = self._aggregate_programs(
+                query, sort_by, not config.from_oldest, config.remove_duplicates
+            )
+        if programs is not None:
+            program_and_id_pairs = self._to_pairs(programs)
+        elif not config.max_items:
+            # sort programs in the same order as `PodcastRssFeedGenCreator.create`,
+            # in which programs with the same sort key are ordered by id
+            direction = pymongo.ASCENDING if config.from_oldest else pymongo.DESCENDING
+            programs = self.recorder_db.recorded_programs.find(
+                query,
+                PROGRAM_FIELDS,
+                sort=[(sort_by, direction), ("_id", pymongo.ASCENDING)],
+                allow_disk_use=True,
+                batch_size=self._batch_size,
+            )
+            program_and_id_pairs = self._to_sorted_pairs(
+                config, metrics.timed(programs, "program_query")
+            )
+        return self._render_stream_feed(
+            f,
+            config,
+            program_and_id_pairs,
+            lambda: self._find_latest_program(query, sort_by),
+            pretty,
+            last_build_date,
+        )
+
+    def _find_programs_by_ids(
+        self, program_ids: List[ObjectId]
+    ) -> Dict[ObjectId, Dict[str, Any]]:
+        programs = self.recorder_db.recorded_programs.find(
+            {"_id": {"$in": program_ids}}, PROGRAM_FIELDS, batch_size=self._batch_size
+        )
+        return {
+            program["_id"]: program
+            for program in metrics.timed(programs, "program_query")
+        }
+
+    def _write_feed_paged(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        query: Dict[str, Any],
+        f: BinaryIO,
+        pretty: bool,
+        last_build_date: str,
+    ) -> int:
+        """Writes the head feed of the latest items and archive pages (RFC 5005).
+
+        Programs are paginated by their light documents sorted in MongoDB, and
+        only archive pages whose programs or links changed are rendered again.
+        """
+        collection = self.recorder_db.recorded_programs
+        sort_by = self._resolve_sort_by(config, query)
+        direction = pymongo.ASCENDING if config.from_oldest else pymongo.DESCENDING
+        programs = collection.find(
+            query,
+            list({sort_by, "datetime", "episode_id"}),
+            sort=[(sort_by, direction), ("_id", pymongo.ASCENDING)],
+            allow_disk_use=True,
+            batch_size=self._batch_size,
+        )
+        datetimes = self._to_datetimes(config, metrics.timed(programs, "program_query"))
+        if not datetimes:
+            self._remove_archive_pages(config_id)
+            return 0
+        # from the oldest
+        program_ids = list(datetimes)
+        if not config.from_oldest:
+            program_ids.reverse()
+
+        channel = config.channel
+        if not channel:
+            channel = PodcastChannel.from_program(
+                ProgramView(
+                    collection.find_one({"_id": program_ids[-1]}, PROGRAM_FIELDS)
+                )
+            )
+
+        # write archive pages whose contents changed
+        state = self.feeder_db.feeds.find_one({"_id": config_id}, ["archive"]) or {}
+        pages, archive_state, changed_pages = self._plan_archive_pages(
+            config, config_id, program_ids, state.get("archive", {}), pretty
+        )
+        for page in changed_pages:
+            self._write_archive_page(
+                config,
+                config_id,
+                channel,
+                page,
+                datetimes,
+                self._find_programs_by_ids(page.program_ids),
+                pretty,
+            )
+        self._remove_archive_pages(config_id, len(pages))
+        self.feeder_db.feeds.update_one(
+            {"_id": config_id}, {"$set": {"archive": archive_state}}, upsert=True
+        )
+
+        # write the head feed of the latest items
+        head_program_ids, links = self._plan_head_feed(
+            config, config_id, program_ids, pages
+        )
+        return self._render_programs(
+            f,
+            config,
+            channel,
+            head_program_ids,
+            self._find_programs_by_ids(head_program_ids),
+            pretty,
+            last_build_date,
+            links,
+        )
+
+    def _write_feed(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        query: Dict[str, Any],
+        f: BinaryIO,
+        pretty: bool,
+        last_build_date: str,
+    ) -> int:
+        if config.page_size:
+            return self._write_feed_paged(
+                config, config_id, query, f, pretty, last_build_date
+            )
+        if self._backend == "stream":
+            return self._write_feed_stream(config, query, f, pretty, last_build_date)
+        return self._write_feed_feedgen(config, query, f, pretty, last_build_date)
+
+    def render_feed(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        pretty: bool = True,
+        summary: Optional[Dict[str, Any]] = None,
+    ) -> Optional[bytes]:
+        """Renders RSS feed of the config to bytes without writing the feed file.
+
+        Archive pages of a paged config are written as `update_feed` does.
+
+        Args:
+            summary (dict): Summary of the programs by `_find_programs_summary`.
+
+        Returns:
+            bytes: Content of the feed, or None if the feed has no items.
+        """
+        if summary is None:
+            summary = self._find_programs_summary(config)
+        query = self._to_mongo_query(config.query)
+        last_build_date = _datetime_to_pub_data(
+            summary["max_datetime"] or dt.datetime.min
+        )
+        f = io.BytesIO()
+        num_items = self._write_feed(
+            config, config_id, query, f, pretty, last_build_date
+        )
+        self._flush_caches()
+        return f.getvalue() if num_items else None
 
     def update_feed(
         self,
         config: Config,
         config_id: Union[str, ObjectId],
         pretty: bool = True,
-    ) -> None:
+        program_ids: Optional[List[ObjectId]] = None,
+        last_datetime: Optional[dt.datetime] = None,
+    ) -> bool:
+        """Updates RSS feed of the config.
+
+        The feed is rendered to a temporary file, and it replaces the existing feed
+        atomically only if the content changed. The hash, size, number of items and
+        last changed time of the feed are stored in `feeder.feeds` for the manifest.
+
+        Args:
+            program_ids (list of `ObjectId`): Ids of programs matched by the config.
+                If None, programs are queried by the config.
+            last_datetime (`dt.datetime`): Datetime of the latest program, which is
+                used as `lastBuildDate` so that unchanged feeds have the same content.
+
+        Returns:
+            bool: Whether the RSS feed file was changed or not.
+        """
         # fetch specified recorded programs
         logger.debug(f"update RSS feed: {config}")
-        query = config.query.to_mongo_format()
-        programs = self.recorder_db.recorded_programs.find(query)
-        program_and_id_pairs = [
-            (Program.from_dict(program), program["_id"]) for program in programs
-        ]
-        if len(program_and_id_pairs) == 0:
-            logger.info("find no programs. RSS feed is not created")
-            return
-        logger.info(f"fetch {len(program_and_id_pairs)} program(s)")
+        if program_ids is None:
+            query = self._to_mongo_query(config.query)
+        else:
+            query = {"_id": {"$in": program_ids}}
+        if last_datetime is None:
+            last_datetime = self._find_programs_summary(config)["max_datetime"]
+        last_build_date = _datetime_to_pub_data(last_datetime or dt.datetime.min)
 
-        # create FeedGenerator
-        feed_generator = PodcastRssFeedGenCreator(
-            self._base_url,
-            self._media_root,
-        ).create(
-            program_and_id_pairs,
-            channel=config.channel,
-            sort_by=config.sort_by,
-            from_oldest=config.from_oldest,
-            remove_duplicates=config.remove_duplicates,
+        # save RSS feed file
+        def write_feed(f: BinaryIO) -> int:
+            return self._write_feed(
+                config, config_id, query, f, pretty, last_build_date
+            )
+
+        output = self._save_rss_feed(config_id, write_feed)
+        if not config.page_size and self._archive_root(config_id).exists():
+            # forget archive pages of the config written before
+            self._remove_archive_pages(config_id)
+            self.feeder_db.feeds.update_one(
+                {"_id": config_id}, {"$unset": {"archive": ""}}
+            )
+        self._flush_caches()
+        if output is None:
+            return False
+
+        changed = output.pop("changed")
+        self.feeder_db.feeds.update_one(
+            {"_id": config_id},
+            {"$set": {f"output.{key}": value for key, value in output.items()}},
+            upsert=True,
         )
+        return changed
 
-        # save RSS feed file
-        rss_feed_path = self._rss_feed_root / f"{str(config_id)}.xml"
-        rss_feed_path.parent.mkdir(exist_ok=True)
-        feed_generator.rss_file(rss_feed_path, pretty=pretty)
-        logger.info(f"save RSS feed to {rss_feed_path}")
+    def _write_manifest(self) -> None:
+        states = self.feeder_db.feeds.find({"output": {"$exists": True}})
+        write_manifest(
+            self._rss_feed_root / "manifest.json", self._to_manifest_feeds(states)
+        )
 
-    def update_feeds(self, force_update: bool = False) -> List[Config]:
-        last_timestamp = self.feeder_db.timestamp.find_one({"name": "update_feeds"})
-        if last_timestamp:
-            last_timestamp = last_timestamp["datetime"]
+    def update_feed_if_changed(
+        self,
+        config: Config,
+        config_id: Union[str, ObjectId],
+        pretty: bool = True,
+        force_update: bool = False,
+        match: Optional[ProgramMatch] = None,
+    ) -> bool:
+        """Updates RSS feed only if its fingerprint differs from the last update.
 
-        configs = list(self.feeder_db.configs.find({}))
-        ret = []
-        for config in tqdm.tqdm(configs):
-            config_id = config.pop("_id")
-            config: Config = Config.from_dict(config)
-            if isinstance(config.query.datetime_range, list):
-                last_datetime = config.query.datetime_range[1]
-                if (
-                    last_datetime < (last_timestamp or last_datetime)
-                    and not force_update
-                    and (self._rss_feed_root / f"{str(config_id)}.xml").exists()
-                ):
-                    logger.debug(
-                        f"skip updates to RSS feed of completed channels: {config.query}"
-                    )
-                    continue
+        The fingerprint consists of the config hash, the summary of the matched
+        programs and the rendering options, and it is stored in `feeder.feeds`.
+        If `match` is given, e.g. by `ProgramSnapshot`, the programs are not
+        queried by the config.
+        """
+        # NOTE: the summary is taken before fetching programs, so programs recorded
+        # in between only make the next run rebuild the feed once more.
+        if match is None:
+            summary = self._find_programs_summary(config)
+        else:
+            summary = match.summary
+        fingerprint = self._create_fingerprint(config, summary, pretty)
+        state = self.feeder_db.feeds.find_one({"_id": config_id})
+        if (
+            not force_update
+            and state
+            and state.get("fingerprint") == fingerprint
+            and self._rss_feed_path(config_id).exists()
+        ):
+            logger.debug(f"skip updates to unchanged RSS feed: {config_id}")
+            return False
+
+        updated = self.update_feed(
+            config,
+            config_id,
+            pretty=pretty,
+            program_ids=match.program_ids if match else None,
+            last_datetime=summary["max_datetime"],
+        )
+        self.feeder_db.feeds.update_one(
+            {"_id": config_id},
+            {"$set": {"fingerprint": fingerprint, "updated_at": dt.datetime.now()}},
+            upsert=True,
+        )
+        return updated
+
+    def _update_feed_from_dict(
+        self,
+        config: Dict[str, Any],
+        pretty: bool = True,
+        force_update: bool = False,
+        match: Optional[ProgramMatch] = None,
+    ) -> UpdateResult:
+        config = dict(config)
+        config_id = config.pop("_id")
+        with metrics.feed(config_id):
             try:
-                self.update_feed(config, config_id)
-                ret.append(config)
+                with metrics.stage("config_load"):
+                    feed_config = Config.from_dict(config)
+                updated = self.update_feed_if_changed(
+                    feed_config,
+                    config_id,
+                    pretty=pretty,
+                    force_update=force_update,
+                    match=match,
+                )
+                return UpdateResult(config_id, updated=updated)
             except Exception as err:
                 logger.error(f"error: {err}\n{config}", stack_info=True)
+                return UpdateResult(config_id, error=str(err))
+
+    def _match_programs(
+        self, configs: Dict[Any, Dict[str, Any]]
+    ) -> Dict[Any, ProgramMatch]:
+        """Matches programs of all configs with one scan of recorded programs."""
+        # NOTE: numpy is imported only by this engine
+        from .matcher import ProgramSnapshot
+
+        snapshot = ProgramSnapshot.from_collection(
+            self.recorder_db.recorded_programs,
+            normalize_words=self._use_search_index,
+        )
+        ret = {}
+        for config_id, config in configs.items():
+            try:
+                ret[config_id] = snapshot.match(Config.from_dict(dict(config)).query)
+            except Exception as err:
+                # fall back to query the programs by the config
+                logger.warning(f"failed to match programs of {config_id}: {err}")
+        return ret
+
+    def _match_programs_by_facet(
+        self, configs: Dict[Any, Dict[str, Any]], num_programs: Dict[Any, int]
+    ) -> Dict[Any, ProgramMatch]:
+        """Matches programs of configs with one `$facet` aggregation per chunk.
+
+        Chunks are sized by `num_programs` at the last update so that results are
+        expected to fit in `FACET_MAX_BYTES`, and a chunk whose result still
+        exceeds the document size limit is split in halves and retried. Configs
+        failed to be matched are left to be queried one by one.
+        """
+        queries = {}
+        for config_id, config in configs.items():
+            try:
+                query = Config.from_dict(dict(config)).query
+                queries[config_id] = self._to_mongo_query(query)
+            except Exception as err:
+                logger.warning(f"failed to match programs of {config_id}: {err}")
+        sizes = {
+            config_id: FACET_BRANCH_BYTES
+            + FACET_ID_BYTES * num_programs.get(config_id, 0)
+            for config_id in queries
+        }
+        chunks = _chunk_by_bytes(
+            list(queries), sizes, FACET_CHUNK_SIZE, FACET_MAX_BYTES
+        )
+
+        from .matcher import ProgramMatch
+
+        ret = {}
+        round_trips = 0
+        while chunks:
+            chunk = chunks.pop()
+            pipeline = to_facet_pipeline([queries[config_id] for config_id in chunk])
+            round_trips += 1
+            try:
+                with metrics.stage("program_query"):
+                    results = next(
+                        self.recorder_db.recorded_programs.aggregate(
+                            pipeline, allowDiskUse=True
+                        )
+                    )
+            except Exception as err:
+                if is_document_too_large(err) and len(chunk) > 1:
+                    logger.debug(f"split chunk of {len(chunk)} configs: {err}")
+                    half = len(chunk) // 2
+                    chunks += [chunk[half:], chunk[:half]]
+                else:
+                    logger.warning(
+                        f"failed to match programs of {len(chunk)} configs: {err}"
+                    )
+                continue
+            for i, config_id in enumerate(chunk):
+                groups = results[str(i)]
+                summary = _to_summary(groups[0] if groups else None)
+                ret[config_id] = ProgramMatch(
+                    program_ids=summary.pop("program_ids", []), summary=summary
+                )
+        logger.info(
+            f"match programs of {len(ret)} config(s) in {round_trips} round trip(s)"
+        )
+        return ret
+
+    def _update_feeds_in_pool(
+        self,
+        configs: List[Dict[str, Any]],
+        matches: Dict[Any, ProgramMatch],
+        pretty: bool,
+        force_update: bool,
+        jobs: int,
+    ) -> Iterator[UpdateResult]:
+        # NOTE: use spawn so that no MongoClient is inherited by fork.
+        # Each worker creates its own Feeder, whose databases share its own client.
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._worker_kwargs(), self._media_index),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _update_feed_in_worker,
+                    config,
+                    pretty,
+                    force_update,
+                    matches.get(config["_id"]),
+                )
+                for config in configs
+            ]
+            for future in _progress(as_completed(futures), total=len(futures)):
+                result = future.result()
+                run_metrics = metrics.active()
+                if run_metrics is not None and result.metrics is not None:
+                    run_metrics.merge_feed(str(result.config_id), result.metrics)
+                yield result
+
+    def _work_queue(
+        self, update: Callable[[Dict[str, Any]], UpdateResult]
+    ) -> Iterator[UpdateResult]:
+        """Updates feeds of configs claimed from the work queue until it is drained.
+
+        Leases of claimed configs are extended by a heartbeat while feeds are
+        built, and the result of each config is recorded in `feeder.queue`.
+        """
+        queue = WorkQueue(self.feeder_db.queue)
+        owner = create_owner_id()
+        with queue.heartbeat(owner):
+            while True:
+                lease = queue.claim(owner)
+                if lease is None:
+                    return
+                config = self.feeder_db.configs.find_one({"_id": lease.config_id})
+                if config is None:
+                    result = UpdateResult(lease.config_id, error="config is not found")
+                else:
+                    result = update(config)
+                queue.complete(lease, dict(updated=result.updated, error=result.error))
+                yield result
+
+    def _work_queue_in_pool(
+        self, pretty: bool, force_update: bool, jobs: int
+    ) -> Iterator[UpdateResult]:
+        # NOTE: each worker process claims configs by itself
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._worker_kwargs(), self._media_index),
+        ) as executor:
+            futures = [
+                executor.submit(_work_queue_in_worker, pretty, force_update)
+                for _ in range(jobs)
+            ]
+            for future in as_completed(futures):
+                for result in future.result():
+                    run_metrics = metrics.active()
+                    if run_metrics is not None and result.metrics is not None:
+                        run_metrics.merge_feed(str(result.config_id), result.metrics)
+                    yield result
+
+    def update_feeds(
+        self,
+        force_update: bool = False,
+        jobs: int = 1,
+        engine: str = "mongo",
+        pretty: bool = True,
+        use_queue: bool = False,
+    ) -> List[Config]:
+        """Updates RSS feeds of all registered configs.
+
+        Args:
+            force_update (bool): If True, rebuild feeds even if they are unchanged.
+            jobs (int): Number of worker processes to build feeds in parallel.
+            engine (str): How to match programs of configs. "mongo" queries them
+                config by config, "snapshot" matches all configs with one scan
+                by `ProgramSnapshot`, and "facet" matches chunks of configs with
+                one `$facet` aggregation per chunk.
+            pretty (bool): If False, write compact XML without indentation.
+            use_queue (bool): If True, enqueue all configs to the work queue in
+                `feeder.queue` and build feeds of configs claimed from it, so that
+                runs on many hosts share the work instead of duplicating it.
+                See `WorkQueue`.
 
-        self._update_timestamp("update_feeds")
-        logger.info(f"Finish updating {len(ret)} feeds")
+        Returns:
+            list of `Config`: Configs whose RSS feeds were updated by this run.
+        """
+        if self._metrics_dir is None:
+            return self._update_feeds(force_update, jobs, engine, pretty, use_queue)
+        with metrics.collect() as run_metrics:
+            ret = self._update_feeds(force_update, jobs, engine, pretty, use_queue)
+        run_metrics.write(self._metrics_dir)
+        return ret
+
+    def _update_feeds(
+        self,
+        force_update: bool,
+        jobs: int,
+        engine: str,
+        pretty: bool,
+        use_queue: bool,
+    ) -> List[Config]:
+        if use_queue and engine != "mongo":
+            raise ValueError(f"'{engine}' engine is not supported with the queue")
+        if self._item_store is not None:
+            # items of programs removed since the last run are not kept in memory
+            self._item_store.clear()
+        self._media_cache.clear()
+        with metrics.stage("config_load"):
+            configs = {
+                config["_id"]: config for config in self.feeder_db.configs.find({})
+            }
+        if self._use_search_index:
+            self.update_search_index()
+        with metrics.stage("media_probe"):
+            self._media_index.refresh()
+
+        states = self.feeder_db.feeds.find({}, {"fingerprint.num_programs": 1})
+        num_programs = self._to_num_programs(states)
+        ordered_configs = self._order_configs(configs, num_programs)
+
+        if engine == "snapshot":
+            matches = self._match_programs(configs)
+        elif engine == "facet":
+            matches = self._match_programs_by_facet(configs, num_programs)
+        elif engine == "mongo":
+            matches = {}
+        else:
+            raise ValueError(f"'{engine}' is not supported engine")
+
+        if use_queue:
+            queue = WorkQueue(self.feeder_db.queue)
+            queue.ensure_indexes()
+            queue.remove_missing(configs)
+            queue.enqueue(config["_id"] for config in ordered_configs)
+            if jobs > 1:
+                results = self._work_queue_in_pool(pretty, force_update, jobs)
+            else:
+                results = self._work_queue(
+                    lambda config: self._update_feed_from_dict(
+                        config, pretty=pretty, force_update=force_update
+                    )
+                )
+        elif jobs > 1:
+            results = self._update_feeds_in_pool(
+                ordered_configs, matches, pretty, force_update, jobs
+            )
+        else:
+            results = (
+                self._update_feed_from_dict(
+                    config,
+                    pretty=pretty,
+                    force_update=force_update,
+                    match=matches.get(config["_id"]),
+                )
+                for config in _progress(ordered_configs)
+            )
+
+        ret, errors = self._collect_results(configs, results)
+
+        # forget fingerprints of removed configs
+        self.feeder_db.feeds.delete_many({"_id": {"$nin": list(configs)}})
+        self._write_manifest()
+        self._media_index.log_report()
+        logger.info(f"Finish updating {len(ret)} feeds ({len(errors)} error(s))")
+        return ret
+
+    def warm_media_cache(self, evict: bool = False) -> int:
+        """Probes media files of all recorded programs into the media probe cache.
+
+        Args:
+            evict (bool): If True, remove probes whose media files no longer exist.
+
+        Returns:
+            int: Number of probed media files.
+        """
+        if evict:
+            self._media_cache.evict_missing()
+
+        projection = ["platform_id", "station_id", "is_video", "duration"]
+        programs = self.recorder_db.recorded_programs.find(
+            {}, projection, batch_size=self._batch_size
+        )
+        self._media_index.refresh()
+        ret = 0
+        programs = iter(_progress(programs))
+        while True:
+            chunk = list(itertools.islice(programs, PREFETCH_BATCH_SIZE))
+            if not chunk:
+                break
+            batch = []
+            for program in chunk:
+                try:
+                    media = self._media_index.find(
+                        program["platform_id"], program["station_id"], program["_id"]
+                    )
+                except FileNotFoundError:
+                    # e.g. media files of old recordings are pruned
+                    continue
+                batch.append((program, media))
+            self._media_cache.prefetch(media.path for _, media in batch)
+            for program, media in batch:
+                try:
+                    self._media_cache.probe(
+                        media.path,
+                        program.get("is_video", False),
+                        with_duration=not program.get("duration"),
+                        size=media.size,
+                        mtime=media.mtime,
+                    )
+                    ret += 1
+                except Exception as err:
+                    logger.error(f"failed to probe {media.path}: {err}")
+            # probes of all media files are not kept in memory
+            self._media_cache.clear()
+        self._media_index.log_report()
+        logger.info(f"Finish probing {ret} media file(s)")
         return ret
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from logging import getLogger
+from typing import Any, Dict, List
+
+import pymongo
+import pymongo.collection
+from pymongo import IndexModel
+
+logger = getLogger(__name__)
+
+# indexes of recorded programs for `Query.to_mongo_format`. `$in` of platforms
+# and stations with `datetime` ranges are served by the compound indexes, and
+# each clause of `$or` of persons is served by the multikey indexes. `$sort` of
+# `to_feed_pipeline` by `datetime` or `episode_id` is served by the same ones.
+RECORDED_PROGRAM_INDEXES = [
+    IndexModel(
+        [
+            ("platform_id", pymongo.ASCENDING),
+            ("station_id", pymongo.ASCENDING),
+            ("datetime", pymongo.DESCENDING),
+        ],
+        name="platform_id_station_id_datetime",
+    ),
+    IndexModel(
+        [
+            ("platform_id", pymongo.ASCENDING),
+            ("station_id", pymongo.ASCENDING),
+            ("episode_id", pymongo.DESCENDING),
+        ],
+        name="platform_id_station_id_episode_id",
+    ),
+    IndexModel(
+        [("station_id", pymongo.ASCENDING), ("datetime", pymongo.DESCENDING)],
+        name="station_id_datetime",
+    ),
+    IndexModel([("performers", pymongo.ASCENDING)], name="performers"),
+    IndexModel([("guests", pymongo.ASCENDING)], name="guests"),
+    IndexModel([("datetime", pymongo.DESCENDING)], name="datetime"),
+]
+
+# `Feeder.register_configs` matches configs by `Config.to_hash` stored in
+# `config_hash`, which is unique so that the same config is never registered
+# twice. Configs registered by older versions have no `config_hash`, which are
+# left out of the sparse index until it is stored by `Feeder.ensure_indexes` or
+# the first registration of the feeder.
+CONFIG_INDEXES = [
+    IndexModel(
+        [("config_hash", pymongo.ASCENDING)],
+        name="config_hash",
+        unique=True,
+        sparse=True,
+    ),
+]
+# code of errors of writes violating unique indexes
+DUPLICATE_KEY_CODE = 11000
+
+
+def ensure_collection_indexes(
+    collection: pymongo.collection.Collection, indexes: List[IndexModel]
+) -> List[str]:
+    """Creates indexes missing in the collection.
+
+    Returns:
+        list of str: Names of the indexes.
+    """
+    ret = collection.create_indexes(indexes)
+    logger.info(f"ensure indexes of {collection.full_name}: {', '.join(ret)}")
+    return ret
+
+
+def _plan_to_str(plan: Dict[str, Any]) -> str:
+    stage = plan.get("stage", "")
+    if "indexName" in plan:
+        stage += f"({plan['indexName']})"
+    children = []
+    if "inputStage" in plan:
+        children.append(plan["inputStage"])
+    children += plan.get("inputStages", [])
+    if not children:
+        return stage
+    return f"{stage} <- " + ", ".join(_plan_to_str(child) for child in children)
+
+
+def _has_stage(plan: Dict[str, Any], stage: str) -> bool:
+    if plan.get("stage") == stage:
+        return True
+    children = [plan["inputStage"]] if "inputStage" in plan else []
+    children += plan.get("inputStages", [])
+    return any(_has_stage(child, stage) for child in children)
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarizes the result of `explain` with `executionStats`.
+
+    Returns:
+        dict: `winning_plan` as `"FETCH <- IXSCAN(index)"`, `collscan`,
+            `keys_examined`, `docs_examined`, `returned` and `time_ms`.
+    """
+    winning_plan = explain["queryPlanner"]["winningPlan"]
+    # NOTE: the slot based engine nests the classic plan in `queryPlan`
+    winning_plan = winning_plan.get("queryPlan", winning_plan)
+    stats = explain.get("executionStats", {})
+    return dict(
+        winning_plan=_plan_to_str(winning_plan),
+        collscan=_has_stage(winning_plan, "COLLSCAN"),
+        keys_examined=stats.get("totalKeysExamined"),
+        docs_examined=stats.get("totalDocsExamined"),
+        returned=stats.get("nReturned"),
+        time_ms=stats.get("executionTimeMillis"),
+    )
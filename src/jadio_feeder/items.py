@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+from dataclasses import dataclass, field
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import pymongo
+import pymongo.collection
+from bson import ObjectId
+
+from . import metrics
+from .media import PREFETCH_BATCH_SIZE, MediaProbeCache
+from .media_index import MediaIndex
+from .podcast import Enclosure, EpisodeType, PodcastItem
+from .stream import render_item
+
+if TYPE_CHECKING:
+    from jadio import Program
+
+logger = getLogger(__name__)
+
+# bumped when items or their fragments are rendered differently, so that stored
+# items of older versions are rebuilt
+ITEM_STORE_VERSION = 1
+# fields of recorded programs read by `PodcastItem.from_program`
+ITEM_FIELDS = [
+    "platform_id",
+    "station_id",
+    "episode_id",
+    "episode_name",
+    "description",
+    "information",
+    "datetime",
+    "duration",
+    "is_video",
+    "url",
+    "image_url",
+]
+
+
+def _hash_program(program: Program) -> str:
+    values = [getattr(program, key) for key in ITEM_FIELDS]
+    return hashlib.sha1(repr(values).encode("utf-8")).hexdigest()
+
+
+def _item_to_dict(item: PodcastItem) -> Dict[str, Any]:
+    data = dataclasses.asdict(item)
+    data["itunes_episode_type"] = item.itunes_episode_type.value
+    return data
+
+
+def _item_from_dict(data: Dict[str, Any]) -> PodcastItem:
+    data = dict(data)
+    data["enclosure"] = Enclosure(**data["enclosure"])
+    data["itunes_episode_type"] = EpisodeType(data["itunes_episode_type"])
+    return PodcastItem(**data)
+
+
+@dataclass
+class StoredItem:
+    """`PodcastItem` of a program with its rendered `<item>` fragments.
+
+    Attributes:
+        program_hash (str): Hash of `ITEM_FIELDS` of the recorded program.
+        media (tuple): Path, size and mtime of the media file.
+        item (`PodcastItem`): Item built by `PodcastItem.from_program`.
+        fragments (dict): Fragments by `render_item`, keyed by "pretty" or
+            "compact".
+        version (int): `ITEM_STORE_VERSION` of the stored item.
+    """
+
+    program_hash: str
+    media: Tuple[str, int, float]
+    item: PodcastItem
+    fragments: Dict[str, str] = field(default_factory=dict)
+    version: int = ITEM_STORE_VERSION
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> StoredItem:
+        return cls(
+            program_hash=data["program_hash"],
+            media=tuple(data["media"]),
+            item=_item_from_dict(data["item"]),
+            fragments=dict(data["fragments"]),
+            version=data["version"],
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(
+            program_hash=self.program_hash,
+            media=list(self.media),
+            item=_item_to_dict(self.item),
+            fragments=self.fragments,
+            version=self.version,
+        )
+
+
+class ItemStore:
+    """Persistent store of `PodcastItem`s and their `<item>` XML fragments.
+
+    Items are keyed by program id and base URL, and they are shared by all feeds
+    including the program. A stored item is rebuilt when the fields of the
+    recorded program read by `PodcastItem.from_program` or the path, size or
+    mtime of its media file change. Items are fetched by `prefetch` in batches,
+    and new or changed items are written back in bulk by `flush`.
+
+    Examples:
+        >>> store = ItemStore(collection, base_url, media_root, media_index=index)
+        >>> store.prefetch([program_id])
+        >>> store.fragment(program, program_id, pretty=True)
+    """
+
+    def __init__(
+        self,
+        collection: pymongo.collection.Collection,
+        base_url: str,
+        media_root: Union[str, Path],
+        media_cache: Optional[MediaProbeCache] = None,
+        media_index: Optional[MediaIndex] = None,
+    ) -> None:
+        self._collection = collection
+        self.base_url = base_url
+        self.media_root = Path(media_root)
+        self.media_cache = media_cache
+        self.media_index = media_index or MediaIndex(media_root)
+        self._items: Dict[ObjectId, Optional[StoredItem]] = {}
+        self._dirty: Dict[ObjectId, StoredItem] = {}
+
+    def _key(self, program_id: ObjectId) -> Dict[str, Any]:
+        return {"program_id": program_id, "base_url": self.base_url}
+
+    def prefetch(self, program_ids: Iterable[ObjectId]) -> None:
+        """Fetches stored items of the programs not fetched yet in batches."""
+        program_ids = [
+            program_id for program_id in program_ids if program_id not in self._items
+        ]
+        for i in range(0, len(program_ids), PREFETCH_BATCH_SIZE):
+            batch = program_ids[i : i + PREFETCH_BATCH_SIZE]
+            with metrics.stage("item_store"):
+                docs = self._collection.find(
+                    {"_id": {"$in": [self._key(program_id) for program_id in batch]}}
+                )
+                for program_id in batch:
+                    self._items[program_id] = None
+                for doc in docs:
+                    self._items[doc["_id"]["program_id"]] = StoredItem.from_dict(doc)
+
+    def _get(self, program: Program, program_id: ObjectId) -> StoredItem:
+        if program_id not in self._items:
+            self.prefetch([program_id])
+        with metrics.stage("media_probe"):
+            media = self.media_index.find(
+                program.platform_id, program.station_id, program_id
+            )
+        program_hash = _hash_program(program)
+        stored = self._items[program_id]
+        if (
+            stored is not None
+            and stored.version == ITEM_STORE_VERSION
+            and stored.program_hash == program_hash
+            and stored.media == (media.path, media.size, media.mtime)
+        ):
+            return stored
+
+        with metrics.stage("item_build"):
+            item = PodcastItem.from_program(
+                program,
+                program_id,
+                self.base_url,
+                self.media_root,
+                media_cache=self.media_cache,
+                media_index=self.media_index,
+            )
+        stored = StoredItem(program_hash, (media.path, media.size, media.mtime), item)
+        self._items[program_id] = self._dirty[program_id] = stored
+        return stored
+
+    def item(self, program: Program, program_id: ObjectId) -> PodcastItem:
+        """Returns the item of the program, building it if needed."""
+        return self._get(program, program_id).item
+
+    def fragment(self, program: Program, program_id: ObjectId, pretty: bool) -> str:
+        """Returns `<item>` fragment of the program, rendering it if needed."""
+        stored = self._get(program, program_id)
+        key = "pretty" if pretty else "compact"
+        if key not in stored.fragments:
+            with metrics.stage("render"):
+                stored.fragments[key] = render_item(stored.item, pretty=pretty)
+            self._dirty[program_id] = stored
+        return stored.fragments[key]
+
+    def flush(self) -> None:
+        """Writes new or changed items to the collection."""
+        requests: List[pymongo.ReplaceOne] = [
+            pymongo.ReplaceOne(
+                {"_id": self._key(program_id)},
+                dict(_id=self._key(program_id), **stored.to_dict()),
+                upsert=True,
+            )
+            for program_id, stored in self._dirty.items()
+        ]
+        self._dirty = {}
+        if not requests:
+            return
+        self._collection.bulk_write(requests, ordered=False)
+        logger.debug(f"save {len(requests)} item(s)")
+
+    def clear(self) -> None:
+        """Forgets items fetched in memory, e.g. after recorded programs change."""
+        self.flush()
+        self._items = {}
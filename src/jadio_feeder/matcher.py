@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import datetime as dt
+import re
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pymongo.collection
+from bson import ObjectId
+
+from .config import Query
+from .search import is_searchable, normalize_text
+
+logger = getLogger(__name__)
+
+# fields of recorded programs referred by `Query.to_mongo_format`
+SNAPSHOT_FIELDS = [
+    "platform_id",
+    "station_id",
+    "performers",
+    "guests",
+    "name",
+    "description",
+    "information",
+    "episode_name",
+    "datetime",
+]
+TEXT_FIELDS = ["name", "description", "information", "episode_name"]
+
+
+@dataclass
+class ProgramMatch:
+    """Programs matched by a query.
+
+    Attributes:
+        program_ids (list of `ObjectId`): Ids of matched programs in ascending order.
+        summary (dict): Same as `Feeder._find_programs_summary`, i.e.
+            `num_programs`, `max_program_id` and `max_datetime`.
+    """
+
+    program_ids: List[ObjectId]
+    summary: Dict[str, Any]
+
+
+class _CategoricalColumn:
+    """Column of scalar values encoded as codes of their unique values."""
+
+    def __init__(self, values: Iterable[Any]) -> None:
+        uniques: Dict[Any, int] = {}
+        self.codes = np.fromiter(
+            (uniques.setdefault(_hashable(value), len(uniques)) for value in values),
+            dtype=np.int32,
+        )
+        self.uniques = list(uniques)
+        self._normalized_uniques: Optional[List[Any]] = None
+
+    def _hits_to_mask(self, hits: List[bool]) -> np.ndarray:
+        return np.array(hits, dtype=bool)[self.codes]
+
+    def isin(self, values: List[Any]) -> np.ndarray:
+        values = set(values)
+        return self._hits_to_mask([value in values for value in self.uniques])
+
+    def search(self, pattern: re.Pattern) -> np.ndarray:
+        return self._hits_to_mask([_search(pattern, value) for value in self.uniques])
+
+    def contains(self, word: str) -> np.ndarray:
+        """Same as `search` but matches the normalized word in normalized values."""
+        if self._normalized_uniques is None:
+            # normalized once per column instead of once per word
+            self._normalized_uniques = [_normalize(value) for value in self.uniques]
+        return self._hits_to_mask(
+            [_contains(word, value) for value in self._normalized_uniques]
+        )
+
+
+class _MultiValuedColumn:
+    """Column of array values such as `performers`, flattened to (row, value)."""
+
+    def __init__(self, values: Iterable[Any]) -> None:
+        rows, flatten = [], []
+        num_rows = 0
+        for row, value in enumerate(values):
+            num_rows += 1
+            # NOTE: Mongo's `$in` matches either an element of arrays or scalars
+            for element in value if isinstance(value, list) else [value]:
+                rows.append(row)
+                flatten.append(element)
+        self.num_rows = num_rows
+        self.rows = np.array(rows, dtype=np.int64)
+        self.values = _CategoricalColumn(flatten)
+
+    def isin(self, values: List[Any]) -> np.ndarray:
+        ret = np.zeros(self.num_rows, dtype=bool)
+        ret[self.rows[self.values.isin(values)]] = True
+        return ret
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _search(pattern: re.Pattern, value: Any) -> bool:
+    # NOTE: Mongo's `$regex` matches any string element of arrays
+    if isinstance(value, str):
+        return pattern.search(value) is not None
+    if isinstance(value, tuple):
+        return any(_search(pattern, element) for element in value)
+    return False
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, tuple):
+        return tuple(_normalize(element) for element in value)
+    return value
+
+
+def _contains(word: str, value: Any) -> bool:
+    """Returns whether the word is in the value normalized by `_normalize`."""
+    if isinstance(value, str):
+        return word in value
+    if isinstance(value, tuple):
+        return any(_contains(word, element) for element in value)
+    return False
+
+
+def _to_datetime64(value: Any) -> np.datetime64:
+    # NOTE: BSON datetimes have millisecond precision
+    if isinstance(value, dt.datetime):
+        return np.datetime64(value, "ms")
+    return np.datetime64("NaT", "ms")
+
+
+class ProgramSnapshot:
+    """Columnar in-memory snapshot of recorded programs to match many queries.
+
+    The fields referred by `Query` are loaded by one scan of the collection and
+    each query is evaluated as vectorized masks. String columns are encoded into
+    their unique values, so that `$regex` is evaluated once per unique value
+    instead of once per program.
+
+    If `normalize_words`, words which are not regex patterns are matched as
+    normalized substrings in the same way as `SearchIndex`.
+    """
+
+    def __init__(
+        self, programs: Iterable[Dict[str, Any]], normalize_words: bool = False
+    ) -> None:
+        self.normalize_words = normalize_words
+        programs = sorted(programs, key=lambda x: x["_id"])
+        self.ids = np.empty(len(programs), dtype=object)
+        self.ids[:] = [program["_id"] for program in programs]
+        self.datetimes = np.array(
+            [_to_datetime64(program.get("datetime")) for program in programs],
+            dtype="datetime64[ms]",
+        )
+        self.columns = {
+            key: _CategoricalColumn(program.get(key) for program in programs)
+            for key in ["platform_id", "station_id"] + TEXT_FIELDS
+        }
+        self.persons = [
+            _MultiValuedColumn(program.get(key) for program in programs)
+            for key in ["performers", "guests"]
+        ]
+        self._search_cache: Dict[Tuple[str, str], np.ndarray] = {}
+
+    @classmethod
+    def from_collection(
+        cls, collection: pymongo.collection.Collection, normalize_words: bool = False
+    ) -> ProgramSnapshot:
+        programs = collection.find({}, SNAPSHOT_FIELDS)
+        ret = cls(programs, normalize_words=normalize_words)
+        logger.info(f"load snapshot of {len(ret)} program(s)")
+        return ret
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _search(self, key: str, word: str) -> np.ndarray:
+        # configs often share words, so masks are cached
+        if (key, word) not in self._search_cache:
+            column = self.columns[key]
+            if self.normalize_words and is_searchable(word):
+                mask = column.contains(normalize_text(word))
+            else:
+                mask = column.search(re.compile(word))
+            self._search_cache[(key, word)] = mask
+        return self._search_cache[(key, word)]
+
+    def to_mask(self, query: Query) -> np.ndarray:
+        """Returns a mask of programs matched by `query.to_mongo_format()`."""
+        mask = np.ones(len(self), dtype=bool)
+        if query.platform_ids:
+            mask &= self.columns["platform_id"].isin(query.platform_ids)
+        if query.station_ids:
+            mask &= self.columns["station_id"].isin(query.station_ids)
+        if query.persons:
+            or_mask = np.zeros(len(self), dtype=bool)
+            for column in self.persons:
+                or_mask |= column.isin(query.persons)
+            mask &= or_mask
+        if query.words:
+            or_mask = np.zeros(len(self), dtype=bool)
+            for key in TEXT_FIELDS:
+                for word in query.words:
+                    or_mask |= self._search(key, word)
+            mask &= or_mask
+        if query.datetime_range:
+            mask &= self.datetimes >= _to_datetime64(query.datetime_range[0])
+            if len(query.datetime_range) == 2:
+                mask &= self.datetimes < _to_datetime64(query.datetime_range[1])
+        return mask
+
+    def match(self, query: Query) -> ProgramMatch:
+        indices = np.flatnonzero(self.to_mask(query))
+        datetimes = self.datetimes[indices]
+        datetimes = datetimes[~np.isnat(datetimes)]
+        max_datetime: Optional[dt.datetime] = None
+        if len(datetimes) > 0:
+            max_datetime = datetimes.max().item()
+        summary = dict(
+            num_programs=len(indices),
+            max_program_id=self.ids[indices[-1]] if len(indices) > 0 else None,
+            max_datetime=max_datetime,
+        )
+        return ProgramMatch(program_ids=self.ids[indices].tolist(), summary=summary)
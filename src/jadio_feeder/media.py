@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import pymongo
+import pymongo.collection
+from bson import ObjectId
+
+from .podcast import _media_path_to_duration, _path_to_enclosure_type
+
+if TYPE_CHECKING:
+    from jadio import Program
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+    from .media_index import MediaIndex
+
+logger = getLogger(__name__)
+
+# number of documents fetched per query by `MediaProbeCache.prefetch` and
+# `ItemStore.prefetch`
+PREFETCH_BATCH_SIZE = 1000
+
+
+@dataclass
+class MediaProbe:
+    """Probed information of a media file.
+
+    Attributes:
+        path (str): Absolute path of the media file.
+        size (int): File size in bytes, which is also the enclosure length.
+        mtime (float): Modification time of the media file.
+        is_video (bool): Whether the media is a video or not.
+        type (str): MIME type of the enclosure.
+        duration (float): Duration in seconds. None if it has not been probed yet.
+    """
+
+    path: str
+    size: int
+    mtime: float
+    is_video: bool
+    type: str
+    duration: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> MediaProbe:
+        data = dict(data)
+        data["path"] = data.pop("_id")
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(
+            _id=self.path,
+            size=self.size,
+            mtime=self.mtime,
+            is_video=self.is_video,
+            type=self.type,
+            duration=self.duration,
+        )
+
+
+class MediaProbeCache:
+    """Persistent cache of `MediaProbe` keyed by path, size and mtime.
+
+    Entries of the media files being rendered are fetched by `prefetch` in
+    batches, or one by one on a miss, and new or changed entries are written
+    back in bulk by `flush`. Only a `stat` of the media file is needed to
+    validate an entry, instead of parsing the file with mutagen.
+    """
+
+    def __init__(self, collection: pymongo.collection.Collection) -> None:
+        self._collection = collection
+        # fetched probes, or None if the media file has no stored probe
+        self._probes: Dict[str, Optional[MediaProbe]] = {}
+        self._dirty: Dict[str, MediaProbe] = {}
+
+    def prefetch(self, paths: Iterable[Union[str, Path]]) -> None:
+        """Fetches stored probes of the media files not fetched yet in batches."""
+        keys = self._to_keys(paths)
+        for i in range(0, len(keys), PREFETCH_BATCH_SIZE):
+            batch = keys[i : i + PREFETCH_BATCH_SIZE]
+            for key in batch:
+                self._probes[key] = None
+            for doc in self._collection.find({"_id": {"$in": batch}}):
+                self._probes[doc["_id"]] = MediaProbe.from_dict(doc)
+
+    def prefetch_programs(
+        self,
+        program_and_id_pairs: Iterable[Tuple[Program, ObjectId]],
+        media_index: MediaIndex,
+    ) -> None:
+        """Fetches stored probes of the media files of the programs in batches."""
+        self.prefetch(_to_media_paths(program_and_id_pairs, media_index))
+
+    def probe(
+        self,
+        path: Union[str, Path],
+        is_video: bool,
+        with_duration: bool = True,
+        size: Optional[int] = None,
+        mtime: Optional[float] = None,
+    ) -> MediaProbe:
+        """Returns the cached probe of the media file, probing it if needed.
+
+        Args:
+            path (str or `Path`): Path of the media file.
+            is_video (bool): Whether the media is a video or not.
+            with_duration (bool): If False, the duration is not probed because
+                it is known by other means, e.g. `Program.duration`.
+            size (int): File size already known, e.g. by `MediaIndex`. The file
+                is not stat-ed if both `size` and `mtime` are given.
+            mtime (float): Modification time already known.
+        """
+        path = Path(path).absolute()
+        if size is None or mtime is None:
+            stat = path.stat()
+            size, mtime = stat.st_size, stat.st_mtime
+        key = str(path)
+
+        if key not in self._probes:
+            self.prefetch([key])
+        probe = self._probes[key]
+        if (
+            probe is None
+            or probe.size != size
+            or probe.mtime != mtime
+            or probe.is_video != is_video
+        ):
+            probe = MediaProbe(
+                path=key,
+                size=size,
+                mtime=mtime,
+                is_video=is_video,
+                type=_path_to_enclosure_type(path, is_video),
+            )
+            self._probes[key] = self._dirty[key] = probe
+        if with_duration and probe.duration is None:
+            probe.duration = _media_path_to_duration(path)
+            self._dirty[key] = probe
+        return probe
+
+    def _to_keys(self, paths: Iterable[Union[str, Path]]) -> List[str]:
+        """Returns keys of the media files whose probes are not fetched yet."""
+        keys = {str(Path(path).absolute()): None for path in paths}
+        return [key for key in keys if key not in self._probes]
+
+    def _pop_requests(self) -> List[pymongo.ReplaceOne]:
+        requests = [
+            pymongo.ReplaceOne({"_id": key}, probe.to_dict(), upsert=True)
+            for key, probe in self._dirty.items()
+        ]
+        self._dirty = {}
+        return requests
+
+    def flush(self) -> None:
+        """Writes new or changed probes to the collection."""
+        requests = self._pop_requests()
+        if not requests:
+            return
+        self._collection.bulk_write(requests, ordered=False)
+        logger.debug(f"save {len(requests)} media probe(s)")
+
+    def clear(self) -> None:
+        """Forgets probes fetched in memory after writing back changed ones."""
+        self.flush()
+        self._probes = {}
+
+    def evict_missing(self) -> int:
+        """Removes probes whose media files no longer exist.
+
+        Returns:
+            int: Number of removed probes.
+        """
+        self.flush()
+        docs = self._collection.find({}, ["_id"])
+        missing = [doc["_id"] for doc in docs if not Path(doc["_id"]).exists()]
+        for i in range(0, len(missing), PREFETCH_BATCH_SIZE):
+            batch = missing[i : i + PREFETCH_BATCH_SIZE]
+            self._collection.delete_many({"_id": {"$in": batch}})
+        for key in missing:
+            self._probes[key] = None
+        logger.info(f"evict {len(missing)} media probe(s) of missing files")
+        return len(missing)
+
+
+class AsyncMediaProbeCache(MediaProbeCache):
+    """`MediaProbeCache` on motor for `AsyncFeeder`.
+
+    Probes of the media files being rendered are fetched by `load` before
+    `probe` is called, which may be in other threads where motor cannot be
+    awaited, and they are written back by `flush` while nothing is probed.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection) -> None:
+        super().__init__(collection)
+
+    def prefetch(self, paths: Iterable[Union[str, Path]]) -> None:
+        """Checks that probes of the media files are fetched by `load`.
+
+        Raises:
+            RuntimeError: If any probe is not fetched, which cannot be fetched
+                here without blocking the event loop.
+        """
+        keys = self._to_keys(paths)
+        if keys:
+            raise RuntimeError(f"media probe of {keys[0]} is not loaded by `load`")
+
+    async def load(self, paths: Iterable[Union[str, Path]]) -> None:
+        """Fetches stored probes of the media files not fetched yet in batches."""
+        keys = self._to_keys(paths)
+        for i in range(0, len(keys), PREFETCH_BATCH_SIZE):
+            batch = keys[i : i + PREFETCH_BATCH_SIZE]
+            cursor = self._collection.find({"_id": {"$in": batch}})
+            docs = await cursor.to_list(None)
+            for key in batch:
+                self._probes[key] = None
+            for doc in docs:
+                self._probes[doc["_id"]] = MediaProbe.from_dict(doc)
+
+    async def load_programs(
+        self,
+        program_and_id_pairs: Iterable[Tuple[Program, ObjectId]],
+        media_index: MediaIndex,
+    ) -> None:
+        """Fetches stored probes of the media files of the programs in batches."""
+        paths = await asyncio.to_thread(
+            _to_media_paths, program_and_id_pairs, media_index
+        )
+        await self.load(paths)
+
+    async def flush(self) -> None:
+        requests = self._pop_requests()
+        if not requests:
+            return
+        await self._collection.bulk_write(requests, ordered=False)
+        logger.debug(f"save {len(requests)} media probe(s)")
+
+    async def clear(self) -> None:
+        await self.flush()
+        self._probes = {}
+
+    async def evict_missing(self) -> int:
+        await self.flush()
+        docs = await self._collection.find({}, ["_id"]).to_list(None)
+        missing = await asyncio.to_thread(
+            lambda: [doc["_id"] for doc in docs if not Path(doc["_id"]).exists()]
+        )
+        for i in range(0, len(missing), PREFETCH_BATCH_SIZE):
+            batch = missing[i : i + PREFETCH_BATCH_SIZE]
+            await self._collection.delete_many({"_id": {"$in": batch}})
+        for key in missing:
+            self._probes[key] = None
+        logger.info(f"evict {len(missing)} media probe(s) of missing files")
+        return len(missing)
+
+
+def _to_media_paths(
+    program_and_id_pairs: Iterable[Tuple[Program, ObjectId]], media_index: MediaIndex
+) -> List[str]:
+    paths = []
+    for program, program_id in program_and_id_pairs:
+        try:
+            media = media_index.find(
+                program.platform_id, program.station_id, program_id
+            )
+        except FileNotFoundError:
+            continue
+        paths.append(media.path)
+    return paths
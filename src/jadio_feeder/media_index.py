@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Union
+
+from bson import ObjectId
+
+logger = getLogger(__name__)
+
+# depth of program directories, `<media_root>/<platform_id>/<station_id>/<program_id>`
+PROGRAM_DIR_DEPTH = 3
+# directories modified within this period may still be changed in the same tick
+# of their mtime, so that their listings are not trusted by the next walk
+RACY_MTIME_NS = 2_000_000_000
+
+
+@dataclass
+class MediaEntry:
+    """Media file of a program found by `MediaIndex`.
+
+    Attributes:
+        path (str): Path of the media file under the media root.
+        size (int): File size in bytes.
+        mtime (float): Modification time of the media file.
+        suffix (str): Suffix of the media file, e.g. ".m4a".
+    """
+
+    path: str
+    size: int
+    mtime: float
+    suffix: str
+
+
+@dataclass
+class _Listing:
+    mtime_ns: Optional[int]
+    dirs: List[str]
+    media: List[MediaEntry]
+
+
+class MediaIndex:
+    """Index of media files under the media root keyed by program id.
+
+    The media file of a program is `media.*` in
+    `<media_root>/<platform_id>/<station_id>/<program_id>`. Instead of globbing
+    the directory of each program, the tree is walked with `os.scandir` by
+    `refresh`, and later walks list again only directories whose mtime changed.
+    Media files are expected not to be rewritten in place once they are listed.
+    Programs whose directories have no or several media files are reported by
+    `log_report`.
+    """
+
+    def __init__(self, media_root: Union[str, Path]) -> None:
+        self._media_root = str(Path(media_root))
+        self._listings: Dict[str, _Listing] = {}
+        self._entries: Optional[Dict[str, List[MediaEntry]]] = None
+        self.missing: Set[str] = set()
+
+    def refresh(self) -> None:
+        """Walks the media root, listing only directories changed since last walk."""
+        visited = set()
+        self._walk(self._media_root, 0, visited)
+        for path in set(self._listings) - visited:
+            del self._listings[path]
+
+        entries = {}
+        for path, listing in self._listings.items():
+            if listing.media:
+                entries.setdefault(os.path.basename(path), []).extend(listing.media)
+        self._entries = entries
+        self.missing = set()
+        logger.info(f"index media files of {len(entries)} program(s)")
+
+    def _walk(self, path: str, depth: int, visited: Set[str]) -> None:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        visited.add(path)
+        listing = self._listings.get(path)
+        if listing is None or listing.mtime_ns != mtime_ns:
+            listing = self._list(path, depth, mtime_ns)
+            self._listings[path] = listing
+        for child in listing.dirs:
+            self._walk(child, depth + 1, visited)
+
+    def _list(self, path: str, depth: int, mtime_ns: int) -> _Listing:
+        if time.time_ns() - mtime_ns < RACY_MTIME_NS:
+            mtime_ns = None
+        listing = _Listing(mtime_ns, dirs=[], media=[])
+        with os.scandir(path) as it:
+            for entry in sorted(it, key=lambda x: x.name):
+                if depth < PROGRAM_DIR_DEPTH:
+                    if entry.is_dir():
+                        listing.dirs.append(entry.path)
+                elif entry.name.startswith("media.") and entry.is_file():
+                    stat = entry.stat()
+                    suffix = os.path.splitext(entry.name)[1]
+                    listing.media.append(
+                        MediaEntry(entry.path, stat.st_size, stat.st_mtime, suffix)
+                    )
+        return listing
+
+    def find(
+        self, platform_id: str, station_id: str, program_id: Union[str, ObjectId]
+    ) -> MediaEntry:
+        """Returns the media file of the program.
+
+        The index is built on first use. The directory of a program recorded
+        after the last walk is listed on demand. If several media files are
+        found, the one in the directory of the program sorted first is used.
+
+        Raises:
+            FileNotFoundError: If no media file of the program is found.
+        """
+        if self._entries is None:
+            self.refresh()
+        program_id = str(program_id)
+        media_dir = os.path.join(self._media_root, platform_id, station_id, program_id)
+        entries = self._entries.get(program_id)
+        if not entries:
+            self._walk(media_dir, PROGRAM_DIR_DEPTH, set())
+            listing = self._listings.get(media_dir)
+            entries = self._entries[program_id] = listing.media if listing else []
+        if not entries:
+            self.missing.add(program_id)
+            raise FileNotFoundError(f"media file is not found in {media_dir}")
+        for entry in entries:
+            if os.path.dirname(entry.path) == media_dir:
+                return entry
+        return entries[0]
+
+    @property
+    def ambiguous(self) -> Dict[str, List[str]]:
+        """Paths of media files of programs having several ones."""
+        if self._entries is None:
+            return {}
+        return {
+            program_id: [entry.path for entry in entries]
+            for program_id, entries in self._entries.items()
+            if len(entries) > 1
+        }
+
+    def log_report(self) -> None:
+        """Logs programs whose media files are missing or ambiguous."""
+        if self.missing:
+            logger.warning(
+                f"media files of {len(self.missing)} program(s) are not found: "
+                f"{', '.join(sorted(self.missing))}"
+            )
+        for program_id, paths in self.ambiguous.items():
+            logger.warning(
+                f"program {program_id} has {len(paths)} media files: "
+                f"{', '.join(paths)}"
+            )
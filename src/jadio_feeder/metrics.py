@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import contextlib
+import datetime as dt
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TypeVar, Union
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+# stages timed by `stage`
+STAGES = [
+    "config_load",
+    "program_query",
+    "program_from_dict",
+    "item_store",
+    "media_probe",
+    "item_build",
+    "render",
+    "write",
+]
+PROMETHEUS_FILE_NAME = "jadio_feeder.prom"
+# run reports kept in the directory, older ones are removed by `Metrics.write`
+MAX_RUN_REPORTS = 100
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+@dataclass
+class StageStats:
+    count: int = 0
+    seconds: float = 0.0
+
+    def add(self, seconds: float, count: int = 1) -> None:
+        self.count += count
+        self.seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(count=self.count, seconds=self.seconds)
+
+
+@dataclass
+class FeedStats:
+    seconds: float = 0.0
+    stages: Dict[str, StageStats] = field(
+        default_factory=lambda: defaultdict(StageStats)
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        stages = {key: value.to_dict() for key, value in self.stages.items()}
+        return dict(seconds=self.seconds, stages=stages)
+
+
+class Metrics:
+    """Aggregates of time spent in each stage of a run, per run and per feed.
+
+    Time of nested stages is excluded from their parents, e.g. `media_probe`
+    inside `item_build`, so that the stages sum up to the time of the run.
+    It is not thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = dt.datetime.now()
+        self._start = time.perf_counter()
+        self.stages: Dict[str, StageStats] = defaultdict(StageStats)
+        self.feeds: Dict[str, FeedStats] = {}
+        self._feed: Optional[FeedStats] = None
+        # start time and time of child stages of open stages
+        self._stack: List[List[float]] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+            self.stages[name].add(elapsed - frame[1])
+            if self._feed is not None:
+                self._feed.stages[name].add(elapsed - frame[1])
+
+    @contextlib.contextmanager
+    def feed(self, feed_id: str) -> Iterator[None]:
+        prev_feed = self._feed
+        self._feed = self.feeds.setdefault(feed_id, FeedStats())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._feed.seconds += time.perf_counter() - start
+            self._feed = prev_feed
+
+    def merge_feed(self, feed_id: str, data: Dict[str, Any]) -> None:
+        """Merges `FeedStats.to_dict` of a feed measured in another process."""
+        feed = self.feeds.setdefault(feed_id, FeedStats())
+        feed.seconds += data["seconds"]
+        for name, stats in data["stages"].items():
+            feed.stages[name].add(stats["seconds"], stats["count"])
+            self.stages[name].add(stats["seconds"], stats["count"])
+
+    def to_report(self) -> Dict[str, Any]:
+        return dict(
+            started_at=self.started_at.isoformat(),
+            seconds=time.perf_counter() - self._start,
+            stages={key: value.to_dict() for key, value in self.stages.items()},
+            feeds={key: value.to_dict() for key, value in self.feeds.items()},
+        )
+
+    def to_prometheus(self) -> str:
+        """Returns gauges of the run in the text format of Prometheus."""
+        report = self.to_report()
+        stages = report["stages"].items()
+        gauges = [
+            ("run_seconds", "Time of the last run.", [("", report["seconds"])]),
+            (
+                "run_timestamp_seconds",
+                "Start time of the last run.",
+                [("", self.started_at.timestamp())],
+            ),
+            (
+                "stage_seconds",
+                "Time of each stage in the last run.",
+                [(f'stage="{key}"', value["seconds"]) for key, value in stages],
+            ),
+            (
+                "stage_count",
+                "Number of each stage in the last run.",
+                [(f'stage="{key}"', value["count"]) for key, value in stages],
+            ),
+            (
+                "feed_seconds",
+                "Time of each feed in the last run.",
+                [
+                    (f'feed="{key}"', value["seconds"])
+                    for key, value in report["feeds"].items()
+                ],
+            ),
+        ]
+        lines = []
+        for name, description, samples in gauges:
+            lines.append(f"# HELP jadio_feeder_{name} {description}")
+            lines.append(f"# TYPE jadio_feeder_{name} gauge")
+            for labels, value in samples:
+                labels = f"{{{labels}}}" if labels else ""
+                lines.append(f"jadio_feeder_{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(
+        self, directory: Union[str, Path], max_reports: int = MAX_RUN_REPORTS
+    ) -> Path:
+        """Writes the JSON run report and the Prometheus textfile.
+
+        Args:
+            directory (str or `Path`): Directory of the outputs.
+            max_reports (int): Number of the latest run reports kept in the
+                directory, e.g. written by every poll of the scheduler.
+
+        Returns:
+            `Path`: Path of the JSON run report, `run-<started_at>.json`.
+        """
+        # NOTE: imported here since `output` times its writes by this module
+        from .output import ChangedFileWriter
+
+        directory = Path(directory)
+        report_path = directory / f"run-{self.started_at:%Y%m%dT%H%M%S}.json"
+        with ChangedFileWriter(report_path) as f:
+            f.write((json.dumps(self.to_report(), indent=2) + "\n").encode("utf-8"))
+        # textfile collectors read `*.prom`, so it is replaced atomically
+        with ChangedFileWriter(directory / PROMETHEUS_FILE_NAME) as f:
+            f.write(self.to_prometheus().encode("utf-8"))
+        logger.info(f"save run report to {report_path}")
+
+        # names of reports are sorted by their start times
+        report_paths = sorted(directory.glob("run-*.json"))
+        for path in report_paths[: max(len(report_paths) - max_reports, 0)]:
+            path.unlink()
+        return report_path
+
+
+_metrics: Optional[Metrics] = None
+
+
+def active() -> Optional[Metrics]:
+    return _metrics
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[Metrics]:
+    """Enables hooks while the context, and yields `Metrics` of them."""
+    global _metrics
+    prev_metrics = _metrics
+    _metrics = Metrics()
+    try:
+        yield _metrics
+    finally:
+        _metrics = prev_metrics
+
+
+def stage(name: str) -> contextlib.AbstractContextManager:
+    """Times the stage if enabled by `collect`, otherwise it is a no-op."""
+    if _metrics is None:
+        return _NULL_CONTEXT
+    return _metrics.stage(name)
+
+
+def feed(feed_id: Any) -> contextlib.AbstractContextManager:
+    """Attributes stages to the feed if enabled by `collect`."""
+    if _metrics is None:
+        return _NULL_CONTEXT
+    return _metrics.feed(str(feed_id))
+
+
+def timed(iterable: Iterable[T], name: str) -> Iterator[T]:
+    """Iterates with time spent in each `next` attributed to the stage, e.g. to
+    time fetching documents from a cursor."""
+    if _metrics is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                value = next(iterator)
+            except StopIteration:
+                return
+        yield value
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Union
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from . import metrics
+
+logger = getLogger(__name__)
+
+# encodings of precompressed sidecars and their suffixes
+SIDECAR_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+def _file_to_sha256(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    ret = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            ret.update(chunk)
+    return ret.hexdigest()
+
+
+class ChangedFileWriter:
+    """Binary file writer replacing the file atomically only if its content changed.
+
+    The content is written to a temporary file in the same directory, and the
+    temporary file is renamed to the path only if its SHA-256 differs from the
+    existing file. So readers never see a half-written file, and the mtime of
+    unchanged files is kept for conditional GETs.
+
+    Examples:
+        >>> with ChangedFileWriter(path) as f:
+        ...     f.write(data)
+        >>> f.changed, f.sha256, f.size
+    """
+
+    def __init__(self, path: Union[str, Path], mode: int = 0o644) -> None:
+        self.path = Path(path)
+        self.mode = mode
+        self.changed = False
+        self.sha256: Optional[str] = None
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._discarded = False
+
+    def __enter__(self) -> ChangedFileWriter:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent
+        )
+        self._temp_path = Path(temp_path)
+        self._file = os.fdopen(fd, "wb")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        with metrics.stage("write"):
+            self._close(discard=exc_type is not None or self._discarded)
+
+    def _close(self, discard: bool) -> None:
+        self._file.close()
+        if discard:
+            self._temp_path.unlink()
+            return
+        self.sha256 = self._hash.hexdigest()
+        if self.sha256 == _file_to_sha256(self.path):
+            self._temp_path.unlink()
+            return
+        os.chmod(self._temp_path, self.mode)
+        os.replace(self._temp_path, self.path)
+        self.changed = True
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def discard(self) -> None:
+        """Discards the written content and leaves the existing file as it is."""
+        self._discarded = True
+
+
+def write_manifest(path: Union[str, Path], feeds: Dict[str, Dict[str, Any]]) -> bool:
+    """Writes the manifest of RSS feeds as JSON, only if it changed.
+
+    Args:
+        path (str or `Path`): Path of the manifest, e.g. `<rss-root>/manifest.json`.
+        feeds (dict): Map of feed file names to their `sha256`, `size`, `num_items`
+            and `last_changed`.
+
+    Returns:
+        bool: Whether the manifest was changed or not.
+    """
+    data = json.dumps(feeds, indent=2, sort_keys=True, ensure_ascii=False, default=str)
+    with ChangedFileWriter(path) as f:
+        f.write((data + "\n").encode("utf-8"))
+    if f.changed:
+        logger.info(f"save manifest of {len(feeds)} feed(s) to {path}")
+    return f.changed
+
+
+def check_sidecars(encodings: Sequence[str]) -> None:
+    for encoding in encodings:
+        if encoding not in SIDECAR_SUFFIXES:
+            raise ValueError(f"'{encoding}' is not supported sidecar encoding")
+        if encoding == "br" and brotli is None:
+            raise ImportError(
+                "brotli is required to write .br sidecars. "
+                "Please install jadio-feeder[brotli]"
+            )
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # mtime is fixed so that the same feed is compressed to the same bytes
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def write_sidecars(path: Union[str, Path], encodings: Sequence[str]) -> None:
+    """Writes precompressed sidecars of the file, e.g. `feed.xml.gz`.
+
+    Sidecars are regenerated only if they are missing or older than the file, and
+    sidecars of encodings not listed are removed so that stale ones are not served.
+    """
+    path = Path(path)
+    mtime = path.stat().st_mtime
+    data = None
+    for encoding, suffix in SIDECAR_SUFFIXES.items():
+        sidecar_path = path.with_name(path.name + suffix)
+        if encoding not in encodings:
+            if sidecar_path.exists():
+                sidecar_path.unlink()
+            continue
+        if sidecar_path.exists() and sidecar_path.stat().st_mtime >= mtime:
+            continue
+        if data is None:
+            data = path.read_bytes()
+        with ChangedFileWriter(sidecar_path) as f, metrics.stage("write"):
+            f.write(_compress(data, encoding))
+        if not f.changed:
+            # mark the sidecar up to date
+            os.utime(sidecar_path)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import pymongo
+import pymongo.errors
+
+from .program import PROGRAM_FIELDS
+
+# error codes of servers not supporting `$setWindowFields` (MongoDB < 5.0):
+# unrecognized pipeline stage name and invalid operator
+UNSUPPORTED_PIPELINE_CODES = {40324, 168}
+# error codes of results exceeding the BSON document size limit of 16MB:
+# BSONObjectTooLarge and the limit of documents constructed by `$facet`
+DOCUMENT_TOO_LARGE_CODES = {10334, 4031700}
+
+
+def to_feed_pipeline(
+    query: Dict[str, Any],
+    sort_by: str,
+    descending: bool,
+    remove_duplicates: bool,
+    limit: Optional[int] = None,
+    fields: Sequence[str] = PROGRAM_FIELDS,
+    limit_latest: bool = False,
+) -> List[Dict[str, Any]]:
+    """Compiles the query of a feed into an aggregation pipeline.
+
+    Programs are sorted by `sort_by` and `_id` in MongoDB, which can be served
+    by the indexes of `sort_by`. Duplicates are removed by comparing each program
+    with the previous one by `$shift` of `$setWindowFields`, in the same way as
+    `_remove_duplicates`, so that the cursor yields programs in the order of the
+    feed without sorting them again in Python.
+
+    Args:
+        query (dict): Query of programs by `Query.to_mongo_format`.
+        sort_by (str): Resolved key to sort programs, "datetime" or "episode_id".
+        descending (bool): Whether to sort from the latest.
+        remove_duplicates (bool): Whether to remove programs whose datetime or
+            episode_id equals the previous one.
+        limit (int): Maximum number of programs after removing duplicates.
+        fields (list of str): Fields to project.
+        limit_latest (bool): If True, `limit` takes the latest programs even if
+            the feed is sorted from the oldest, which are then yielded in the
+            reverse order of the feed. Duplicates are still removed in the order
+            of the feed.
+    """
+    direction = pymongo.DESCENDING if descending else pymongo.ASCENDING
+    sort = {sort_by: direction, "_id": pymongo.ASCENDING}
+    pipeline = [{"$match": query}, {"$sort": sort}]
+    if remove_duplicates:
+        # missing fields are compared as null like `None` of `ProgramView`
+        datetime = {"$ifNull": ["$datetime", None]}
+        episode_id = {"$ifNull": ["$episode_id", None]}
+        pipeline += [
+            {
+                "$setWindowFields": {
+                    "sortBy": sort,
+                    "output": {
+                        "_prev_datetime": {"$shift": {"output": datetime, "by": -1}},
+                        "_prev_episode_id": {
+                            "$shift": {"output": episode_id, "by": -1}
+                        },
+                    },
+                }
+            },
+            {
+                "$match": {
+                    "$expr": {
+                        "$and": [
+                            {"$ne": [datetime, "$_prev_datetime"]},
+                            {"$ne": [episode_id, "$_prev_episode_id"]},
+                        ]
+                    }
+                }
+            },
+        ]
+    if limit is not None:
+        if limit_latest and not descending:
+            pipeline.append(
+                {"$sort": {sort_by: pymongo.DESCENDING, "_id": pymongo.DESCENDING}}
+            )
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": {field: 1 for field in fields}})
+    return pipeline
+
+
+def is_pipeline_unsupported(err: Exception) -> bool:
+    """Returns whether the error is raised by a server, or mongomock, that does
+    not support the stages of `to_feed_pipeline`."""
+    if isinstance(err, pymongo.errors.OperationFailure):
+        return err.code in UNSUPPORTED_PIPELINE_CODES
+    return isinstance(err, NotImplementedError)
+
+
+def to_facet_pipeline(queries: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compiles queries of many configs into one aggregation with `$facet`.
+
+    The branch of the i-th query is named `str(i)`, and it yields at most one
+    document with the ids of the matched programs in ascending order and the
+    same summary as `_summary_pipeline`. The whole result is one document, so
+    that it must fit in the BSON document size limit.
+
+    Programs matching none of the queries are filtered out by `$or` before
+    `$facet`, which can use indexes unlike the branches of `$facet`.
+    """
+    branches = {
+        str(i): [
+            {"$match": query},
+            {"$sort": {"_id": pymongo.ASCENDING}},
+            {
+                "$group": {
+                    "_id": None,
+                    "program_ids": {"$push": "$_id"},
+                    "num_programs": {"$sum": 1},
+                    "max_program_id": {"$max": "$_id"},
+                    "max_datetime": {"$max": "$datetime"},
+                }
+            },
+        ]
+        for i, query in enumerate(queries)
+    }
+    return [{"$match": {"$or": list(queries)}}, {"$facet": branches}]
+
+
+def is_document_too_large(err: Exception) -> bool:
+    """Returns whether the error is raised by a result exceeding the BSON
+    document size limit, e.g. of `to_facet_pipeline`."""
+    return (
+        isinstance(err, pymongo.errors.OperationFailure)
+        and err.code in DOCUMENT_TOO_LARGE_CODES
+    )
@@ -9,16 +9,36 @@ from dataclasses import dataclass
 from enum import Enum
 from logging import getLogger
 from pathlib import Path
-from typing import Any, List, Optional, Tuple, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Collection,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import feedgen.entry
-import feedgen.feed
 import pytz
 from bson import ObjectId
-from jadio import Program
-from mutagen import mp3, mp4
 from serdescontainer import BaseContainer
 
+from . import metrics
+from .duration import probe_duration
+
+# NOTE: feedgen (lxml), mutagen and jadio are imported on first use, so that the
+# CLI starts quickly for commands not rendering feeds
+if TYPE_CHECKING:
+    import feedgen.entry
+    import feedgen.feed
+    from jadio import Program
+
+    from .items import ItemStore
+    from .media import MediaProbe, MediaProbeCache
+    from .media_index import MediaIndex
+
 PathLike = Union[str, Path]
 
 RADIKO_LINK = "https://radiko.jp/"
@@ -30,6 +50,16 @@ def _media_path_to_duration(path: Union[str, Path]) -> int:
     path = Path(path)
     if not path.exists():
         raise FileNotFoundError(f"{path} is not found")
+    try:
+        return probe_duration(path)
+    except ValueError as err:
+        logger.debug(f"fall back to mutagen: {err}")
+    return _media_path_to_duration_by_mutagen(path)
+
+
+def _media_path_to_duration_by_mutagen(path: Path) -> float:
+    from mutagen import mp3, mp4
+
     if ".mp3" == path.suffix:
         media = mp3.MP3(path)
     elif ".m4a" == path.suffix:
@@ -37,7 +67,7 @@ def _media_path_to_duration(path: Union[str, Path]) -> int:
         # https://mutagen.readthedocs.io/en/latest/changelog.html#id28
         # media = m4a.M4A(path)
         media = mp4.MP4(path)
-    elif ".mp4" == path.suffix:
+    elif path.suffix in [".mp4", ".mov"]:
         media = mp4.MP4(path)
     else:
         raise ValueError(f"{path.suffix} is not supported file type")
@@ -76,6 +106,44 @@ def _path_to_enclosure_type(path: Path, is_video: bool) -> str:
         raise ValueError(f"{path} is unsupported file type")
 
 
+def _resolve_sort_by(
+    sort_by: Optional[str],
+    station_ids: Collection[str],
+    platform_id: Optional[str],
+) -> str:
+    if sort_by is not None:
+        available_sort_by = ["datetime", "episode_id"]
+        if sort_by not in available_sort_by:
+            raise ValueError(
+                f"'{sort_by}' is not supported sort_by. "
+                "Please select 'datetime' or 'eposode_id'"
+            )
+        return sort_by
+    elif len(station_ids) > 1:
+        # do not sort by episode_id because multiple platforms may be mixed
+        return "datetime"
+    elif platform_id in ["onsen.ag", "hibiki-radio.jp"]:
+        # if platform is onsen.ag or hibiki-radio.jp, it is best to sort by episode_id.
+        return "episode_id"
+    else:
+        # if station_id is unified with stations of radiko.jp,
+        # it is best to sort by datetime.
+        return "datetime"
+
+
+def _remove_duplicates(
+    program_and_id_pairs: Iterable[Tuple[Program, ObjectId]],
+) -> Iterator[Tuple[Program, ObjectId]]:
+    """Removes programs whose datetime or episode_id equals the previous one."""
+    prev_datetime = None
+    prev_episode_id = None
+    for program, program_id in program_and_id_pairs:
+        if prev_datetime != program.datetime and prev_episode_id != program.episode_id:
+            yield program, program_id
+        prev_datetime = program.datetime
+        prev_episode_id = program.episode_id
+
+
 @dataclass
 class Enclosure:
     url: str
@@ -97,6 +165,20 @@ class Enclosure:
             type=_path_to_enclosure_type(path, is_video),
         )
 
+    @classmethod
+    def from_probe(
+        cls,
+        probe: MediaProbe,
+        base_url: str,
+        media_root: Path,
+    ) -> Enclosure:
+        path = Path(probe.path)
+        return cls(
+            url=_path_to_enclosure_url(path, media_root, base_url=base_url),
+            length=probe.size,
+            type=probe.type,
+        )
+
 
 class EpisodeType(Enum):
     FULL: str = "full"
@@ -153,17 +235,46 @@ class PodcastItem(BaseContainer):
         program_id: ObjectId,
         base_url: str,
         media_root: Path,
+        media_cache: Optional[MediaProbeCache] = None,
+        media_index: Optional[MediaIndex] = None,
     ) -> PodcastItem:
-        media_dir = media_root.joinpath(
-            program.platform_id, program.station_id, str(program_id)
-        )
-        media_path = list((media_dir).glob("media.*"))[0]
-        duration = program.duration or _media_path_to_duration(media_path)
+        with metrics.stage("media_probe"):
+            size = mtime = None
+            if media_index is not None:
+                media = media_index.find(
+                    program.platform_id, program.station_id, program_id
+                )
+                media_path, size, mtime = Path(media.path), media.size, media.mtime
+            else:
+                media_dir = media_root.joinpath(
+                    program.platform_id, program.station_id, str(program_id)
+                )
+                media_path = list((media_dir).glob("media.*"))[0]
+            if media_cache is not None:
+                probe = media_cache.probe(
+                    media_path,
+                    program.is_video,
+                    with_duration=not program.duration,
+                    size=size,
+                    mtime=mtime,
+                )
+                duration = program.duration or probe.duration
+                enclosure = Enclosure.from_probe(probe, base_url, media_root)
+            elif size is not None:
+                duration = program.duration or _media_path_to_duration(media_path)
+                enclosure = Enclosure(
+                    url=_path_to_enclosure_url(media_path, media_root, base_url),
+                    length=size,
+                    type=_path_to_enclosure_type(media_path, program.is_video),
+                )
+            else:
+                duration = program.duration or _media_path_to_duration(media_path)
+                enclosure = Enclosure.from_path(
+                    media_path, program.is_video, base_url, media_root
+                )
         return cls(
             title=program.episode_name,
-            enclosure=Enclosure.from_path(
-                media_path, program.is_video, base_url, media_root
-            ),
+            enclosure=enclosure,
             guid=str(program.episode_id),
             pub_date=program.datetime,
             description=program.information or program.description,
@@ -240,6 +351,8 @@ class PodcastChannel(BaseContainer):
         )
 
     def to_feed_generator(self) -> feedgen.feed.FeedGenerator:
+        import feedgen.feed
+
         ret = feedgen.feed.FeedGenerator()
         ret.load_extension("podcast")
 
@@ -269,9 +382,15 @@ class PodcastRssFeedGenCreator:
         self,
         base_url: str,
         media_root: PathLike,
+        media_cache: Optional[MediaProbeCache] = None,
+        media_index: Optional[MediaIndex] = None,
+        item_store: Optional[ItemStore] = None,
     ) -> None:
         self.base_url = base_url
         self.media_root = Path(media_root)
+        self.media_cache = media_cache
+        self.media_index = media_index
+        self.item_store = item_store
 
     def create(
         self,
@@ -280,42 +399,22 @@ class PodcastRssFeedGenCreator:
         sort_by: Optional[str] = None,
         from_oldest: bool = False,
         remove_duplicates: bool = True,
+        presorted: bool = False,
     ) -> feedgen.feed.FeedGenerator:
-        if sort_by is not None:
-            available_sort_by = ["datetime", "episode_id"]
-            if sort_by not in available_sort_by:
-                raise ValueError(
-                    f"'{sort_by}' is not supported sort_by. "
-                    "Please select 'datetime' or 'eposode_id'"
-                )
-        elif len(set(program.station_id for program, _ in program_and_id_pairs)) > 1:
-            # do not sort by episode_id because multiple platforms may be mixed
-            sort_by = "datetime"
-        elif program_and_id_pairs[0][0].platform_id in ["onsen.ag", "hibiki-radio.jp"]:
-            # if platform is onsen.ag or hibiki-radio.jp, it is best to sort by episode_id.
-            sort_by = "episode_id"
-        else:
-            # if station_id is unified with stations of radiko.jp,
-            # it is best to sort by datetime.
-            sort_by = "datetime"
-        program_and_id_pairs = sorted(
-            program_and_id_pairs,
-            key=lambda x: getattr(x[0], sort_by),
-            reverse=not from_oldest,
-        )
+        if not presorted:
+            sort_by = _resolve_sort_by(
+                sort_by,
+                set(program.station_id for program, _ in program_and_id_pairs),
+                program_and_id_pairs[0][0].platform_id,
+            )
+            program_and_id_pairs = sorted(
+                program_and_id_pairs,
+                key=lambda x: getattr(x[0], sort_by),
+                reverse=not from_oldest,
+            )
 
         if remove_duplicates:
-            unique_pairs = []
-            prev_datetime = None
-            prev_episode_id = None
-            for program, program_id in program_and_id_pairs:
-                if (
-                    prev_datetime != program.datetime
-                    and prev_episode_id != program.episode_id
-                ):
-                    unique_pairs.append((program, program_id))
-                prev_datetime = program.datetime
-                prev_episode_id = program.episode_id
+            unique_pairs = list(_remove_duplicates(program_and_id_pairs))
             num_programs = len(program_and_id_pairs)
             if num_programs != len(unique_pairs):
                 logger.info(
@@ -330,13 +429,28 @@ class PodcastRssFeedGenCreator:
 
         # create items of RSS feed
         feed_generator = channel.to_feed_generator()
+        if self.item_store is not None:
+            self.item_store.prefetch(
+                program_id for _, program_id in program_and_id_pairs
+            )
+        elif self.media_cache is not None and self.media_index is not None:
+            self.media_cache.prefetch_programs(program_and_id_pairs, self.media_index)
         for program, program_id in program_and_id_pairs:
             try:
-                item = PodcastItem.from_program(
-                    program, program_id, self.base_url, self.media_root
-                )
-                # item order has been already controled
-                item.set_feed_entry(feed_generator.add_entry(order="append"))
+                if self.item_store is not None:
+                    item = self.item_store.item(program, program_id)
+                with metrics.stage("item_build"):
+                    if self.item_store is None:
+                        item = PodcastItem.from_program(
+                            program,
+                            program_id,
+                            self.base_url,
+                            self.media_root,
+                            media_cache=self.media_cache,
+                            media_index=self.media_index,
+                        )
+                    # item order has been already controled
+                    item.set_feed_entry(feed_generator.add_entry(order="append"))
             except Exception as err:
                 logger.error(f"error: {err}\n{program}", stack_info=True)
                 raise err
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from . import metrics
+
+if TYPE_CHECKING:
+    from jadio import Program
+
+# fields of recorded programs read by `PodcastRssFeedGenCreator.create`,
+# `PodcastItem.from_program` and `PodcastChannel.from_program`
+PROGRAM_FIELDS = [
+    "platform_id",
+    "station_id",
+    "name",
+    "episode_id",
+    "episode_name",
+    "description",
+    "information",
+    "datetime",
+    "duration",
+    "is_video",
+    "url",
+    "image_url",
+    "copyright",
+]
+
+_DEFAULTS = {"is_video": False}
+
+
+class ProgramView:
+    """Lightweight read-only view of a recorded program document.
+
+    Fields in `PROGRAM_FIELDS` are read from the document as they are, and the
+    full `Program` is created only when any other attribute is accessed.
+    It is used in place of `Program` with documents projected by `PROGRAM_FIELDS`.
+    """
+
+    __slots__ = ("_data", "_program")
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self._data = data
+        self._program: Optional[Program] = None
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._data:
+            return self._data[name]
+        if name in PROGRAM_FIELDS:
+            return _DEFAULTS.get(name)
+        return getattr(self.to_program(), name)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._data})"
+
+    def to_program(self) -> Program:
+        """Returns `Program` materialized from the document."""
+        if self._program is None:
+            from jadio import Program
+
+            with metrics.stage("program_from_dict"):
+                self._program = Program.from_dict(dict(self._data))
+        return self._program
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import datetime as dt
+import threading
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Tuple
+
+import pymongo
+import pymongo.errors
+
+from . import metrics
+from .config import Config
+from .feeder import Feeder, UpdateResult
+
+logger = getLogger(__name__)
+
+# intervals in seconds inferred by the time since the latest matched program,
+# e.g. feeds of weekly radiko programs are rebuilt soon after new episodes, and
+# feeds of completed series are rebuilt only once a day
+RECENCY_INTERVALS = [
+    (dt.timedelta(days=1), 15 * 60),
+    (dt.timedelta(days=7), 60 * 60),
+    (dt.timedelta(days=30), 6 * 60 * 60),
+]
+DEFAULT_INTERVAL = 24 * 60 * 60
+
+
+def infer_update_interval(
+    max_datetime: Optional[dt.datetime], now: Optional[dt.datetime] = None
+) -> int:
+    """Infers the update interval of a feed from the datetime of its latest program."""
+    if max_datetime is None:
+        return DEFAULT_INTERVAL
+    now = now or dt.datetime.now()
+    if max_datetime.tzinfo is not None and now.tzinfo is None:
+        now = now.astimezone()
+    for recency, interval in RECENCY_INTERVALS:
+        if now - max_datetime <= recency:
+            return interval
+    return DEFAULT_INTERVAL
+
+
+@dataclass
+class ScheduledFeed:
+    """Schedule of a registered config.
+
+    Attributes:
+        config (dict): Config document including its `_id`.
+        config_hash (str): `Config.to_hash` to detect edited configs on reload.
+        interval (int): Interval in seconds to rebuild the feed.
+        next_update (float): `time.monotonic` when the feed is due.
+        recorder_state (tuple): Recorder state at the last build, which is None
+            if the feed has not been built by the scheduler yet.
+    """
+
+    config: Dict[str, Any]
+    config_hash: str
+    interval: int
+    next_update: float = 0.0
+    recorder_state: Optional[Tuple[Any, ...]] = None
+
+
+class FeedScheduler:
+    """Long-running scheduler rebuilding RSS feeds on their own intervals.
+
+    One `Feeder` is kept for the lifetime of the scheduler, so its MongoDB
+    connections and media probe cache stay warm. At each poll, configs are
+    reloaded so that newly registered or edited ones are built at once, and
+    the recorder is polled by the latest `_id` and estimated count of recorded
+    programs. Due feeds are rebuilt only if the recorder changed since their
+    last build, and each rebuild still skips unchanged feeds by their
+    fingerprints.
+    """
+
+    def __init__(
+        self, feeder: Feeder, poll_interval: float = 60.0, pretty: bool = True
+    ) -> None:
+        self._feeder = feeder
+        self._poll_interval = poll_interval
+        self._pretty = pretty
+        self.feeds: Dict[Any, ScheduledFeed] = {}
+        self._recorder_state: Optional[Tuple[Any, ...]] = None
+
+    def _interval(self, config: Config, config_id: Any) -> int:
+        if config.update_interval:
+            return config.update_interval
+        state = self._feeder.feeder_db.feeds.find_one(
+            {"_id": config_id}, {"fingerprint.max_datetime": 1}
+        )
+        max_datetime = (state or {}).get("fingerprint", {}).get("max_datetime")
+        return infer_update_interval(max_datetime)
+
+    def reload_configs(self) -> None:
+        """Reloads registered configs, scheduling new or edited ones at once."""
+        feeds = {}
+        for data in self._feeder.feeder_db.configs.find({}):
+            config_id = data["_id"]
+            feed = self.feeds.get(config_id)
+            if feed is not None and feed.config == data:
+                # configs are parsed and hashed only if their documents changed
+                feeds[config_id] = feed
+                continue
+            try:
+                config = Config.from_dict(dict(data))
+                config_hash = config.to_hash()
+            except Exception as err:
+                # e.g. a config being edited by hand, which is loaded again on
+                # the next poll while its last schedule is kept
+                logger.error(f"failed to load config {config_id}: {err}")
+                if feed is not None:
+                    feeds[config_id] = feed
+                continue
+            if feed is None or feed.config_hash != config_hash:
+                logger.info(f"schedule config: {config_id}")
+                feed = ScheduledFeed(
+                    config=data,
+                    config_hash=config_hash,
+                    interval=self._interval(config, config_id),
+                )
+            else:
+                # e.g. `config_hash` is stored by `Feeder.register_configs`
+                feed.config = data
+            feeds[config_id] = feed
+        for config_id in self.feeds.keys() - feeds.keys():
+            logger.info(f"unschedule removed config: {config_id}")
+        self.feeds = feeds
+
+    def run_pending(self) -> List[UpdateResult]:
+        """Rebuilds feeds which are due and whose programs may have changed.
+
+        If the feeder has `metrics_dir`, a run report is written for each run
+        rebuilding any feeds.
+        """
+        metrics_dir = self._feeder._metrics_dir
+        if metrics_dir is None:
+            return self._run_pending()
+        with metrics.collect() as run_metrics:
+            ret = self._run_pending()
+        if ret:
+            run_metrics.write(metrics_dir)
+        return ret
+
+    def _run_pending(self) -> List[UpdateResult]:
+        if self._feeder._item_store is not None:
+            # items are fetched again per poll, so that they do not pile up
+            self._feeder._item_store.clear()
+        self._feeder._media_cache.clear()
+        recorder_state = self._feeder._poll_recorder()
+        if recorder_state != self._recorder_state:
+            if self._feeder._use_search_index:
+                self._feeder.update_search_index()
+            # list again only media directories changed by the new programs
+            self._feeder._media_index.refresh()
+            self._recorder_state = recorder_state
+        now = time.monotonic()
+        ret = []
+        for config_id, feed in self.feeds.items():
+            if feed.next_update > now:
+                continue
+            if feed.recorder_state == recorder_state:
+                # no programs were recorded nor removed since the last build
+                feed.next_update = now + feed.interval
+                continue
+            result = self._feeder._update_feed_from_dict(
+                feed.config, pretty=self._pretty
+            )
+            if result.error is None:
+                feed.recorder_state = recorder_state
+            feed.interval = self._interval(
+                Config.from_dict(dict(feed.config)), config_id
+            )
+            feed.next_update = now + feed.interval
+            ret.append(result)
+
+        if any(result.updated for result in ret):
+            self._feeder._write_manifest()
+        if ret:
+            num_updated = sum(result.updated for result in ret)
+            logger.info(f"rebuilt {num_updated} / {len(ret)} due RSS feed(s)")
+            self._feeder._media_index.log_report()
+        return ret
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> None:
+        """Runs the scheduler until `stop_event` is set."""
+        stop_event = stop_event or threading.Event()
+        logger.info(f"start scheduler polling every {self._poll_interval} seconds")
+        while not stop_event.is_set():
+            try:
+                self.reload_configs()
+                self.run_pending()
+            except pymongo.errors.PyMongoError as err:
+                # keep running while MongoDB is temporarily unavailable
+                logger.error(f"failed to poll MongoDB: {err}")
+            stop_event.wait(self._poll_interval)
+        logger.info("stop scheduler")
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import datetime as dt
+import re
+import unicodedata
+from logging import getLogger
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Union
+
+import pymongo
+import pymongo.collection
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+logger = getLogger(__name__)
+
+# fields of recorded programs searched by `Query.words`
+SEARCH_FIELDS = ["name", "description", "information", "episode_name"]
+NGRAM_SIZE = 2
+
+# separator of fields in the indexed text, which never appears in words
+_SEPARATOR = "\x1f"
+_REGEX_CHARS = set(".^$*+?{}[]\\|()")
+_KATAKANA_TO_HIRAGANA = {
+    **{code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)},
+    ord("ヽ"): ord("ゝ"),
+    ord("ヾ"): ord("ゞ"),
+}
+_BATCH_SIZE = 1000
+# seconds after which indexed programs are indexed again, so that the index
+# catches up with edited and removed programs
+REFRESH_AGE = 24 * 60 * 60
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes full-width/half-width forms by NFKC, cases and kana to hiragana."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return text.translate(_KATAKANA_TO_HIRAGANA)
+
+
+def is_regex(word: str) -> bool:
+    """Returns whether the word uses any syntax of regular expressions."""
+    return any(c in _REGEX_CHARS for c in word)
+
+
+def is_searchable(word: str) -> bool:
+    """Returns whether the word is searched by the index instead of `$regex`."""
+    return not is_regex(word) and len(normalize_text(word)) >= NGRAM_SIZE
+
+
+def to_ngrams(text: str) -> List[str]:
+    grams = {text[i : i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+    return sorted(gram for gram in grams if _SEPARATOR not in gram)
+
+
+def program_to_text(program: Dict[str, Any]) -> str:
+    """Joins normalized texts of `SEARCH_FIELDS` including elements of arrays."""
+    texts = []
+    for key in SEARCH_FIELDS:
+        value = program.get(key)
+        for element in value if isinstance(value, list) else [value]:
+            if isinstance(element, str):
+                texts.append(normalize_text(element))
+    return _SEPARATOR.join(texts)
+
+
+def _to_request(program: Dict[str, Any], indexed_at: dt.datetime) -> ReplaceOne:
+    text = program_to_text(program)
+    document = dict(text=text, tokens=to_ngrams(text), indexed_at=indexed_at)
+    return ReplaceOne({"_id": program["_id"]}, document, upsert=True)
+
+
+def _to_stale_condition(indexed_at: dt.datetime, max_age: int) -> Dict[str, Any]:
+    """Returns the condition of index documents older than `max_age` seconds,
+    including ones indexed before `indexed_at` was stored."""
+    threshold = indexed_at - dt.timedelta(seconds=max_age)
+    return {"$or": [{"indexed_at": {"$lt": threshold}}, {"indexed_at": None}]}
+
+
+def _to_refresh_requests(
+    program_ids: List[ObjectId],
+    programs: Iterable[Dict[str, Any]],
+    indexed_at: dt.datetime,
+) -> List[Union[ReplaceOne, DeleteOne]]:
+    """Returns requests indexing the programs again and removing missing ones."""
+    ret: List[Union[ReplaceOne, DeleteOne]] = []
+    found = set()
+    for program in programs:
+        ret.append(_to_request(program, indexed_at))
+        found.add(program["_id"])
+    ret += [DeleteOne({"_id": x}) for x in program_ids if x not in found]
+    return ret
+
+
+def _to_search_condition(word: str) -> Dict[str, Any]:
+    """Returns the condition of index documents containing the normalized word."""
+    return {"tokens": {"$all": to_ngrams(word)}, "text": {"$regex": re.escape(word)}}
+
+
+class SearchIndex:
+    """N-gram search index of recorded programs stored in the feeder database.
+
+    Each document has the normalized text of `SEARCH_FIELDS` and its n-gram
+    `tokens` keyed by `_id` of the recorded program, and the multikey index of
+    `tokens` narrows down candidates of words before matching the text.
+    Programs are indexed incrementally in the order of `_id`, so the last
+    indexed `_id` is the high-water mark of the next update. Edits and removals
+    of programs below the mark are not seen by it, so programs indexed more than
+    `max_age` seconds ago are indexed again or forgotten by each update, which
+    catches up with them within `REFRESH_AGE` by default.
+    """
+
+    def __init__(self, collection: pymongo.collection.Collection) -> None:
+        self.collection = collection
+        self._cache: Dict[str, List[ObjectId]] = {}
+
+    def update(
+        self,
+        programs: pymongo.collection.Collection,
+        rebuild: bool = False,
+        max_age: int = REFRESH_AGE,
+    ) -> int:
+        """Indexes recorded programs newer than the last indexed one, and ones
+        indexed more than `max_age` seconds ago again.
+
+        Args:
+            programs (`Collection`): Collection of recorded programs.
+            rebuild (bool): If True, drop the index and index all programs, e.g.
+                to forget removed programs and catch edited ones at once.
+            max_age (int): Seconds after which indexed programs are indexed again.
+
+        Returns:
+            int: Number of indexed or removed programs.
+        """
+        if rebuild:
+            self.collection.delete_many({})
+        self.collection.create_index("tokens")
+        self.collection.create_index("indexed_at")
+
+        indexed_at = dt.datetime.now()
+        latest = self.collection.find_one({}, ["_id"], sort=[("_id", -1)])
+        query = {"_id": {"$gt": latest["_id"]}} if latest else {}
+        cursor = programs.find(query, SEARCH_FIELDS, sort=[("_id", 1)])
+
+        ret = 0
+        requests = []
+        for program in cursor:
+            requests.append(_to_request(program, indexed_at))
+            if len(requests) >= _BATCH_SIZE:
+                ret += self._write(requests)
+        ret += self._write(requests)
+
+        stale = self.collection.find(_to_stale_condition(indexed_at, max_age), [])
+        stale_ids = [document["_id"] for document in stale]
+        for i in range(0, len(stale_ids), _BATCH_SIZE):
+            batch = stale_ids[i : i + _BATCH_SIZE]
+            cursor = programs.find({"_id": {"$in": batch}}, SEARCH_FIELDS)
+            ret += self._write(_to_refresh_requests(batch, cursor, indexed_at))
+        if ret > 0:
+            self._cache.clear()
+            logger.info(f"index {ret} program(s) for search")
+        return ret
+
+    def _write(self, requests: List[Union[ReplaceOne, DeleteOne]]) -> int:
+        ret = len(requests)
+        if requests:
+            # NOTE: ordered so that the last indexed `_id` stays a high-water mark
+            self.collection.bulk_write(requests)
+            requests.clear()
+        return ret
+
+    def search(self, word: str) -> List[ObjectId]:
+        """Returns ids of programs containing the normalized word."""
+        word = normalize_text(word)
+        if word not in self._cache:
+            documents = self.collection.find(_to_search_condition(word), [])
+            self._cache[word] = sorted(document["_id"] for document in documents)
+        return self._cache[word]
+
+    def to_words_condition(self, words: Iterable[str]) -> Dict[str, Any]:
+        """Resolves words into a condition replacing `$regex` of `Query.words`.
+
+        Words are resolved into `_id` of programs by the index, and only words
+        which are true regex patterns or too short for n-grams fall back to
+        `$regex` of the fields.
+        """
+        program_ids = set()
+        or_conditions = []
+        for word in words:
+            if is_searchable(word):
+                program_ids.update(self.search(word))
+            else:
+                or_conditions += [{key: {"$regex": word}} for key in SEARCH_FIELDS]
+        if not or_conditions or program_ids:
+            or_conditions.insert(0, {"_id": {"$in": sorted(program_ids)}})
+        return {"$or": or_conditions}
+
+
+class AsyncSearchIndex(SearchIndex):
+    """`SearchIndex` on motor for `AsyncFeeder`.
+
+    Words are searched in advance by `prefetch`, so that `to_words_condition`
+    resolves them from the cache without blocking.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection) -> None:
+        super().__init__(collection)
+
+    async def update(
+        self,
+        programs: AsyncIOMotorCollection,
+        rebuild: bool = False,
+        max_age: int = REFRESH_AGE,
+    ) -> int:
+        """Indexes recorded programs newer than the last indexed one.
+
+        See `SearchIndex.update`.
+        """
+        if rebuild:
+            await self.collection.delete_many({})
+        await self.collection.create_index("tokens")
+        await self.collection.create_index("indexed_at")
+
+        indexed_at = dt.datetime.now()
+        latest = await self.collection.find_one({}, ["_id"], sort=[("_id", -1)])
+        query = {"_id": {"$gt": latest["_id"]}} if latest else {}
+        cursor = programs.find(query, SEARCH_FIELDS, sort=[("_id", 1)])
+
+        ret = 0
+        requests = []
+        async for program in cursor:
+            requests.append(_to_request(program, indexed_at))
+            if len(requests) >= _BATCH_SIZE:
+                ret += await self._write(requests)
+        ret += await self._write(requests)
+
+        stale = self.collection.find(_to_stale_condition(indexed_at, max_age), [])
+        stale_ids = [document["_id"] async for document in stale]
+        for i in range(0, len(stale_ids), _BATCH_SIZE):
+            batch = stale_ids[i : i + _BATCH_SIZE]
+            cursor = programs.find({"_id": {"$in": batch}}, SEARCH_FIELDS)
+            found = await cursor.to_list(None)
+            ret += await self._write(_to_refresh_requests(batch, found, indexed_at))
+        if ret > 0:
+            self._cache.clear()
+            logger.info(f"index {ret} program(s) for search")
+        return ret
+
+    async def _write(self, requests: List[Union[ReplaceOne, DeleteOne]]) -> int:
+        ret = len(requests)
+        if requests:
+            # NOTE: ordered so that the last indexed `_id` stays a high-water mark
+            await self.collection.bulk_write(requests)
+            requests.clear()
+        return ret
+
+    async def prefetch(self, words: Iterable[str]) -> None:
+        """Searches words resolved by the index which are not cached yet."""
+        for word in words:
+            if not is_searchable(word):
+                continue
+            word = normalize_text(word)
+            if word not in self._cache:
+                cursor = self.collection.find(_to_search_condition(word), [])
+                documents = await cursor.to_list(None)
+                self._cache[word] = sorted(document["_id"] for document in documents)
+
+    def search(self, word: str) -> List[ObjectId]:
+        """Returns ids of programs containing the normalized word prefetched by
+        `prefetch`.
+
+        Raises:
+            RuntimeError: If the word is not prefetched, which cannot be searched
+                here without blocking the event loop.
+        """
+        word = normalize_text(word)
+        if word not in self._cache:
+            raise RuntimeError(f"'{word}' is not prefetched by `prefetch`")
+        return self._cache[word]
@@ -0,0 +1,402 @@
+from __future__ import annotations
+
+import collections
+import email.utils
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from bson import ObjectId
+
+from .config import Config
+from .output import _compress
+
+if TYPE_CHECKING:
+    from .feeder import Feeder
+
+logger = getLogger(__name__)
+
+FEED_PATH_PATTERN = re.compile(r"^/rss/([0-9A-Za-z_-]+)\.xml$")
+ARCHIVE_PATH_PATTERN = re.compile(r"^/rss/([0-9A-Za-z_-]+)/(archive-[0-9]+\.xml)$")
+RSS_CONTENT_TYPE = "application/rss+xml; charset=utf-8"
+
+
+@dataclass
+class CachedFeed:
+    """Rendered RSS feed held by `FeedCache`.
+
+    Attributes:
+        key (str): Hash of the config and the fingerprint of its programs, which is
+            also the ETag of the feed.
+        body (bytes): Content of the feed.
+        last_modified (float): Time when the feed was rendered.
+    """
+
+    key: str
+    body: bytes
+    last_modified: float
+    _gzip_body: Optional[bytes] = field(default=None, repr=False)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self._gzip_body or b"")
+
+
+class FeedCache:
+    """LRU cache of rendered RSS feeds in memory with disk as the second tier.
+
+    Feeds are keyed by the hash of the config and the fingerprint of its
+    programs, so that stale entries are never hit but only evicted. Feeds evicted
+    from memory are read again from `<cache_dir>/<key>.xml`, and the least
+    recently written files are removed beyond `max_disk_entries`.
+
+    Args:
+        max_bytes (int): Maximum total size of feeds held in memory.
+        cache_dir (str or `Path`): Directory of the disk tier. Disabled if None.
+        max_disk_entries (int): Maximum number of feed files in `cache_dir`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_disk_entries: int = 1000,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._cache_dir = Path(cache_dir) if cache_dir else None
+        self._max_disk_entries = max_disk_entries
+        self._feeds = collections.OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        if self._cache_dir is not None:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._feeds)
+
+    def get(self, key: str) -> Optional[CachedFeed]:
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is not None:
+                self._feeds.move_to_end(key)
+                return feed
+        if self._cache_dir is None:
+            return None
+        path = self._cache_dir / f"{key}.xml"
+        try:
+            feed = CachedFeed(key, path.read_bytes(), path.stat().st_mtime)
+        except FileNotFoundError:
+            return None
+        self._put_memory(feed)
+        return feed
+
+    def put(self, key: str, body: bytes) -> CachedFeed:
+        feed = CachedFeed(key, body, time.time())
+        if self._cache_dir is not None:
+            self._write_disk(feed)
+        self._put_memory(feed)
+        return feed
+
+    def gzip_body(self, feed: CachedFeed) -> bytes:
+        """Returns the feed compressed by gzip, keeping it with the feed."""
+        if feed._gzip_body is None:
+            body = _compress(feed.body, "gzip")
+            with self._lock:
+                if feed._gzip_body is None:
+                    feed._gzip_body = body
+                    if self._feeds.get(feed.key) is feed:
+                        self._num_bytes += len(body)
+                        self._evict()
+        return feed._gzip_body
+
+    def _put_memory(self, feed: CachedFeed) -> None:
+        with self._lock:
+            old = self._feeds.pop(feed.key, None)
+            if old is not None:
+                self._num_bytes -= old.size
+            self._feeds[feed.key] = feed
+            self._num_bytes += feed.size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._num_bytes > self._max_bytes and len(self._feeds) > 1:
+            _, feed = self._feeds.popitem(last=False)
+            self._num_bytes -= feed.size
+
+    def _write_disk(self, feed: CachedFeed) -> None:
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self._cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(feed.body)
+        path = self._cache_dir / f"{feed.key}.xml"
+        os.replace(temp_path, path)
+        os.utime(path, (feed.last_modified, feed.last_modified))
+
+        paths = list(self._cache_dir.glob("*.xml"))
+        if len(paths) > self._max_disk_entries:
+            paths.sort(key=lambda x: x.stat().st_mtime)
+            for path in paths[: len(paths) - self._max_disk_entries]:
+                path.unlink(missing_ok=True)
+
+
+def _to_cache_key(fingerprint: Dict) -> str:
+    data = json.dumps(fingerprint, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def _parse_etags(value: str) -> List[str]:
+    etags = []
+    for etag in value.split(","):
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        etags.append(etag.strip('"'))
+    return etags
+
+
+def _accepts_gzip(value: Optional[str]) -> bool:
+    for coding in (value or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ["gzip", "*"]:
+            continue
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        return match is None or float(match.group(1)) > 0
+    return False
+
+
+class FeedServer:
+    """HTTP server rendering RSS feeds of configs on demand.
+
+    `GET /rss/<config_id>.xml` renders the feed by `Feeder.render_feed` when the
+    config or its programs changed, and otherwise returns the feed cached by
+    `FeedCache`. Recorded programs are polled cheaply by their latest `_id` and
+    count at most every `poll_interval` seconds, and the summaries of programs
+    of configs are aggregated again only after they changed. Responses have ETag
+    and Last-Modified for conditional requests, and they are compressed by gzip
+    if accepted. Archive pages of paged configs are served from the RSS root.
+
+    Examples:
+        >>> with Feeder(...) as feeder:
+        ...     FeedServer(feeder, FeedCache(cache_dir="cache")).serve("", 8080)
+    """
+
+    def __init__(
+        self,
+        feeder: Feeder,
+        cache: Optional[FeedCache] = None,
+        pretty: bool = True,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self._feeder = feeder
+        self._cache = cache or FeedCache()
+        self._pretty = pretty
+        self._poll_interval = poll_interval
+        self._poll_lock = threading.Lock()
+        self._polled_at: Optional[float] = None
+        self._recorder_state: Optional[Tuple[Any, ...]] = None
+        # whether a request is updating the search index for a new state
+        self._updating = False
+        # config id -> (recorder state, config hash, summary of programs)
+        self._summaries: Dict[Any, Tuple[Tuple[Any, ...], str, Dict[str, Any]]] = {}
+        # feeds are rendered one by one since the media probe cache is not
+        # thread-safe, while cached feeds are served concurrently
+        self._render_lock = threading.Lock()
+
+    def _poll_recorder(self) -> Tuple[Any, ...]:
+        with self._poll_lock:
+            now = time.monotonic()
+            if (
+                self._polled_at is not None
+                and now - self._polled_at < self._poll_interval
+            ) or self._updating:
+                return self._recorder_state
+            self._polled_at = now
+            recorder_state = self._feeder._poll_recorder()
+            if recorder_state == self._recorder_state:
+                return recorder_state
+            self._updating = True
+
+        # NOTE: other requests are served by the previous state meanwhile, not
+        # waiting for the search index
+        try:
+            if self._feeder._use_search_index:
+                self._feeder.update_search_index()
+            with self._render_lock:
+                self._clear_caches()
+            with self._poll_lock:
+                self._recorder_state = recorder_state
+        finally:
+            self._updating = False
+        return recorder_state
+
+    def _clear_caches(self) -> None:
+        """Forgets programs of the previous recorder state held in memory."""
+        if self._feeder._item_store is not None:
+            self._feeder._item_store.clear()
+        self._feeder._media_cache.clear()
+        # list again only media directories changed by the new programs
+        self._feeder._media_index.refresh()
+        # summaries of the previous state are never hit again, including those
+        # of removed configs
+        self._summaries = {}
+
+    def _find_programs_summary(self, config: Config, config_id: Any) -> Dict[str, Any]:
+        recorder_state = self._poll_recorder()
+        config_hash = config.to_hash()
+        cached = self._summaries.get(config_id)
+        if cached is not None and cached[:2] == (recorder_state, config_hash):
+            return cached[2]
+        summary = self._feeder._find_programs_summary(config)
+        self._summaries[config_id] = (recorder_state, config_hash, summary)
+        return summary
+
+    def get_feed(self, config_id: str) -> Optional[CachedFeed]:
+        """Returns the feed of the config, rendering it if the cache is stale.
+
+        Returns:
+            `CachedFeed`: The feed, or None if the config is not registered or
+                the feed has no items.
+        """
+        if ObjectId.is_valid(config_id):
+            config_id = ObjectId(config_id)
+        data = self._feeder.feeder_db.configs.find_one({"_id": config_id})
+        if data is None:
+            return None
+        config = Config.from_dict(data)
+        summary = self._find_programs_summary(config, config_id)
+        if not summary["num_programs"]:
+            return None
+        key = _to_cache_key(
+            self._feeder._create_fingerprint(config, summary, self._pretty)
+        )
+        feed = self._cache.get(key)
+        if feed is not None:
+            return feed
+
+        with self._render_lock:
+            feed = self._cache.get(key)
+            if feed is not None:
+                return feed
+            logger.info(f"render RSS feed: {config_id}")
+            body = self._feeder.render_feed(
+                config, config_id, pretty=self._pretty, summary=summary
+            )
+            if body is None:
+                return None
+            return self._cache.put(key, body)
+
+    @property
+    def cache(self) -> FeedCache:
+        return self._cache
+
+    def archive_page_path(self, config_id: str, name: str) -> Path:
+        return self._feeder._archive_root(config_id) / name
+
+    def create_server(self, host: str = "", port: int = 8080) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer((host, port), _FeedRequestHandler)
+        server.daemon_threads = True
+        server.feed_server = self
+        return server
+
+    def serve(self, host: str = "", port: int = 8080) -> None:
+        """Serves RSS feeds until the server is shut down."""
+        with self.create_server(host, port) as server:
+            logger.info(f"serve RSS feeds on {server.server_address}")
+            server.serve_forever()
+
+
+class _FeedRequestHandler(BaseHTTPRequestHandler):
+    server_version = "jadio-feeder"
+
+    def do_GET(self) -> None:
+        self._handle(send_body=True)
+
+    def do_HEAD(self) -> None:
+        self._handle(send_body=False)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _handle(self, send_body: bool) -> None:
+        path = self.path.split("?", 1)[0]
+        try:
+            match = FEED_PATH_PATTERN.match(path)
+            if match is not None:
+                feed = self.server.feed_server.get_feed(match.group(1))
+                if feed is None:
+                    self.send_error(HTTPStatus.NOT_FOUND)
+                    return
+                self._send_feed(feed, send_body)
+                return
+            match = ARCHIVE_PATH_PATTERN.match(path)
+            if match is not None:
+                self._send_archive_page(*match.groups(), send_body)
+                return
+            self.send_error(HTTPStatus.NOT_FOUND)
+        except Exception as err:
+            logger.error(f"failed to serve {path}: {err}", exc_info=True)
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def _send_archive_page(self, config_id: str, name: str, send_body: bool) -> None:
+        path = self.server.feed_server.archive_page_path(config_id, name)
+        try:
+            body = path.read_bytes()
+            last_modified = path.stat().st_mtime
+        except FileNotFoundError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        etag = hashlib.sha1(body).hexdigest()
+        self._send_feed(CachedFeed(etag, body, last_modified), send_body)
+
+    def _is_not_modified(self, feed: CachedFeed) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            etags = _parse_etags(if_none_match)
+            return "*" in etags or any(etag.split("-")[0] == feed.key for etag in etags)
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return int(feed.last_modified) <= since.timestamp()
+        return False
+
+    def _send_feed(self, feed: CachedFeed, send_body: bool) -> None:
+        use_gzip = _accepts_gzip(self.headers.get("Accept-Encoding"))
+        # the compressed feed is a different representation of the same feed
+        etag = f"{feed.key}-gzip" if use_gzip else feed.key
+        headers: List[Tuple[str, str]] = [
+            ("ETag", f'"{etag}"'),
+            ("Last-Modified", email.utils.formatdate(feed.last_modified, usegmt=True)),
+            ("Cache-Control", "no-cache"),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if self._is_not_modified(feed):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        body = feed.body
+        if use_gzip:
+            body = self.server.feed_server.cache.gzip_body(feed)
+            headers.append(("Content-Encoding", "gzip"))
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", RSS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
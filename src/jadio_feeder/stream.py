@@ -0,0 +1,380 @@
+from __future__ import annotations
+
+import datetime as dt
+import io
+import itertools
+import re
+from logging import getLogger
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    BinaryIO,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from bson import ObjectId
+
+from . import metrics
+from .podcast import (
+    RADIKO_LINK,
+    PathLike,
+    PodcastChannel,
+    PodcastItem,
+    _datetime_to_pub_data,
+)
+
+if TYPE_CHECKING:
+    from jadio import Program
+
+    from .items import ItemStore
+    from .media import MediaProbeCache
+    from .media_index import MediaIndex
+
+logger = getLogger(__name__)
+
+# same namespaces and their order as feedgen with podcast extension
+NAMESPACES = {
+    "itunes": "http://www.itunes.com/dtds/podcast-1.0.dtd",
+    "atom": "http://www.w3.org/2005/Atom",
+    "content": "http://purl.org/rss/1.0/modules/content/",
+}
+# namespace of `fh:archive` of RFC 5005 archived feeds
+FEED_HISTORY_NAMESPACE = "http://purl.org/syndication/history/1.0"
+RSS_DOCS = "http://www.rssboard.org/rss-specification"
+RSS_GENERATOR = "python-feedgen"
+# elements enclosing items, which determine the indentation of item fragments
+ITEM_PARENTS = ("rss", "channel")
+# number of items whose stored fragments are fetched by one query
+ITEM_BATCH_SIZE = 256
+# characters rejected by lxml, which are not allowed in XML 1.0
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _escape_text(text: str) -> str:
+    # same error as lxml for strings which cannot be written in XML
+    if _INVALID_XML_CHARS.search(text):
+        raise ValueError(
+            "All strings must be XML compatible: "
+            "Unicode or ASCII, no NULL bytes or control characters"
+        )
+    # same escaping as libxml2 for text nodes
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace("\r", "&#13;")
+    )
+
+
+def _escape_attrib(text: str) -> str:
+    # same escaping as libxml2 for attribute values
+    return (
+        _escape_text(text)
+        .replace('"', "&quot;")
+        .replace("\n", "&#10;")
+        .replace("\t", "&#9;")
+    )
+
+
+def _format_build_date(datetime: dt.datetime) -> str:
+    return datetime.strftime("%a, %d %b %Y %H:%M:%S %z")
+
+
+class _XmlStreamWriter:
+    """Minimal incremental XML writer whose output is identical to lxml's.
+
+    Elements are written to the file as soon as they are given, and only the
+    stack of open elements is kept in memory. Indentation of `pretty` follows
+    lxml's `pretty_print`.
+    """
+
+    def __init__(
+        self, f: BinaryIO, pretty: bool = True, parents: Sequence[str] = ()
+    ) -> None:
+        self._f = f
+        self._pretty = pretty
+        self._stack: List[str] = list(parents)
+
+    def _write(self, text: str) -> None:
+        self._f.write(text.encode("utf-8"))
+
+    def _indent(self) -> None:
+        if self._pretty and self._stack:
+            self._write("\n" + "  " * len(self._stack))
+
+    def _start_tag(self, tag: str, attrib: Optional[Dict[str, str]]) -> str:
+        attrib = attrib or {}
+        attrib = "".join(f' {k}="{_escape_attrib(v)}"' for k, v in attrib.items())
+        return f"<{tag}{attrib}"
+
+    def fragment(self, text: str) -> None:
+        """Writes a fragment rendered at the current depth by `render_item`."""
+        self._write(text)
+
+    def declaration(self) -> None:
+        self._write("<?xml version='1.0' encoding='UTF-8'?>\n")
+
+    def start(self, tag: str, attrib: Optional[Dict[str, str]] = None) -> None:
+        self._indent()
+        self._write(self._start_tag(tag, attrib) + ">")
+        self._stack.append(tag)
+
+    def end(self) -> None:
+        tag = self._stack.pop()
+        if self._pretty:
+            self._write("\n" + "  " * len(self._stack))
+        self._write(f"</{tag}>")
+        if self._pretty and not self._stack:
+            self._write("\n")
+
+    def element(
+        self,
+        tag: str,
+        text: Optional[str] = None,
+        attrib: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self._indent()
+        if text is None:
+            self._write(self._start_tag(tag, attrib) + "/>")
+        else:
+            text = _escape_text(text)
+            self._write(f"{self._start_tag(tag, attrib)}>{text}</{tag}>")
+
+
+def _write_channel(
+    xml: _XmlStreamWriter,
+    channel: PodcastChannel,
+    last_build_date: str,
+) -> None:
+    # same elements and their order as `PodcastChannel.to_feed_generator`
+    # and `feedgen.feed.FeedGenerator.rss_str`
+    if not (channel.title and channel.description):
+        raise ValueError("Required fields not set (title, description)")
+    xml.element("title", channel.title)
+    xml.element("link", channel.link or RADIKO_LINK)
+    xml.element("description", channel.description)
+    if channel.copyright:
+        xml.element("copyright", channel.copyright)
+    xml.element("docs", RSS_DOCS)
+    xml.element("generator", RSS_GENERATOR)
+    if channel.language:
+        xml.element("language", channel.language)
+    xml.element("lastBuildDate", last_build_date)
+
+    # podcast extension
+    if channel.itunes_author:
+        xml.element("itunes:author", channel.itunes_author)
+    xml.element("itunes:block", "yes" if channel.itunes_block else "no")
+    category = channel.itunes_category
+    if category and category.cat:
+        attrib = {"text": category.cat}
+        if category.sub:
+            xml.start("itunes:category", attrib)
+            xml.element("itunes:category", attrib={"text": category.sub})
+            xml.end()
+        else:
+            xml.element("itunes:category", attrib=attrib)
+    if channel.itunes_image:
+        xml.element("itunes:image", attrib={"href": channel.itunes_image})
+    xml.element("itunes:explicit", "yes" if channel.itunes_explicit else "no")
+    xml.element("itunes:complete", "yes" if channel.itunes_complete else "no")
+    if channel.itunes_new_feed_url:
+        xml.element("itunes:new-feed-url", channel.itunes_new_feed_url)
+    xml.element("itunes:type", channel.itunes_type.value)
+
+
+def _start_feed(
+    xml: _XmlStreamWriter,
+    channel: PodcastChannel,
+    last_build_date: str,
+    links: Optional[Dict[str, str]] = None,
+    archive: bool = False,
+) -> None:
+    xml.declaration()
+    attrib = {f"xmlns:{key}": value for key, value in NAMESPACES.items()}
+    if archive:
+        attrib["xmlns:fh"] = FEED_HISTORY_NAMESPACE
+    xml.start("rss", {**attrib, "version": "2.0"})
+    xml.start("channel")
+    _write_channel(xml, channel, last_build_date)
+    # RFC 5005 links such as "current", "prev-archive" and "next-archive"
+    for rel, href in (links or {}).items():
+        xml.element("atom:link", attrib={"href": href, "rel": rel})
+    if archive:
+        xml.element("fh:archive")
+
+
+def _end_feed(xml: _XmlStreamWriter) -> None:
+    xml.end()
+    xml.end()
+
+
+def _write_item(xml: _XmlStreamWriter, item: PodcastItem) -> None:
+    # same elements and their order as `PodcastItem.set_feed_entry`
+    # and `feedgen.entry.FeedEntry.rss_entry`
+    xml.start("item")
+    if item.title:
+        xml.element("title", item.title)
+    xml.element("link", item.link or RADIKO_LINK)
+    if item.description:
+        xml.element("description", item.description)
+    if item.guid:
+        xml.element("guid", item.guid, attrib={"isPermaLink": "false"})
+    enclosure = item.enclosure
+    attrib = {
+        "url": enclosure.url,
+        # NOTE: feedgen writes "None" if the length is unknown
+        "length": str(enclosure.length),
+        "type": enclosure.type,
+    }
+    xml.element("enclosure", attrib=attrib)
+    if item.pub_date:
+        xml.element("pubDate", _datetime_to_pub_data(item.pub_date))
+
+    # podcast extension
+    xml.element("itunes:block", "yes" if item.itunes_block else "no")
+    if item.itunes_image:
+        xml.element("itunes:image", attrib={"href": item.itunes_image})
+    if item.itunes_duration is not None:
+        xml.element("itunes:duration", str(int(item.itunes_duration)))
+    xml.element("itunes:explicit", "yes" if item.itunes_explicit else "no")
+    if item.itunes_season:
+        xml.element("itunes:season", str(item.itunes_season))
+    if item.itunes_episode:
+        xml.element("itunes:episode", str(item.itunes_episode))
+    if item.itunes_title:
+        xml.element("itunes:title", item.itunes_title)
+    xml.element("itunes:episodeType", item.itunes_episode_type.value)
+    xml.end()
+
+
+def render_item(item: PodcastItem, pretty: bool = True) -> str:
+    """Renders `<item>` of the item to an XML fragment, which is written by
+    `PodcastRssStreamWriter` as it is, including the indentation of `pretty`."""
+    f = io.BytesIO()
+    _write_item(_XmlStreamWriter(f, pretty=pretty, parents=ITEM_PARENTS), item)
+    return f.getvalue().decode("utf-8")
+
+
+class PodcastRssStreamWriter:
+    """Writer of podcast RSS feeds streaming items one by one to the file.
+
+    This is an alternative to `PodcastRssFeedGenCreator` that never holds the whole
+    feed in memory. Items must be given already sorted and deduplicated, e.g. from
+    a sorted cursor, and the output is the same bytes as feedgen's `rss_file`
+    except for `lastBuildDate`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        media_root: PathLike,
+        media_cache: Optional[MediaProbeCache] = None,
+        media_index: Optional[MediaIndex] = None,
+        item_store: Optional[ItemStore] = None,
+    ) -> None:
+        """
+        Args:
+            item_store (`ItemStore`): If given, items are written from fragments
+                stored in it instead of being built and rendered for each feed.
+        """
+        self.base_url = base_url
+        self.media_root = Path(media_root)
+        self.media_cache = media_cache
+        self.media_index = media_index
+        self.item_store = item_store
+
+    def _write_items(
+        self,
+        xml: _XmlStreamWriter,
+        program_and_id_pairs: Iterable[Tuple[Program, ObjectId]],
+    ) -> int:
+        ret = 0
+        pairs = iter(program_and_id_pairs)
+        while True:
+            batch = list(itertools.islice(pairs, ITEM_BATCH_SIZE))
+            if not batch:
+                return ret
+            if self.media_cache is not None and self.media_index is not None:
+                self.media_cache.prefetch_programs(batch, self.media_index)
+            for program, program_id in batch:
+                try:
+                    with metrics.stage("item_build"):
+                        item = PodcastItem.from_program(
+                            program,
+                            program_id,
+                            self.base_url,
+                            self.media_root,
+                            media_cache=self.media_cache,
+                            media_index=self.media_index,
+                        )
+                    with metrics.stage("render"):
+                        _write_item(xml, item)
+                    ret += 1
+                except Exception as err:
+                    logger.error(f"error: {err}\n{program}", stack_info=True)
+                    raise err
+
+    def _write_stored_items(
+        self,
+        xml: _XmlStreamWriter,
+        program_and_id_pairs: Iterable[Tuple[Program, ObjectId]],
+        pretty: bool,
+    ) -> int:
+        ret = 0
+        pairs = iter(program_and_id_pairs)
+        while True:
+            batch = list(itertools.islice(pairs, ITEM_BATCH_SIZE))
+            if not batch:
+                return ret
+            self.item_store.prefetch([program_id for _, program_id in batch])
+            for program, program_id in batch:
+                try:
+                    fragment = self.item_store.fragment(program, program_id, pretty)
+                    with metrics.stage("render"):
+                        xml.fragment(fragment)
+                    ret += 1
+                except Exception as err:
+                    logger.error(f"error: {err}\n{program}", stack_info=True)
+                    raise err
+
+    def write(
+        self,
+        f: BinaryIO,
+        program_and_id_pairs: Iterable[Tuple[Program, ObjectId]],
+        channel: PodcastChannel,
+        pretty: bool = True,
+        last_build_date: Optional[str] = None,
+        links: Optional[Dict[str, str]] = None,
+        archive: bool = False,
+    ) -> int:
+        """Writes RSS feed to the binary file object.
+
+        Args:
+            links (dict): Map of `rel` to `href` of RFC 5005 `atom:link`s.
+            archive (bool): If True, the feed is marked as an archive page by
+                `fh:archive`.
+
+        Returns:
+            int: Number of written items.
+        """
+        last_build_date = last_build_date or _format_build_date(
+            dt.datetime.now(dt.timezone.utc)
+        )
+        xml = _XmlStreamWriter(f, pretty=pretty)
+        with metrics.stage("render"):
+            _start_feed(xml, channel, last_build_date, links=links, archive=archive)
+
+        if self.item_store is None:
+            ret = self._write_items(xml, program_and_id_pairs)
+        else:
+            ret = self._write_stored_items(xml, program_and_id_pairs, pretty)
+
+        with metrics.stage("render"):
+            _end_feed(xml)
+        return ret
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import datetime as dt
+import os
+import socket
+import threading
+import uuid
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Dict, Iterable, Optional
+
+import pymongo
+import pymongo.collection
+from pymongo import IndexModel, ReturnDocument
+
+from .indexes import ensure_collection_indexes
+
+logger = getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 60.0
+# configs whose leases expired this many times, e.g. by crashing workers every
+# time, are no longer claimed until they are enqueued again
+DEFAULT_MAX_ATTEMPTS = 3
+
+# pending configs are claimed in the order of `priority`, and expired leases
+# are found by `lease_expires_at`
+QUEUE_INDEXES = [
+    IndexModel(
+        [("enqueued_at", pymongo.ASCENDING), ("priority", pymongo.ASCENDING)],
+        name="enqueued_at_priority",
+    ),
+    IndexModel([("lease_expires_at", pymongo.ASCENDING)], name="lease_expires_at"),
+    IndexModel([("owner", pymongo.ASCENDING)], name="owner"),
+]
+
+
+def create_owner_id() -> str:
+    """Returns an id of a worker unique across hosts and processes."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _now() -> dt.datetime:
+    # NOTE: leases are compared with clocks of other hosts, which are assumed to
+    # be synchronized well within the lease duration
+    return dt.datetime.utcnow()
+
+
+@dataclass
+class Lease:
+    """Config claimed by a worker until `expires_at` unless it is extended."""
+
+    config_id: Any
+    owner: str
+    expires_at: dt.datetime
+    attempts: int
+
+
+class WorkQueue:
+    """Queue of configs whose feeds are built by workers on many hosts.
+
+    Each config has one document in the collection. `enqueue` marks configs as
+    pending, and a worker claims a pending config by an atomic
+    `find_one_and_update`, which leases the config to the worker until the lease
+    expires. Leases of a worker are extended by its heartbeat, so that configs of
+    crashed workers are claimed again by others once their leases expire.
+    Configs enqueued together form a round, which lasts while any of them is
+    pending or leased, and each config is built once per round even if runs on
+    many hosts enqueue it. The result of the last update is recorded per config.
+
+    Examples:
+        >>> queue = WorkQueue(feeder_db.queue)
+        >>> queue.enqueue(config_ids)
+        >>> with queue.heartbeat(owner):
+        ...     while (lease := queue.claim(owner)) is not None:
+        ...         queue.complete(lease, dict(updated=True))
+    """
+
+    def __init__(
+        self,
+        collection: pymongo.collection.Collection,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        self._collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def ensure_indexes(self) -> None:
+        ensure_collection_indexes(self._collection, QUEUE_INDEXES)
+
+    def enqueue(self, config_ids: Iterable[Any]) -> int:
+        """Marks configs as pending in the order of priority.
+
+        Configs which are pending, leased, or finished in the current round are
+        skipped, so that runs started on other hosts in the middle of a round
+        join it instead of building its configs again.
+
+        Returns:
+            int: Number of enqueued configs.
+        """
+        now = _now()
+        config_ids = list(config_ids)
+        active = self._active_condition(now)
+        round_doc = self._collection.find_one(
+            active, {"round_started_at": 1}, sort=[("round_started_at", 1)]
+        )
+        round_started_at = (round_doc or {}).get("round_started_at") or now
+        skipped = [active]
+        if round_doc is not None:
+            skipped.append({"result.finished_at": {"$gte": round_started_at}})
+        existing = {
+            doc["_id"]
+            for doc in self._collection.find({"_id": {"$in": config_ids}}, {"_id": 1})
+        }
+
+        requests = []
+        for i, config_id in enumerate(config_ids):
+            fields = {
+                "enqueued_at": now,
+                "priority": i,
+                "attempts": 0,
+                "round_started_at": round_started_at,
+            }
+            if config_id in existing:
+                # NOTE: skipped configs are checked again by the update in case
+                # another host enqueued or claimed them meanwhile
+                request = pymongo.UpdateOne(
+                    {"_id": config_id, "$nor": skipped},
+                    {
+                        "$set": fields,
+                        # e.g. leases which expired too many times
+                        "$unset": {
+                            "owner": "",
+                            "lease_expires_at": "",
+                            "heartbeat_at": "",
+                        },
+                    },
+                )
+            else:
+                request = pymongo.UpdateOne(
+                    {"_id": config_id}, {"$setOnInsert": fields}, upsert=True
+                )
+            requests.append(request)
+        ret = 0
+        if requests:
+            result = self._collection.bulk_write(requests, ordered=False)
+            ret = result.modified_count + result.upserted_count
+        logger.info(f"enqueue {ret} / {len(requests)} config(s)")
+        return ret
+
+    def _active_condition(self, now: dt.datetime) -> Dict[str, Any]:
+        """Returns the condition of configs which are pending or leased."""
+        return {
+            "$or": [
+                {"enqueued_at": {"$ne": None}},
+                {"owner": {"$ne": None}, "lease_expires_at": {"$gte": now}},
+                # expired leases are claimed again unless they expired too many
+                # times
+                {"owner": {"$ne": None}, "attempts": {"$lt": self.max_attempts}},
+            ]
+        }
+
+    def remove_missing(self, config_ids: Iterable[Any]) -> int:
+        """Removes configs other than `config_ids`, e.g. unregistered ones.
+
+        Returns:
+            int: Number of removed configs.
+        """
+        ret = self._collection.delete_many({"_id": {"$nin": list(config_ids)}})
+        return ret.deleted_count
+
+    def claim(self, owner: str) -> Optional[Lease]:
+        """Leases a pending config, or a config whose lease expired, to the owner.
+
+        Returns:
+            `Lease`: Claimed config, or None if no config is left to claim.
+        """
+        now = _now()
+        expires_at = now + dt.timedelta(seconds=self.lease_seconds)
+        doc = self._collection.find_one_and_update(
+            {
+                "attempts": {"$lt": self.max_attempts},
+                "$or": [
+                    {"enqueued_at": {"$ne": None}, "owner": None},
+                    {"lease_expires_at": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "owner": owner,
+                    "lease_expires_at": expires_at,
+                    "heartbeat_at": now,
+                    "enqueued_at": None,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", pymongo.ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return None
+        if doc["attempts"] > 1:
+            logger.warning(f"reclaim {doc['_id']} (attempt {doc['attempts']})")
+        return Lease(doc["_id"], owner, expires_at, doc["attempts"])
+
+    def extend(self, owner: str) -> int:
+        """Extends all leases of the owner.
+
+        Returns:
+            int: Number of extended leases.
+        """
+        now = _now()
+        ret = self._collection.update_many(
+            {"owner": owner},
+            {
+                "$set": {
+                    "lease_expires_at": now + dt.timedelta(seconds=self.lease_seconds),
+                    "heartbeat_at": now,
+                }
+            },
+        )
+        return ret.modified_count
+
+    def complete(self, lease: Lease, result: Dict[str, Any]) -> bool:
+        """Releases the lease and records the result of the config.
+
+        Returns:
+            bool: Whether the lease was still held by the owner. If False, the
+                config has been reclaimed by another worker, whose result wins.
+        """
+        ret = self._collection.update_one(
+            {"_id": lease.config_id, "owner": lease.owner},
+            {
+                "$set": {
+                    "result": dict(result, worker=lease.owner, finished_at=_now()),
+                    "attempts": 0,
+                },
+                "$unset": {"owner": "", "lease_expires_at": "", "heartbeat_at": ""},
+            },
+        )
+        if ret.matched_count == 0:
+            logger.warning(f"lost the lease of {lease.config_id}")
+            return False
+        return True
+
+    def heartbeat(self, owner: str) -> _Heartbeat:
+        """Returns a context extending leases of the owner in the background."""
+        return _Heartbeat(self, owner)
+
+    def count_pending(self) -> int:
+        return self._collection.count_documents({"enqueued_at": {"$ne": None}})
+
+
+class _Heartbeat:
+    def __init__(self, queue: WorkQueue, owner: str) -> None:
+        self._queue = queue
+        self._owner = owner
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        # extend leases well before they expire
+        while not self._stopped.wait(self._queue.lease_seconds / 3):
+            try:
+                self._queue.extend(self._owner)
+            except Exception as err:
+                logger.warning(f"failed to extend leases of {self._owner}: {err}")
+
+    def __enter__(self) -> _Heartbeat:
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stopped.set()
+        self._thread.join()
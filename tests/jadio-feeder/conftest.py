@@ -0,0 +1,17 @@
+from unittest import mock
+
+import pytest
+
+from jadio_feeder import connection
+
+
+@pytest.fixture
+def client():
+    """Makes `Feeder` use one in-memory mongomock client for both databases."""
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient()
+    # clients are not shared with other tests, e.g. by feeders of workers left open
+    with mock.patch.object(
+        connection, "_manager", connection.ConnectionManager()
+    ), mock.patch.object(connection, "create_client", lambda host, options: client):
+        yield client
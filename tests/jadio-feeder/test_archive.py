@@ -0,0 +1,53 @@
+from bson import ObjectId
+
+from jadio_feeder.archive import paginate
+
+
+def create_program_ids(num_programs: int):
+    return [ObjectId(f"{i:024x}") for i in range(num_programs)]
+
+
+def test_paginate():
+    program_ids = create_program_ids(7)
+    pages = paginate(program_ids, 3)
+
+    assert [page.name for page in pages] == ["archive-1.xml", "archive-2.xml"]
+    assert pages[0].program_ids == program_ids[0:3]
+    assert pages[1].program_ids == program_ids[3:6]
+    assert (pages[0].prev_name, pages[0].next_name) == (None, "archive-2.xml")
+    assert (pages[1].prev_name, pages[1].next_name) == ("archive-1.xml", None)
+
+
+def test_paginate_keys_of_complete_pages_are_stable():
+    keys = [page.to_key() for page in paginate(create_program_ids(7), 3)]
+    new_keys = [page.to_key() for page in paginate(create_program_ids(8), 3)]
+    assert keys == new_keys
+
+    # only the last page gets the next link when the next page is completed
+    new_keys = [page.to_key() for page in paginate(create_program_ids(9), 3)]
+    assert keys[0] == new_keys[0]
+    assert keys[1] != new_keys[1]
+
+
+def test_paginate_salt():
+    page = paginate(create_program_ids(3), 3)[0]
+    assert page.to_key(salt=dict(pretty=True)) != page.to_key(salt=dict(pretty=False))
+
+
+def test_paginate_completed_pages():
+    program_ids = create_program_ids(9)
+    completed = [page.program_ids for page in paginate(program_ids[:7], 3)]
+
+    # removed programs leave completed pages as they are
+    pages = paginate(program_ids[:1] + program_ids[2:], 3, completed)
+    assert [page.program_ids for page in pages] == [
+        program_ids[0:3],
+        program_ids[3:6],
+        program_ids[6:9],
+    ]
+
+    # programs recorded later are appended after completed pages
+    late_program_ids = [ObjectId(f"{100:024x}")] + program_ids[6:8]
+    pages = paginate(program_ids[:6] + late_program_ids, 3, completed)
+    assert [page.program_ids for page in pages[:2]] == completed
+    assert pages[2].program_ids == late_program_ids
@@ -0,0 +1,76 @@
+import argparse
+import os
+import subprocess
+import sys
+from typing import Optional, Set, Tuple
+
+import pytest
+
+from jadio_feeder.cli import SUBCOMMANDS
+
+# budgets of the cumulative import time of `jadio_feeder.cli` and a handler in
+# milliseconds, which are generous enough for slow machines but catch heavy
+# modules imported at the top level again
+HELP_BUDGET_MS = 200
+HANDLER_BUDGETS_MS = {
+    "configs": 700,
+    "feeds": 900,
+    "serve": 900,
+}
+
+# modules imported only when a feed is rendered or a config is matched
+HEAVY_MODULES = {"feedgen", "lxml", "mutagen", "numpy", "tqdm", "jadio_recorder"}
+HELP_FORBIDDEN_MODULES = HEAVY_MODULES | {"pymongo", "bson", "tabulate", "yaml"}
+
+
+def _handler_of(add_argument_fn) -> str:
+    parser = argparse.ArgumentParser()
+    add_argument_fn(parser)
+    return parser.get_default("handler")
+
+
+def _import_time(handler: Optional[str]) -> Tuple[float, Set[str]]:
+    code = "import jadio_feeder.cli as cli"
+    if handler is not None:
+        code += f"; cli.resolve_handler({handler!r})"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    # lines are "import time: <self> | <cumulative> | <name>", whose names are
+    # indented by two more spaces per nesting level
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip().split(".")[0])
+        if name.startswith(" ") and not name.startswith("   "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def _subcommand_params():
+    return [
+        pytest.param(_handler_of(add_argument_fn), id=name)
+        for name, add_argument_fn in SUBCOMMANDS
+    ]
+
+
+def test_help_import_time():
+    elapsed_ms, modules = _import_time(None)
+    assert not modules & HELP_FORBIDDEN_MODULES
+    assert elapsed_ms < HELP_BUDGET_MS
+
+
+@pytest.mark.parametrize("handler", _subcommand_params())
+def test_subcommand_import_time(handler: str):
+    elapsed_ms, modules = _import_time(handler)
+    assert not modules & HEAVY_MODULES
+    assert elapsed_ms < HANDLER_BUDGETS_MS[handler.split(":")[0]]
@@ -1,6 +1,6 @@
 import datetime as dt
 
-from jadio_feeder.config import Config, Query
+from jadio_feeder.config import Config, Query, load_config_documents
 from jadio_feeder.podcast import ItunesCategory, ItunesType, PodcastChannel
 
 
@@ -215,6 +215,9 @@ def test_config_to_dict_only_query():
         sort_by=None,
         from_oldest=False,
         remove_duplicates=True,
+        max_items=None,
+        page_size=None,
+        update_interval=None,
     )
     assert actual == expected
 
@@ -280,8 +283,63 @@ def test_config_to_dict_full():
         sort_by=None,
         from_oldest=False,
         remove_duplicates=True,
+        max_items=None,
+        page_size=None,
+        update_interval=None,
     )
     assert actual == expected
 
 
+def test_config_to_hash_stable():
+    def create_config() -> Config:
+        return Config(
+            query=Query(
+                station_ids=["station1", "station2"],
+                datetime_range=[dt.datetime.fromisoformat("2023-01-01")],
+            ),
+        )
+
+    assert create_config().to_hash() == create_config().to_hash()
+
+
+def test_config_to_hash_edited():
+    config = Config(query=Query(station_ids=["station1"]))
+    edited = Config(query=Query(station_ids=["station1"]), from_oldest=True)
+
+    assert config.to_hash() != edited.to_hash()
+
+
 test_config_from_dict_full()
+
+
+def test_query_to_mongo_format_words_condition():
+    words_condition = {"$or": [{"_id": {"$in": []}}]}
+    query = Query(station_ids=["station1"], words=["word1"])
+    actual = query.to_mongo_format(words_condition=words_condition)
+
+    expected = {
+        "$and": [
+            {"station_id": {"$in": ["station1"]}},
+            words_condition,
+        ]
+    }
+    assert actual == expected
+
+
+def test_load_config_documents(tmp_path):
+    (tmp_path / "a.yml").write_text(
+        "query:\n  station_ids: [TBS]\n---\nquery:\n  station_ids: [LFR]\n"
+    )
+    (tmp_path / "b.json").write_text(
+        '[{"_id": "6662857195098cff52529a6b", "query": {"words": ["JUNK"]}}]'
+    )
+    (tmp_path / "c.txt").write_text("ignored")
+
+    actual = load_config_documents(tmp_path)
+
+    assert actual == [
+        {"query": {"station_ids": ["TBS"]}},
+        {"query": {"station_ids": ["LFR"]}},
+        {"_id": "6662857195098cff52529a6b", "query": {"words": ["JUNK"]}},
+    ]
+    assert load_config_documents(tmp_path / "a.yml") == actual[:2]
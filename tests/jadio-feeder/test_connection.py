@@ -0,0 +1,61 @@
+import pymongo
+import pytest
+
+from jadio_feeder.connection import ConnectionManager, ConnectionOptions
+from jadio_feeder.database import FeederDatabase, RecorderDatabase
+
+
+def test_options_from_env():
+    environ = {
+        "JADIO_FEEDER_MONGO_MAX_POOL_SIZE": "20",
+        "JADIO_FEEDER_MONGO_COMPRESSORS": "zstd, snappy",
+        "JADIO_FEEDER_MONGO_BATCH_SIZE": "500",
+    }
+    # options given by CLI override environment variables
+    options = ConnectionOptions.from_env(environ, batch_size=1000, min_pool_size=None)
+    assert options == ConnectionOptions(
+        max_pool_size=20, compressors=("zstd", "snappy"), batch_size=1000
+    )
+    assert options.client_kwargs()["compressors"] == "zstd,snappy"
+    assert "compressors" not in ConnectionOptions().client_kwargs()
+
+    with pytest.raises(ValueError):
+        ConnectionOptions(compressors=("lz4",))
+    with pytest.raises(ValueError):
+        ConnectionOptions(recorder_read_preference="secondaryOnly")
+
+
+def test_manager_shares_clients():
+    manager = ConnectionManager()
+    options = ConnectionOptions(batch_size=100)
+    client = manager.acquire("mongodb://host-a:27017/", options)
+    # options of queries don't need another client
+    assert manager.acquire("mongodb://host-a:27017/") is client
+    assert manager.acquire("mongodb://host-b:27017/") is not client
+    assert len(manager) == 2
+
+    manager.release(client)
+    assert len(manager) == 2
+    manager.release(client)
+    assert len(manager) == 1
+
+    # clients inherited by fork are not reused
+    other = manager.acquire("mongodb://host-b:27017/")
+    manager._pid = -1
+    assert manager.acquire("mongodb://host-b:27017/") is not other
+    assert len(manager) == 1
+    manager.release(other)
+
+
+def test_databases_share_client():
+    host = "mongodb://host-c:27017/"
+    options = ConnectionOptions(recorder_read_preference="secondaryPreferred")
+    with FeederDatabase(host, options) as feeder_db, RecorderDatabase(
+        host, options
+    ) as recorder_db:
+        assert feeder_db._client is recorder_db._client
+        assert feeder_db.configs.read_preference == pymongo.ReadPreference.PRIMARY
+        assert (
+            recorder_db.recorded_programs.read_preference
+            == pymongo.ReadPreference.SECONDARY_PREFERRED
+        )
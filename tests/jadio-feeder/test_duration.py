@@ -0,0 +1,115 @@
+import struct
+from pathlib import Path
+
+import pytest
+
+from jadio_feeder.duration import _Mp3Frame, probe_duration
+from jadio_feeder.podcast import (
+    _media_path_to_duration,
+    _media_path_to_duration_by_mutagen,
+)
+
+# MPEG 1 Layer III, 128 kbps, 44.1 kHz and stereo
+MP3_HEADER = b"\xff\xfb\x90\x00"
+MP3_FRAME_SIZE = 417
+
+
+def _frame(payload: bytes = b"") -> bytes:
+    return (MP3_HEADER + payload).ljust(MP3_FRAME_SIZE, b"\x00")
+
+
+def _id3(size: int) -> bytes:
+    syncsafe = bytes((size >> shift) & 0x7F for shift in [21, 14, 7, 0])
+    return b"ID3\x03\x00\x00" + syncsafe + bytes(size)
+
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+def _mp4(timescale: int, duration: int, version: int = 0) -> bytes:
+    if version == 0:
+        times = struct.pack(">IIII", 0, 0, timescale, duration)
+    else:
+        times = struct.pack(">QQIQ", 0, 0, timescale, duration)
+    mvhd = bytes([version, 0, 0, 0]) + times + bytes(80)
+    # the audio track read by mutagen, whose duration is in the sample rate
+    mdhd = bytes(4) + struct.pack(">IIII", 0, 0, 44100, duration * 44100 // timescale)
+    hdlr = bytes(8) + b"soun" + bytes(13)
+    trak = _box(
+        b"trak", _box(b"mdia", _box(b"mdhd", mdhd + bytes(4)) + _box(b"hdlr", hdlr))
+    )
+    return _box(b"mvhd", mvhd) + trak
+
+
+def _write(path: Path, data: bytes, size: int = 0) -> Path:
+    with path.open("wb") as f:
+        f.write(data)
+        f.truncate(max(size, len(data)))
+    return path
+
+
+def test_probe_mp3(tmp_path):
+    # Xing header after the side information of the first frame
+    xing = _frame(bytes(32) + b"Xing" + struct.pack(">II", 0x1, 1000)) + _frame() * 3
+    path = _write(tmp_path / "xing.mp3", _id3(100) + xing)
+    assert probe_duration(path) == pytest.approx(1000 * 1152 / 44100)
+
+    vbri = b"VBRI" + struct.pack(">HHHIIHHHH", 1, 0, 75, 0, 2000, 0, 1, 2, 1)
+    path = _write(tmp_path / "vbri.mp3", _frame(bytes(32) + vbri) + _frame() * 3)
+    assert probe_duration(path) == pytest.approx(2000 * 1152 / 44100)
+
+    # CBR streams are estimated by their size
+    path = _write(tmp_path / "cbr.mp3", _id3(1000) + _frame() * 4, 1010 + 16000)
+    assert probe_duration(path) == pytest.approx(8 * 16000 / 128000)
+
+    for name in ["xing.mp3", "vbri.mp3", "cbr.mp3"]:
+        expected = _media_path_to_duration_by_mutagen(tmp_path / name)
+        assert probe_duration(tmp_path / name) == pytest.approx(expected)
+
+
+def test_probe_mp3_layer1(tmp_path):
+    # MPEG 1 Layer I, 384 kbps and 44.1 kHz, whose frames are in slots of 4 bytes
+    header = b"\xff\xff\xc0\x00"
+    assert _Mp3Frame(header).length == 416
+    assert _Mp3Frame(header[:2] + b"\xc2\x00").length == 420
+    assert _Mp3Frame(MP3_HEADER).length == MP3_FRAME_SIZE
+
+    path = _write(tmp_path / "layer1.mp3", header.ljust(416, b"\x00") * 4, 48000)
+    assert probe_duration(path) == pytest.approx(8 * 48000 / 384000)
+
+
+def test_probe_mp4(tmp_path):
+    ftyp = _box(b"ftyp", b"M4A " + bytes(4) + b"M4A isommp42")
+    # `moov` follows the sparse `mdat` of a recording
+    mdat = struct.pack(">I", 8 + (1 << 20)) + b"mdat" + bytes(1 << 20)
+    path = _write(
+        tmp_path / "audio.m4a", ftyp + mdat + _box(b"moov", _mp4(1000, 1800500))
+    )
+    assert probe_duration(path) == pytest.approx(1800.5)
+    assert probe_duration(path) == pytest.approx(
+        _media_path_to_duration_by_mutagen(path)
+    )
+
+    path = _write(tmp_path / "video.mov", ftyp + _box(b"moov", _mp4(600, 36000, 1)))
+    assert probe_duration(path) == pytest.approx(60.0)
+
+
+def test_fall_back_to_mutagen(tmp_path):
+    # no sync in the window of the probe, and mutagen fails either
+    path = _write(tmp_path / "broken.mp3", bytes(100))
+    with pytest.raises(ValueError):
+        probe_duration(path)
+    with pytest.raises(Exception):
+        _media_path_to_duration(path)
+
+    # `mvhd` is missing, which mutagen does not need
+    ftyp = _box(b"ftyp", b"M4A " + bytes(4) + b"M4A isommp42")
+    moov = _box(b"moov", _mp4(1000, 5000)[len(_box(b"mvhd", bytes(100))) :])
+    path = _write(tmp_path / "no-mvhd.m4a", ftyp + moov)
+    with pytest.raises(ValueError):
+        probe_duration(path)
+    assert _media_path_to_duration(path) == pytest.approx(5.0)
+
+    with pytest.raises(ValueError):
+        probe_duration(_write(tmp_path / "media.ogg", bytes(100)))
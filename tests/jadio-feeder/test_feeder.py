@@ -0,0 +1,376 @@
+import asyncio
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+import pytest
+from bson import ObjectId
+
+from jadio_feeder.config import Config
+from jadio_feeder.feeder import Feeder, UpdateResult
+
+pytest.importorskip("mongomock")
+
+
+def create_program(index: int, episode_id: Optional[str] = None) -> Dict[str, Any]:
+    return dict(
+        _id=ObjectId(f"{index:024x}"),
+        platform_id="radiko.jp",
+        station_id="TBS",
+        id=f"TBS-{index}",
+        name="program",
+        episode_id=episode_id or str(index),
+        episode_name=f"episode {index}",
+        description="description",
+        information="information",
+        performers=["person"],
+        guests=[],
+        copyright="copyright",
+        image_url="https://example.com/image.png",
+        url="https://example.com/",
+        datetime=dt.datetime(2020, 1, 1) + dt.timedelta(days=index),
+        duration=1800,
+        is_video=False,
+    )
+
+
+def write_media(media_root: Path, programs: List[Dict[str, Any]]) -> None:
+    for program in programs:
+        media_dir = media_root.joinpath(
+            program["platform_id"], program["station_id"], str(program["_id"])
+        )
+        media_dir.mkdir(parents=True, exist_ok=True)
+        media_dir.joinpath("media.mp3").write_bytes(bytes(100))
+
+
+def create_config_document(index: int, **kwargs) -> Dict[str, Any]:
+    config = Config.from_dict(dict(query=dict(station_ids=["TBS"]), **kwargs))
+    return dict(
+        config.to_dict(serialize=True, unserialized_types=[dt.datetime]),
+        _id=ObjectId(f"{index:024x}"),
+    )
+
+
+def count_items(path: Path) -> int:
+    return path.read_text().count("<item>")
+
+
+def create_feeder(tmp_path: Path, **kwargs) -> Feeder:
+    return Feeder(
+        rss_feed_root=tmp_path / "rss", media_root=tmp_path / "media", **kwargs
+    )
+
+
+def test_archive_pages_are_kept(client, tmp_path):
+    programs = [create_program(i) for i in range(8)]
+    write_media(tmp_path / "media", programs)
+    config_document = create_config_document(1, page_size=3)
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        feeder.feeder_db.configs.insert_one(config_document)
+        feeder.update_feeds()
+        state = feeder.feeder_db.feeds.find_one({"_id": config_document["_id"]})
+        pages = state["archive"]["pages"]
+        assert pages == [[p["_id"] for p in programs[i : i + 3]] for i in [0, 3]]
+        archive_path = tmp_path / "rss" / str(config_document["_id"]) / "archive-1.xml"
+        archive = archive_path.read_bytes()
+
+        # neither a removed program nor an older program recorded later shifts
+        # completed pages
+        feeder.recorder_db.recorded_programs.delete_one({"_id": programs[1]["_id"]})
+        late_program = dict(create_program(8), datetime=dt.datetime(2019, 1, 1))
+        write_media(tmp_path / "media", [late_program])
+        feeder.recorder_db.recorded_programs.insert_one(late_program)
+        feeder.update_feeds()
+        state = feeder.feeder_db.feeds.find_one({"_id": config_document["_id"]})
+        assert state["archive"]["pages"][:2] == pages
+        assert state["archive"]["pages"][2] == [
+            p["_id"] for p in [late_program] + programs[6:8]
+        ]
+        assert archive_path.read_bytes() == archive
+
+
+@pytest.mark.parametrize("use_pipeline", [True, False])
+def test_find_latest_pairs_removes_duplicates_in_feed_order(
+    client, tmp_path, use_pipeline
+):
+    # the first airing of each episode is kept in feeds from the oldest
+    episode_ids = ["a", "a", "b", "b", "c"]
+    programs = [create_program(i, x) for i, x in enumerate(episode_ids)]
+    config = Config.from_dict(
+        dict(query=dict(station_ids=["TBS"]), from_oldest=True, max_items=2)
+    )
+    with create_feeder(tmp_path) as feeder:
+        feeder._use_pipeline = use_pipeline
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        pairs = feeder._find_latest_pairs(config, {}, "datetime", 2)
+    assert [program_id for _, program_id in pairs] == [
+        programs[2]["_id"],
+        programs[4]["_id"],
+    ]
+
+
+@pytest.mark.parametrize("backend", ["feedgen", "stream"])
+def test_update_feeds_skips_unchanged_feeds(client, tmp_path, backend):
+    programs = [create_program(i) for i in range(5)]
+    write_media(tmp_path / "media", programs)
+    config_document = create_config_document(1)
+    feed_path = tmp_path / "rss" / f"{config_document['_id']}.xml"
+    with create_feeder(tmp_path, backend=backend) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        feeder.feeder_db.configs.insert_one(config_document)
+        assert len(feeder.update_feeds()) == 1
+        assert count_items(feed_path) == 5
+
+        with mock.patch.object(
+            feeder, "update_feed", wraps=feeder.update_feed
+        ) as update_feed:
+            assert feeder.update_feeds() == []
+            assert update_feed.call_count == 0
+            # rebuilt by force, but not reported since its output is unchanged
+            assert feeder.update_feeds(force_update=True) == []
+            assert update_feed.call_count == 1
+
+        feeder.recorder_db.recorded_programs.delete_one({"_id": programs[0]["_id"]})
+        assert len(feeder.update_feeds()) == 1
+        assert count_items(feed_path) == 4
+
+
+@pytest.mark.parametrize("backend", ["feedgen", "stream"])
+def test_update_feeds_paged(client, tmp_path, backend):
+    programs = [create_program(i) for i in range(8)]
+    write_media(tmp_path / "media", programs)
+    config_document = create_config_document(1, page_size=3, max_items=2)
+    config_id = config_document["_id"]
+    with create_feeder(tmp_path, backend=backend) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        feeder.feeder_db.configs.insert_one(config_document)
+        feeder.update_feeds()
+
+    archive_root = tmp_path / "rss" / str(config_id)
+    assert sorted(path.name for path in archive_root.iterdir()) == [
+        "archive-1.xml",
+        "archive-2.xml",
+    ]
+    assert count_items(archive_root / "archive-1.xml") == 3
+    assert count_items(archive_root / "archive-2.xml") == 3
+    # programs not archived yet are kept in the head feed beyond `max_items`
+    head = (tmp_path / "rss" / f"{config_id}.xml").read_text()
+    assert head.count("<item>") == 2
+    assert "archive-2.xml" in head
+
+
+def test_async_feeder_writes_same_feeds(client, tmp_path):
+    pytest.importorskip("motor")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from jadio_feeder.async_feeder import AsyncFeeder
+
+    programs = [create_program(i, str(i // 2)) for i in range(10)]
+    write_media(tmp_path / "media", programs)
+    config_documents = [
+        create_config_document(1),
+        create_config_document(2, from_oldest=True, max_items=3),
+        create_config_document(3, page_size=3),
+    ]
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        feeder.feeder_db.configs.insert_many(config_documents)
+        feeder.update_feeds()
+
+    async def update_feeds():
+        async_client = mongomock_motor.AsyncMongoMockClient()
+        with mock.patch(
+            "motor.motor_asyncio.AsyncIOMotorClient", lambda host: async_client
+        ):
+            async with AsyncFeeder(
+                rss_feed_root=tmp_path / "async", media_root=tmp_path / "media"
+            ) as feeder:
+                await feeder.recorder_db.recorded_programs.insert_many(programs)
+                await feeder.feeder_db.configs.insert_many(config_documents)
+                assert len(await feeder.update_feeds()) == 3
+                assert await feeder.update_feeds() == []
+
+    asyncio.run(update_feeds())
+    paths = [
+        path.relative_to(tmp_path / "rss") for path in (tmp_path / "rss").rglob("*.xml")
+    ]
+    assert len(paths) == 4
+    for path in paths:
+        assert (tmp_path / "async" / path).read_bytes() == (
+            tmp_path / "rss" / path
+        ).read_bytes()
+
+
+def test_update_feeds_clears_item_store(client, tmp_path):
+    programs = [create_program(i) for i in range(3)]
+    write_media(tmp_path / "media", programs)
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        feeder.feeder_db.configs.insert_one(create_config_document(1))
+        feeder.update_feeds()
+        assert programs[0]["_id"] in feeder._item_store._items
+
+        feeder.recorder_db.recorded_programs.delete_one({"_id": programs[0]["_id"]})
+        feeder.update_feeds()
+        assert programs[0]["_id"] not in feeder._item_store._items
+        assert programs[1]["_id"] in feeder._item_store._items
+
+
+def is_rebuilt(feeder: Feeder, config: Config, config_id: ObjectId, **kwargs) -> bool:
+    with mock.patch.object(
+        feeder, "update_feed", wraps=feeder.update_feed
+    ) as update_feed:
+        feeder.update_feed_if_changed(config, config_id, **kwargs)
+    return update_feed.call_count == 1
+
+
+def test_update_feed_if_changed(client, tmp_path):
+    programs = [create_program(i) for i in range(4)]
+    write_media(tmp_path / "media", programs)
+    config_id = ObjectId(f"{1:024x}")
+    config = Config.from_dict(dict(query=dict(station_ids=["TBS"])))
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs[:3])
+        assert is_rebuilt(feeder, config, config_id)
+        assert not is_rebuilt(feeder, config, config_id)
+
+        # new and deleted programs
+        feeder.recorder_db.recorded_programs.insert_one(programs[3])
+        assert is_rebuilt(feeder, config, config_id)
+        feeder.recorder_db.recorded_programs.delete_one({"_id": programs[0]["_id"]})
+        assert is_rebuilt(feeder, config, config_id)
+        assert not is_rebuilt(feeder, config, config_id)
+
+        # edited config
+        config = Config.from_dict(dict(query=dict(station_ids=["TBS"]), max_items=2))
+        assert is_rebuilt(feeder, config, config_id)
+
+        # missing output
+        feeder._rss_feed_path(config_id).unlink()
+        assert is_rebuilt(feeder, config, config_id)
+
+        # changed options of rendering
+        assert is_rebuilt(feeder, config, config_id, pretty=False)
+        assert not is_rebuilt(feeder, config, config_id, pretty=False)
+
+    with create_feeder(tmp_path, base_url="http://example.com") as feeder:
+        assert is_rebuilt(feeder, config, config_id, pretty=False)
+
+
+def test_register_configs(client, tmp_path):
+    configs = [
+        Config.from_dict(dict(query=dict(station_ids=["TBS"]))),
+        Config.from_dict(dict(query=dict(station_ids=["LFR"]))),
+    ]
+    with create_feeder(tmp_path) as feeder:
+        res = feeder.register_configs(configs)
+        assert len(res.inserted) == 2
+        assert (res.updated, res.unchanged) == ([], [])
+
+        res = feeder.register_configs(configs)
+        assert res.inserted == []
+        assert len(res.unchanged) == 2
+
+        # a document with `_id` replaces the config of the id
+        config_id = ObjectId(f"{1:024x}")
+        res = feeder.register_configs([create_config_document(1, max_items=5)])
+        assert res.inserted == [config_id]
+        res = feeder.register_configs([create_config_document(1, max_items=10)])
+        assert (res.inserted, res.updated) == ([], [config_id])
+        assert feeder.feeder_db.configs.find_one({"_id": config_id})["max_items"] == 10
+        assert feeder.feeder_db.configs.count_documents({}) == 3
+
+        # the same config is not registered by another id
+        document = dict(create_config_document(1, max_items=10), _id=str(config_id))
+        duplicated_document = create_config_document(2, max_items=10)
+        res = feeder.register_configs([document, duplicated_document])
+        assert res.unchanged == [config_id]
+        assert res.duplicated == [ObjectId(f"{2:024x}")]
+        assert feeder.feeder_db.configs.count_documents({}) == 3
+
+
+def test_register_configs_without_config_hash(client, tmp_path):
+    # registered by older versions, where the last one duplicates the first one
+    legacy_documents = [
+        create_config_document(1),
+        create_config_document(2, max_items=10),
+        create_config_document(3),
+    ]
+    with create_feeder(tmp_path) as feeder:
+        configs = feeder.feeder_db.configs
+        configs.insert_many(legacy_documents)
+        res = feeder.register_configs(
+            [Config.from_dict(dict(query=dict(station_ids=["TBS"])))]
+        )
+        assert res.unchanged == [legacy_documents[0]["_id"]]
+        assert configs.count_documents({"config_hash": {"$exists": True}}) == 2
+        assert "config_hash" not in configs.find_one(legacy_documents[2]["_id"])
+        assert configs.count_documents({}) == 3
+
+        # configs are migrated only once per feeder
+        configs.insert_one(create_config_document(4, max_items=5))
+        config = Config.from_dict(dict(query=dict(station_ids=["LFR"])))
+        with mock.patch.object(Config, "from_dict") as from_dict:
+            res = feeder.register_configs([config])
+        from_dict.assert_not_called()
+        assert len(res.inserted) == 1
+
+
+def test_order_configs(client, tmp_path):
+    configs = {config_id: dict(_id=config_id) for config_id in ["a", "b", "c"]}
+    with create_feeder(tmp_path) as feeder:
+        ordered_configs = feeder._order_configs(configs, dict(a=10, c=20))
+    # feeds never built come first, then the longest ones
+    assert [config["_id"] for config in ordered_configs] == ["b", "c", "a"]
+
+
+def test_collect_results(client, tmp_path):
+    configs = {config_id: create_config_document(config_id) for config_id in [1, 2, 3]}
+    config_ids = list(configs)
+    results = [
+        UpdateResult(config_ids[0], updated=True),
+        UpdateResult(config_ids[1], error="error"),
+        UpdateResult(config_ids[2]),
+        # registered after the configs were loaded
+        UpdateResult(ObjectId(f"{4:024x}"), updated=True),
+    ]
+    with create_feeder(tmp_path) as feeder:
+        updated_configs, errors = feeder._collect_results(configs, results)
+    assert len(updated_configs) == 1
+    assert isinstance(updated_configs[0], Config)
+    assert errors == [results[1]]
+
+
+def test_update_feeds_in_workers(client, tmp_path):
+    programs = [create_program(i) for i in range(5)]
+    write_media(tmp_path / "media", programs)
+    config_documents = [
+        create_config_document(1),
+        create_config_document(2, max_items=2),
+        create_config_document(3, page_size=2),
+    ]
+
+    # workers run in threads sharing the in-memory database instead of processes
+    def create_executor(mp_context, **kwargs):
+        return ThreadPoolExecutor(**kwargs)
+
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        feeder.feeder_db.configs.insert_many(config_documents)
+        with mock.patch("jadio_feeder.feeder.ProcessPoolExecutor", create_executor):
+            assert len(feeder.update_feeds(jobs=2)) == 3
+            assert feeder.update_feeds(jobs=2) == []
+    for document in config_documents:
+        assert (tmp_path / "rss" / f"{document['_id']}.xml").exists()
+
+
+def test_warm_media_cache(client, tmp_path):
+    programs = [create_program(i) for i in range(6)]
+    # a whole leading batch of programs has no media files
+    write_media(tmp_path / "media", programs[2:])
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs)
+        with mock.patch("jadio_feeder.feeder.PREFETCH_BATCH_SIZE", 2):
+            assert feeder.warm_media_cache() == 4
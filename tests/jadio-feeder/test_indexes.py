@@ -0,0 +1,50 @@
+from jadio_feeder.indexes import summarize_explain
+
+
+def test_summarize_explain_ixscan():
+    explain = dict(
+        queryPlanner=dict(
+            winningPlan=dict(
+                stage="FETCH",
+                inputStage=dict(
+                    stage="IXSCAN", indexName="platform_id_station_id_datetime"
+                ),
+            )
+        ),
+        executionStats=dict(
+            nReturned=10,
+            executionTimeMillis=1,
+            totalKeysExamined=10,
+            totalDocsExamined=10,
+        ),
+    )
+    actual = summarize_explain(explain)
+
+    expected = dict(
+        winning_plan="FETCH <- IXSCAN(platform_id_station_id_datetime)",
+        collscan=False,
+        keys_examined=10,
+        docs_examined=10,
+        returned=10,
+        time_ms=1,
+    )
+    assert actual == expected
+
+
+def test_summarize_explain_collscan():
+    explain = dict(
+        queryPlanner=dict(
+            winningPlan=dict(queryPlan=dict(stage="COLLSCAN")),
+        ),
+        executionStats=dict(
+            nReturned=1,
+            executionTimeMillis=30,
+            totalKeysExamined=0,
+            totalDocsExamined=5000,
+        ),
+    )
+    actual = summarize_explain(explain)
+
+    assert actual["winning_plan"] == "COLLSCAN"
+    assert actual["collscan"]
+    assert actual["docs_examined"] == 5000
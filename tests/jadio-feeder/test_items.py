@@ -0,0 +1,79 @@
+import datetime as dt
+import os
+
+from bson import ObjectId
+
+from jadio_feeder.items import ItemStore, StoredItem
+from jadio_feeder.media_index import MediaIndex
+from jadio_feeder.podcast import EpisodeType
+from jadio_feeder.program import ProgramView
+
+
+class _Collection:
+    def __init__(self):
+        self.requests = []
+
+    def find(self, query):
+        return []
+
+    def bulk_write(self, requests, ordered=True):
+        self.requests += requests
+
+
+def _create_program(media_root, **kwargs):
+    program_id = ObjectId()
+    media_dir = media_root / "radiko.jp" / "TBS" / str(program_id)
+    media_dir.mkdir(parents=True)
+    (media_dir / "media.m4a").write_bytes(b"0" * 10)
+    data = dict(
+        platform_id="radiko.jp",
+        station_id="TBS",
+        episode_id="1",
+        episode_name="episode",
+        datetime=dt.datetime(2024, 1, 1),
+        duration=60,
+        **kwargs,
+    )
+    return ProgramView(data), program_id, media_dir / "media.m4a"
+
+
+def test_item_store_reuses_items(tmp_path):
+    collection = _Collection()
+    store = ItemStore(collection, "http://localhost/", tmp_path)
+    program, program_id, media_path = _create_program(tmp_path)
+
+    fragment = store.fragment(program, program_id, pretty=True)
+    assert fragment.startswith("\n    <item>\n      <title>episode</title>")
+    assert store.item(program, program_id) is store._items[program_id].item
+    assert store.fragment(program, program_id, pretty=True) is fragment
+    store.flush()
+    assert len(collection.requests) == 1
+
+    # changes of the program and its media file rebuild the item
+    program._data["episode_name"] = "renamed"
+    assert "renamed" in store.fragment(program, program_id, pretty=False)
+    os.utime(media_path, (0, 0))
+    store.media_index = MediaIndex(tmp_path)
+    assert store.item(program, program_id).enclosure.length == 10
+    assert store._items[program_id].media[2] == 0
+
+
+def test_stored_item_to_dict():
+    program_id = ObjectId()
+    stored = StoredItem.from_dict(
+        dict(
+            program_hash="hash",
+            media=["/media.m4a", 10, 0.0],
+            item=dict(
+                title="title",
+                enclosure=dict(url="http://localhost", length=10, type="audio/x-m4a"),
+                guid=str(program_id),
+                itunes_episode_type="full",
+            ),
+            fragments={"pretty": "<item/>"},
+            version=1,
+        )
+    )
+    assert stored.item.itunes_episode_type == EpisodeType.FULL
+    assert stored.media == ("/media.m4a", 10, 0.0)
+    assert StoredItem.from_dict(stored.to_dict()) == stored
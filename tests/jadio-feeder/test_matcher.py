@@ -0,0 +1,92 @@
+import datetime as dt
+
+from bson import ObjectId
+
+from jadio_feeder.config import Query
+from jadio_feeder.matcher import ProgramSnapshot
+
+
+def create_programs():
+    return [
+        dict(
+            _id=ObjectId("000000000000000000000001"),
+            platform_id="radiko.jp",
+            station_id="TBS",
+            performers=["person1", "person2"],
+            guests=[],
+            name="JUNK",
+            description="description",
+            datetime=dt.datetime(2023, 1, 1),
+        ),
+        dict(
+            _id=ObjectId("000000000000000000000002"),
+            platform_id="radiko.jp",
+            station_id="LFR",
+            performers=["person3"],
+            guests=["person1"],
+            name="ANN",
+            episode_name="JUNK special",
+            datetime=dt.datetime(2023, 6, 1),
+        ),
+        dict(
+            _id=ObjectId("000000000000000000000003"),
+            platform_id="onsen.ag",
+            station_id="onsen",
+            performers="person4",
+            name="onsen program",
+        ),
+    ]
+
+
+def match_ids(query: Query):
+    snapshot = ProgramSnapshot(create_programs())
+    return [str(program_id)[-1] for program_id in snapshot.match(query).program_ids]
+
+
+def test_program_snapshot_match_empty_query():
+    assert match_ids(Query()) == ["1", "2", "3"]
+
+
+def test_program_snapshot_match_ids():
+    assert match_ids(Query(platform_ids=["radiko.jp"])) == ["1", "2"]
+    assert match_ids(Query(station_ids=["LFR", "onsen"])) == ["2", "3"]
+
+
+def test_program_snapshot_match_persons():
+    assert match_ids(Query(persons=["person1"])) == ["1", "2"]
+    assert match_ids(Query(persons=["person4"])) == ["3"]
+
+
+def test_program_snapshot_match_words():
+    assert match_ids(Query(words=["JUNK"])) == ["1", "2"]
+    assert match_ids(Query(words=["^onsen"])) == ["3"]
+
+
+def test_program_snapshot_match_datetime_range():
+    assert match_ids(Query(datetime_range=[dt.datetime(2023, 2, 1)])) == ["2"]
+    datetime_range = [dt.datetime(2022, 1, 1), dt.datetime(2023, 6, 1)]
+    assert match_ids(Query(datetime_range=datetime_range)) == ["1"]
+
+
+def test_program_snapshot_match_summary():
+    snapshot = ProgramSnapshot(create_programs())
+    actual = snapshot.match(Query(station_ids=["TBS", "LFR"])).summary
+
+    expected = dict(
+        num_programs=2,
+        max_program_id=ObjectId("000000000000000000000002"),
+        max_datetime=dt.datetime(2023, 6, 1),
+    )
+    assert actual == expected
+
+
+def test_program_snapshot_match_normalized_words():
+    snapshot = ProgramSnapshot(create_programs(), normalize_words=True)
+    program_ids = snapshot.match(Query(words=["ｊｕｎｋ"])).program_ids
+    assert [str(program_id)[-1] for program_id in program_ids] == ["1", "2"]
+    program_ids = snapshot.match(Query(words=["ＳＰＥＣＩＡＬ"])).program_ids
+    assert [str(program_id)[-1] for program_id in program_ids] == ["2"]
+
+    # regex patterns are not normalized
+    program_ids = snapshot.match(Query(words=["^ＯＮＳＥＮ"])).program_ids
+    assert program_ids == []
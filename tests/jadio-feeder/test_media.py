@@ -0,0 +1,128 @@
+import asyncio
+import os
+from unittest import mock
+
+import pytest
+
+from jadio_feeder.media import AsyncMediaProbeCache, MediaProbeCache
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().feeder.media_probes
+
+
+@pytest.fixture
+def probe_duration():
+    with mock.patch(
+        "jadio_feeder.media._media_path_to_duration", return_value=60.0
+    ) as probe_duration:
+        yield probe_duration
+
+
+def test_media_probe_cache_hit_and_miss(tmp_path, collection, probe_duration):
+    path = tmp_path / "media.mp3"
+    path.write_bytes(bytes(100))
+    cache = MediaProbeCache(collection)
+
+    probe = cache.probe(path, is_video=False)
+    assert (probe.size, probe.duration, probe.type) == (100, 60.0, "audio/mpeg")
+    assert cache.probe(path, is_video=False) is probe
+    assert probe_duration.call_count == 1
+
+    # probes are persisted by `flush` and fetched by another cache
+    cache.flush()
+    cache = MediaProbeCache(collection)
+    cache.prefetch([path, tmp_path / "missing.mp3"])
+    assert cache.probe(path, is_video=False) == probe
+    assert probe_duration.call_count == 1
+
+
+def test_media_probe_cache_invalidation(tmp_path, collection, probe_duration):
+    path = tmp_path / "media.mp4"
+    path.write_bytes(bytes(100))
+    cache = MediaProbeCache(collection)
+    cache.probe(path, is_video=False)
+
+    probe = cache.probe(path, is_video=True)
+    assert probe.type == "video/mp4"
+    assert probe_duration.call_count == 2
+
+    path.write_bytes(bytes(200))
+    assert cache.probe(path, is_video=True).size == 200
+    assert probe_duration.call_count == 3
+
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert cache.probe(path, is_video=True).mtime == stat.st_mtime + 10
+    assert probe_duration.call_count == 4
+
+    # the duration is not probed if it is known by other means
+    path.write_bytes(bytes(300))
+    assert cache.probe(path, is_video=True, with_duration=False).duration is None
+    assert probe_duration.call_count == 4
+
+
+def test_media_probe_cache_flush(tmp_path, collection, probe_duration):
+    paths = [tmp_path / f"media{i}.mp3" for i in range(3)]
+    cache = MediaProbeCache(collection)
+    for path in paths:
+        path.write_bytes(bytes(100))
+        cache.probe(path, is_video=False)
+    assert collection.count_documents({}) == 0
+
+    cache.flush()
+    assert collection.count_documents({}) == 3
+    with mock.patch.object(collection, "bulk_write") as bulk_write:
+        cache.flush()
+    bulk_write.assert_not_called()
+
+
+def test_media_probe_cache_evict_missing(tmp_path, collection, probe_duration):
+    paths = [tmp_path / f"media{i}.mp3" for i in range(3)]
+    cache = MediaProbeCache(collection)
+    for path in paths:
+        path.write_bytes(bytes(100))
+        cache.probe(path, is_video=False)
+    cache.flush()
+
+    paths[0].unlink()
+    assert cache.evict_missing() == 1
+    assert collection.count_documents({}) == 2
+    assert collection.find_one({"_id": str(paths[0])}) is None
+    assert cache.evict_missing() == 0
+
+
+def test_async_media_probe_cache(tmp_path, probe_duration):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    paths = [tmp_path / f"media{i}.mp3" for i in range(3)]
+    for path in paths:
+        path.write_bytes(bytes(100))
+
+    async def run():
+        collection = mongomock_motor.AsyncMongoMockClient().feeder.media_probes
+        cache = AsyncMediaProbeCache(collection)
+        # probes are not fetched in threads without blocking the event loop
+        with pytest.raises(RuntimeError):
+            cache.probe(paths[0], is_video=False)
+
+        await cache.load(paths[:2])
+        probe = cache.probe(paths[0], is_video=False)
+        await cache.clear()
+        assert await collection.count_documents({}) == 1
+        assert cache._probes == {}
+
+        # probes are fetched again after they are cleared
+        await cache.load(paths)
+        assert cache.probe(paths[0], is_video=False) == probe
+        assert probe_duration.call_count == 1
+        assert len(cache._probes) == 3
+
+        cache.probe(paths[1], is_video=False)
+        paths[0].unlink()
+        assert await cache.evict_missing() == 1
+        assert await collection.count_documents({}) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from jadio_feeder.media_index import MediaIndex
+
+
+def _create_media(media_root, program_id, names=("media.m4a",), station="TBS"):
+    media_dir = media_root / "radiko.jp" / station / program_id
+    media_dir.mkdir(parents=True)
+    for name in names:
+        (media_dir / name).write_bytes(b"0" * 10)
+    return media_dir
+
+
+def _age(media_root):
+    # make listings trusted by the next walk
+    past = time.time() - 60
+    for path, _, _ in os.walk(media_root):
+        os.utime(path, (past, past))
+
+
+def test_find(tmp_path):
+    media_dir = _create_media(tmp_path, "a")
+    _create_media(tmp_path, "b", names=("media.mp3", "media.m4a"))
+    _create_media(tmp_path, "c", names=())
+    index = MediaIndex(tmp_path)
+
+    media = index.find("radiko.jp", "TBS", "a")
+    assert media.path == str(media_dir / "media.m4a")
+    assert (media.size, media.suffix) == (10, ".m4a")
+    assert index.find("radiko.jp", "TBS", "b").suffix == ".m4a"
+    with pytest.raises(FileNotFoundError):
+        index.find("radiko.jp", "TBS", "c")
+
+    assert index.missing == {"c"}
+    assert list(index.ambiguous) == ["b"]
+
+
+def test_refresh_lists_changed_directories(tmp_path, monkeypatch):
+    _create_media(tmp_path, "a")
+    _create_media(tmp_path, "b", station="LFR")
+    _age(tmp_path)
+    index = MediaIndex(tmp_path)
+    index.refresh()
+
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(
+        os, "scandir", lambda path: listed.append(path) or scandir(path)
+    )
+    _create_media(tmp_path, "c")
+    index.refresh()
+
+    assert listed == [
+        str(tmp_path / "radiko.jp" / "TBS"),
+        str(tmp_path / "radiko.jp" / "TBS" / "c"),
+    ]
+    assert index.find("radiko.jp", "TBS", "c").size == 10
+    assert index.find("radiko.jp", "LFR", "b").size == 10
+
+
+def test_find_program_added_after_refresh(tmp_path):
+    index = MediaIndex(tmp_path)
+    index.refresh()
+    media_dir = _create_media(tmp_path, "a")
+
+    assert index.find("radiko.jp", "TBS", "a").path == str(media_dir / "media.m4a")
@@ -0,0 +1,77 @@
+import datetime as dt
+import json
+import time
+
+from jadio_feeder import metrics
+from jadio_feeder.output import ChangedFileWriter
+
+
+def test_hooks_are_noop_unless_enabled():
+    assert metrics.active() is None
+    with metrics.stage("render"), metrics.feed("feed"):
+        pass
+    assert list(metrics.timed([1, 2], "program_query")) == [1, 2]
+    assert metrics.active() is None
+
+
+def test_collect_stages_per_feed():
+    with metrics.collect() as run_metrics:
+        with metrics.feed("a"):
+            with metrics.stage("item_build"):
+                with metrics.stage("media_probe"):
+                    time.sleep(0.02)
+            assert list(metrics.timed([1, 2, 3], "program_query")) == [1, 2, 3]
+        with metrics.feed("b"), metrics.stage("render"):
+            pass
+    assert metrics.active() is None
+
+    report = run_metrics.to_report()
+    assert report["stages"]["program_query"]["count"] == 4
+    # time of nested stages is excluded from their parents
+    assert report["stages"]["media_probe"]["seconds"] >= 0.02
+    assert report["stages"]["item_build"]["seconds"] < 0.02
+    assert set(report["feeds"]) == {"a", "b"}
+    assert set(report["feeds"]["a"]["stages"]) == {
+        "item_build",
+        "media_probe",
+        "program_query",
+    }
+    assert report["feeds"]["a"]["seconds"] >= 0.02
+
+
+def test_merge_feed():
+    with metrics.collect() as worker_metrics:
+        with metrics.feed("a"), metrics.stage("render"):
+            pass
+    with metrics.collect() as run_metrics:
+        run_metrics.merge_feed("a", worker_metrics.feeds["a"].to_dict())
+
+    assert run_metrics.stages["render"].count == 1
+    assert run_metrics.feeds["a"].stages["render"].count == 1
+
+
+def test_write(tmp_path):
+    with metrics.collect() as run_metrics:
+        with metrics.feed("a"):
+            with ChangedFileWriter(tmp_path / "feed.xml") as f:
+                f.write(b"<rss/>")
+    report_path = run_metrics.write(tmp_path / "metrics")
+
+    report = json.loads(report_path.read_text())
+    assert report_path.name.startswith("run-")
+    assert report["feeds"]["a"]["stages"]["write"]["count"] == 1
+    prom = (tmp_path / "metrics" / metrics.PROMETHEUS_FILE_NAME).read_text()
+    assert "# TYPE jadio_feeder_stage_seconds gauge" in prom
+    assert 'jadio_feeder_stage_count{stage="write"} 1' in prom
+    assert 'jadio_feeder_feed_seconds{feed="a"} ' in prom
+
+
+def test_write_keeps_latest_reports(tmp_path):
+    for i in range(3):
+        with metrics.collect() as run_metrics:
+            pass
+        run_metrics.started_at += dt.timedelta(seconds=i)
+        run_metrics.write(tmp_path, max_reports=2)
+    report_paths = sorted(tmp_path.glob("run-*.json"))
+    assert len(report_paths) == 2
+    assert report_paths[-1].name == f"run-{run_metrics.started_at:%Y%m%dT%H%M%S}.json"
@@ -0,0 +1,101 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from jadio_feeder.output import (
+    ChangedFileWriter,
+    check_sidecars,
+    write_manifest,
+    write_sidecars,
+)
+
+
+def test_changed_file_writer_new_file(tmp_path):
+    path = tmp_path / "rss" / "feed.xml"
+    with ChangedFileWriter(path) as f:
+        f.write(b"<rss/>")
+
+    assert f.changed
+    assert f.size == 6
+    assert path.read_bytes() == b"<rss/>"
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_changed_file_writer_unchanged(tmp_path):
+    path = tmp_path / "feed.xml"
+    path.write_bytes(b"<rss/>")
+    os.utime(path, (0, 0))
+    with ChangedFileWriter(path) as f:
+        f.write(b"<rss/>")
+
+    assert not f.changed
+    assert path.stat().st_mtime == 0
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_changed_file_writer_changed(tmp_path):
+    path = tmp_path / "feed.xml"
+    path.write_bytes(b"<rss/>")
+    with ChangedFileWriter(path) as f:
+        f.write(b"<rss>")
+        f.write(b"</rss>")
+
+    assert f.changed
+    assert path.read_bytes() == b"<rss></rss>"
+
+
+def test_changed_file_writer_discard(tmp_path):
+    path = tmp_path / "feed.xml"
+    with ChangedFileWriter(path) as f:
+        f.write(b"<rss/>")
+        f.discard()
+
+    assert not f.changed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_changed_file_writer_error(tmp_path):
+    path = tmp_path / "feed.xml"
+    path.write_bytes(b"<rss/>")
+    with pytest.raises(RuntimeError):
+        with ChangedFileWriter(path) as f:
+            f.write(b"<rss>")
+            raise RuntimeError()
+
+    assert path.read_bytes() == b"<rss/>"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_write_manifest(tmp_path):
+    path = tmp_path / "manifest.json"
+    feeds = {"id.xml": dict(sha256="hash", size=1, num_items=1, last_changed="now")}
+
+    assert write_manifest(path, feeds)
+    assert not write_manifest(path, feeds)
+    assert json.loads(path.read_text()) == feeds
+
+
+def test_write_sidecars_gzip(tmp_path):
+    path = tmp_path / "feed.xml"
+    path.write_bytes(b"<rss/>")
+    write_sidecars(path, ["gzip"])
+    sidecar_path = tmp_path / "feed.xml.gz"
+    assert gzip.decompress(sidecar_path.read_bytes()) == b"<rss/>"
+
+    # stale sidecars are regenerated and unlisted ones are removed
+    (tmp_path / "feed.xml.br").write_bytes(b"stale")
+    path.write_bytes(b"<rss></rss>")
+    os.utime(sidecar_path, (0, 0))
+    write_sidecars(path, ["gzip"])
+    assert gzip.decompress(sidecar_path.read_bytes()) == b"<rss></rss>"
+    assert not (tmp_path / "feed.xml.br").exists()
+
+    write_sidecars(path, [])
+    assert not sidecar_path.exists()
+
+
+def test_check_sidecars():
+    with pytest.raises(ValueError):
+        check_sidecars(["deflate"])
@@ -0,0 +1,91 @@
+import pymongo.errors
+
+from jadio_feeder.feeder import _chunk_by_bytes
+from jadio_feeder.pipeline import (
+    is_document_too_large,
+    is_pipeline_unsupported,
+    to_facet_pipeline,
+    to_feed_pipeline,
+)
+
+
+def test_to_feed_pipeline():
+    pipeline = to_feed_pipeline(
+        {"station_id": "TBS"}, "datetime", True, False, fields=["datetime"]
+    )
+    assert pipeline == [
+        {"$match": {"station_id": "TBS"}},
+        {"$sort": {"datetime": -1, "_id": 1}},
+        {"$project": {"datetime": 1}},
+    ]
+
+
+def test_to_feed_pipeline_remove_duplicates():
+    pipeline = to_feed_pipeline({}, "episode_id", False, True, limit=10)
+    stages = [next(iter(stage)) for stage in pipeline]
+    assert stages == [
+        "$match",
+        "$sort",
+        "$setWindowFields",
+        "$match",
+        "$limit",
+        "$project",
+    ]
+    assert pipeline[2]["$setWindowFields"]["sortBy"] == {"episode_id": 1, "_id": 1}
+    assert pipeline[4] == {"$limit": 10}
+    # fields of the window are not projected
+    assert "_prev_datetime" not in pipeline[-1]["$project"]
+
+
+def test_to_feed_pipeline_limit_latest():
+    pipeline = to_feed_pipeline(
+        {}, "datetime", False, True, limit=10, limit_latest=True
+    )
+    stages = [next(iter(stage)) for stage in pipeline]
+    # duplicates are removed from the oldest before the latest are taken
+    assert stages[2:5] == ["$setWindowFields", "$match", "$sort"]
+    assert pipeline[4] == {"$sort": {"datetime": -1, "_id": -1}}
+    assert pipeline[5] == {"$limit": 10}
+
+    pipeline = to_feed_pipeline({}, "datetime", True, True, limit=10, limit_latest=True)
+    assert [next(iter(stage)) for stage in pipeline].count("$sort") == 1
+
+
+def test_is_pipeline_unsupported():
+    assert is_pipeline_unsupported(NotImplementedError())
+    assert is_pipeline_unsupported(
+        pymongo.errors.OperationFailure("Unrecognized pipeline stage", code=40324)
+    )
+    assert not is_pipeline_unsupported(
+        pymongo.errors.OperationFailure("Unauthorized", code=13)
+    )
+    assert not is_pipeline_unsupported(ValueError())
+
+
+def test_to_facet_pipeline():
+    pipeline = to_facet_pipeline([{"station_id": "TBS"}, {"station_id": "LFR"}])
+    assert len(pipeline) == 2
+    assert pipeline[0] == {
+        "$match": {"$or": [{"station_id": "TBS"}, {"station_id": "LFR"}]}
+    }
+    branches = pipeline[1]["$facet"]
+    assert list(branches) == ["0", "1"]
+    assert branches["1"][0] == {"$match": {"station_id": "LFR"}}
+    assert branches["1"][-1]["$group"]["program_ids"] == {"$push": "$_id"}
+
+
+def test_is_document_too_large():
+    assert is_document_too_large(
+        pymongo.errors.OperationFailure("exceeds the limit", code=4031700)
+    )
+    assert not is_document_too_large(NotImplementedError())
+
+
+def test_chunk_by_bytes():
+    sizes = {"a": 3, "b": 3, "c": 10, "d": 1, "e": 1, "f": 1}
+    assert _chunk_by_bytes(list(sizes), sizes, max_items=2, max_bytes=8) == [
+        ["a", "b"],
+        ["c"],
+        ["d", "e"],
+        ["f"],
+    ]
@@ -0,0 +1,48 @@
+import datetime as dt
+from unittest import mock
+
+import pytest
+from jadio import Program
+
+from jadio_feeder.program import ProgramView
+
+
+def create_program_document():
+    return dict(
+        platform_id="radiko.jp",
+        station_id="TBS",
+        id="TBS-1",
+        name="JUNK",
+        episode_id="1",
+        performers=["person1", "person2"],
+        datetime=dt.datetime(2023, 1, 1),
+        duration=1800,
+    )
+
+
+def test_program_view_fields():
+    document = create_program_document()
+    view = ProgramView(document)
+    with mock.patch.object(Program, "from_dict") as from_dict:
+        assert (view.station_id, view.name, view.duration) == ("TBS", "JUNK", 1800)
+        assert view.datetime == dt.datetime(2023, 1, 1)
+        # fields missing from the document are read as defaults of `Program`
+        for name in ["description", "information", "url", "copyright"]:
+            assert getattr(view, name) is None
+        assert view.is_video is False
+    from_dict.assert_not_called()
+
+    with pytest.raises(AttributeError):
+        view._unknown
+
+
+def test_program_view_to_program():
+    view = ProgramView(create_program_document())
+    with mock.patch.object(Program, "from_dict", wraps=Program.from_dict) as from_dict:
+        # other fields are read from `Program` materialized only once
+        assert view.performers == ["person1", "person2"]
+        assert view.id == "TBS-1"
+        program = view.to_program()
+        assert view.to_program() is program
+    assert from_dict.call_count == 1
+    assert (program.name, program.episode_id) == ("JUNK", "1")
@@ -0,0 +1,121 @@
+import datetime as dt
+from unittest import mock
+
+from bson import ObjectId
+from test_feeder import (
+    create_config_document,
+    create_feeder,
+    create_program,
+    write_media,
+)
+
+from jadio_feeder.config import Config
+from jadio_feeder.scheduler import (
+    DEFAULT_INTERVAL,
+    FeedScheduler,
+    infer_update_interval,
+)
+
+
+def test_infer_update_interval():
+    now = dt.datetime(2024, 1, 31, 12)
+    assert infer_update_interval(now - dt.timedelta(hours=3), now) == 15 * 60
+    assert infer_update_interval(now - dt.timedelta(days=3), now) == 60 * 60
+    assert infer_update_interval(now - dt.timedelta(days=20), now) == 6 * 60 * 60
+    assert infer_update_interval(now - dt.timedelta(days=90), now) == DEFAULT_INTERVAL
+
+
+def test_infer_update_interval_no_programs():
+    assert infer_update_interval(None) == DEFAULT_INTERVAL
+
+
+def test_reload_configs(client, tmp_path):
+    with create_feeder(tmp_path) as feeder:
+        configs = feeder.feeder_db.configs
+        configs.insert_many([create_config_document(i) for i in [1, 2]])
+        config_ids = [ObjectId(f"{i:024x}") for i in [1, 2]]
+        scheduler = FeedScheduler(feeder)
+        scheduler.reload_configs()
+        assert list(scheduler.feeds) == config_ids
+        feeds = dict(scheduler.feeds)
+
+        # unchanged configs are neither parsed nor rescheduled
+        with mock.patch.object(Config, "from_dict") as from_dict:
+            scheduler.reload_configs()
+        from_dict.assert_not_called()
+        assert scheduler.feeds == feeds
+
+        # storing the hash does not reschedule the config
+        configs.update_one({"_id": config_ids[0]}, {"$set": {"config_hash": "x"}})
+        scheduler.reload_configs()
+        assert scheduler.feeds[config_ids[0]] is feeds[config_ids[0]]
+
+        configs.update_one({"_id": config_ids[0]}, {"$set": {"max_items": 1}})
+        configs.delete_one({"_id": config_ids[1]})
+        scheduler.reload_configs()
+        assert list(scheduler.feeds) == config_ids[:1]
+        assert scheduler.feeds[config_ids[0]] is not feeds[config_ids[0]]
+
+
+def test_reload_broken_configs(client, tmp_path):
+    with create_feeder(tmp_path) as feeder:
+        configs = feeder.feeder_db.configs
+        configs.insert_many([create_config_document(i) for i in [1, 2]])
+        config_ids = [ObjectId(f"{i:024x}") for i in [1, 2, 3]]
+        scheduler = FeedScheduler(feeder)
+        scheduler.reload_configs()
+        feed = scheduler.feeds[config_ids[0]]
+
+        # broken configs are skipped, keeping their last schedules
+        query = create_config_document(1)["query"]
+        broken_query = dict(query, datetime_range=["2024-01-"])
+        configs.update_one({"_id": config_ids[0]}, {"$set": {"query": broken_query}})
+        configs.insert_one(dict(create_config_document(3), query=broken_query))
+        scheduler.reload_configs()
+        assert list(scheduler.feeds) == config_ids[:2]
+        assert scheduler.feeds[config_ids[0]] is feed
+
+        configs.update_many({}, {"$set": {"query": query}})
+        scheduler.reload_configs()
+        assert list(scheduler.feeds) == config_ids
+        assert scheduler.feeds[config_ids[0]] is feed
+
+
+def test_run_pending(client, tmp_path):
+    programs = [create_program(i) for i in range(3)]
+    write_media(tmp_path / "media", programs)
+    config_ids = [ObjectId(f"{i:024x}") for i in [1, 2]]
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs[:2])
+        feeder.feeder_db.configs.insert_many(
+            [
+                create_config_document(1, update_interval=100),
+                create_config_document(2, update_interval=1000, max_items=1),
+            ]
+        )
+        scheduler = FeedScheduler(feeder)
+        scheduler.reload_configs()
+
+        def run_pending(now: float):
+            with mock.patch("jadio_feeder.scheduler.time.monotonic", return_value=now):
+                return [result.config_id for result in scheduler.run_pending()]
+
+        assert run_pending(0) == config_ids
+        # not due yet
+        assert run_pending(50) == []
+        # due, but no programs were recorded since the last build
+        assert run_pending(150) == []
+        assert scheduler.feeds[config_ids[0]].next_update == 250
+
+        feeder.recorder_db.recorded_programs.insert_one(programs[2])
+        assert run_pending(300) == config_ids[:1]
+        assert run_pending(1000) == config_ids[1:]
+
+        # edited intervals are scheduled at once
+        feeder.feeder_db.configs.update_one(
+            {"_id": config_ids[0]}, {"$set": {"update_interval": 10}}
+        )
+        scheduler.reload_configs()
+        feeder.recorder_db.recorded_programs.delete_one({"_id": programs[0]["_id"]})
+        assert run_pending(310) == config_ids[:1]
+        assert scheduler.feeds[config_ids[0]].next_update == 320
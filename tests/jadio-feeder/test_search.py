@@ -0,0 +1,92 @@
+import asyncio
+import datetime as dt
+
+import pytest
+from bson import ObjectId
+
+from jadio_feeder.search import (
+    SearchIndex,
+    is_searchable,
+    normalize_text,
+    program_to_text,
+    to_ngrams,
+)
+
+
+def test_normalize_text():
+    assert normalize_text("ＪＵＮＫ") == "junk"
+    assert normalize_text("ｱﾆﾒ") == "あにめ"
+    assert normalize_text("アニメ") == normalize_text("あにめ")
+    assert normalize_text("ガッコウ") == "がっこう"
+
+
+def test_is_searchable():
+    assert is_searchable("JUNK")
+    assert is_searchable("伊集院 光")
+    assert not is_searchable("^onsen")
+    assert not is_searchable("JUNK|ANN")
+    assert not is_searchable("光")
+
+
+def test_to_ngrams():
+    assert to_ngrams("abca") == ["ab", "bc", "ca"]
+    assert to_ngrams("a") == []
+
+
+def test_program_to_text():
+    program = dict(
+        name="ＪＵＮＫ",
+        description="深夜のラジオ",
+        information=["info", None],
+        episode_name=None,
+    )
+    text = program_to_text(program)
+
+    assert normalize_text("junk") in text
+    assert normalize_text("ラジオ") in text
+    assert "info" in text
+    # words never match across fields
+    assert all("kし" not in gram for gram in to_ngrams(text))
+
+
+def test_async_search_index_requires_prefetch():
+    pytest.importorskip("motor")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from jadio_feeder.search import AsyncSearchIndex
+
+    async def search():
+        client = mongomock_motor.AsyncMongoMockClient()
+        search_index = AsyncSearchIndex(client.feeder.search_index)
+        await search_index.prefetch(["ＪＵＮＫ"])
+        assert search_index.search("junk") == []
+        with pytest.raises(RuntimeError):
+            search_index.search("ラジオ")
+
+    asyncio.run(search())
+
+
+def test_search_index_catches_up_with_old_programs():
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient()
+    programs = client.recorder.recorded_programs
+    programs.insert_many(
+        [
+            dict(_id=ObjectId(f"{i:024x}"), name=name)
+            for i, name in enumerate(["ラジオ", "ニュース", "深夜"])
+        ]
+    )
+    search_index = SearchIndex(client.feeder.search_index)
+    assert search_index.update(programs) == 3
+    assert search_index.update(programs) == 0
+
+    # programs below the high-water mark are edited and removed
+    programs.update_one({"_id": ObjectId(f"{0:024x}")}, {"$set": {"name": "音楽"}})
+    programs.delete_one({"_id": ObjectId(f"{1:024x}")})
+    assert search_index.update(programs) == 0
+    client.feeder.search_index.update_many(
+        {}, {"$set": {"indexed_at": dt.datetime(2020, 1, 1)}}
+    )
+    assert search_index.update(programs) == 3
+    assert search_index.search("ラジオ") == []
+    assert search_index.search("音楽") == [ObjectId(f"{0:024x}")]
+    assert client.feeder.search_index.count_documents({}) == 2
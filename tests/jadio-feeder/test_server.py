@@ -0,0 +1,151 @@
+import gzip
+import threading
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import pytest
+from bson import ObjectId
+from test_feeder import (
+    create_config_document,
+    create_feeder,
+    create_program,
+    write_media,
+)
+
+from jadio_feeder.server import FeedCache, FeedServer, _accepts_gzip, _parse_etags
+
+
+def test_feed_cache_lru(tmp_path):
+    cache = FeedCache(max_bytes=10, cache_dir=tmp_path)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a").body == b"aaaa"
+    cache.put("c", b"cccc")
+
+    # "b" is evicted from memory as the least recently used one
+    assert len(cache) == 2
+    assert "b" not in cache._feeds
+    # but it is read again from disk with its last modified time
+    feed = cache.get("b")
+    assert feed.body == b"bbbb"
+    assert feed.last_modified == pytest.approx((tmp_path / "b.xml").stat().st_mtime)
+    assert FeedCache(max_bytes=10).get("b") is None
+
+
+def test_feed_cache_max_disk_entries(tmp_path):
+    cache = FeedCache(cache_dir=tmp_path, max_disk_entries=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, key.encode())
+    assert sorted(path.name for path in tmp_path.glob("*.xml")) == ["b.xml", "c.xml"]
+
+
+def test_accepts_gzip():
+    assert _accepts_gzip("gzip, deflate, br")
+    assert _accepts_gzip("*")
+    assert not _accepts_gzip("gzip;q=0, br")
+    assert not _accepts_gzip(None)
+
+
+def test_parse_etags():
+    assert _parse_etags('"a", W/"b-gzip"') == ["a", "b-gzip"]
+
+
+class _StaticFeedServer(FeedServer):
+    def __init__(self) -> None:
+        super().__init__(feeder=None)
+        self.feed = self.cache.put("key", b"<rss/>" * 100)
+
+    def get_feed(self, config_id):
+        return self.feed if config_id == "feed" else None
+
+
+@pytest.fixture
+def base_url():
+    server = _StaticFeedServer().create_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url, **headers):
+    try:
+        with urllib.request.urlopen(
+            urllib.request.Request(url, headers=headers)
+        ) as res:
+            return res.status, res.headers, res.read()
+    except urllib.error.HTTPError as err:
+        return err.code, err.headers, b""
+
+
+def test_serve_feed(base_url):
+    status, headers, body = _get(f"{base_url}/rss/feed.xml")
+    assert status == 200
+    assert body == b"<rss/>" * 100
+    assert headers["ETag"] == '"key"'
+    assert headers["Content-Type"].startswith("application/rss+xml")
+
+    status, headers, _ = _get(f"{base_url}/rss/feed.xml", **{"If-None-Match": '"key"'})
+    assert status == 304
+    status, _, _ = _get(
+        f"{base_url}/rss/feed.xml",
+        **{"If-Modified-Since": headers["Last-Modified"]},
+    )
+    assert status == 304
+
+    assert _get(f"{base_url}/rss/unknown.xml")[0] == 404
+    assert _get(f"{base_url}/unknown")[0] == 404
+
+
+def test_serve_feed_gzip(base_url):
+    status, headers, body = _get(
+        f"{base_url}/rss/feed.xml", **{"Accept-Encoding": "gzip"}
+    )
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["ETag"] == '"key-gzip"'
+    assert gzip.decompress(body) == b"<rss/>" * 100
+
+    status, _, _ = _get(
+        f"{base_url}/rss/feed.xml",
+        **{"Accept-Encoding": "gzip", "If-None-Match": headers["ETag"]},
+    )
+    assert status == 304
+
+
+def test_poll_recorder(client, tmp_path):
+    programs = [create_program(i) for i in range(3)]
+    write_media(tmp_path / "media", programs)
+    config_ids = [str(ObjectId(f"{i:024x}")) for i in [1, 2]]
+    with create_feeder(tmp_path) as feeder:
+        feeder.recorder_db.recorded_programs.insert_many(programs[:2])
+        feeder.feeder_db.configs.insert_many(
+            [create_config_document(1), create_config_document(2, max_items=1)]
+        )
+        server = FeedServer(feeder, poll_interval=0)
+        for config_id in config_ids:
+            assert server.get_feed(config_id) is not None
+        state = server._recorder_state
+        assert len(server._summaries) == 2
+        assert feeder._item_store._items
+
+        def update_search_index():
+            # other requests are served by the previous state meanwhile
+            assert not server._poll_lock.locked()
+            assert server._poll_recorder() == state
+
+        feeder.recorder_db.recorded_programs.insert_one(programs[2])
+        feeder.feeder_db.configs.delete_one({"_id": ObjectId(config_ids[1])})
+        with mock.patch.object(
+            feeder, "update_search_index", side_effect=update_search_index
+        ) as update:
+            assert server._poll_recorder() != state
+        update.assert_called_once()
+        # programs of the previous state are not kept in memory
+        assert server._summaries == {}
+        assert feeder._item_store._items == {}
+
+        assert server.get_feed(config_ids[0]).body.count(b"<item>") == 3
+        assert server.get_feed(config_ids[1]) is None
+        assert list(server._summaries) == [ObjectId(config_ids[0])]
@@ -0,0 +1,131 @@
+import datetime as dt
+import io
+from typing import List, Optional
+
+import pytest
+
+from jadio_feeder.podcast import Enclosure, ItunesCategory, PodcastChannel, PodcastItem
+from jadio_feeder.stream import (
+    _end_feed,
+    _start_feed,
+    _write_item,
+    _XmlStreamWriter,
+    render_item,
+)
+
+LAST_BUILD_DATE = "Mon, 01 Jan 2024 00:00:00 +0000"
+
+
+def create_channel() -> PodcastChannel:
+    return PodcastChannel(
+        title="title",
+        description="description & <tags>",
+        itunes_image="http://image.png",
+        itunes_category=ItunesCategory(cat="Leisure", sub="Animation &amp; Manga"),
+        itunes_author="author",
+        link="http://link.com",
+        copyright="copyright",
+    )
+
+
+def create_items():
+    return [
+        PodcastItem(
+            title=f"title{i}",
+            enclosure=Enclosure(
+                url=f"http://localhost/media/{i}/media.m4a",
+                length=1000 + i,
+                type="audio/x-m4a",
+            ),
+            guid=str(i),
+            pub_date=dt.datetime(2024, 1, i),
+            description=f'<a href="http://link.com/{i}">link</a>\r\nline',
+            itunes_duration=7200,
+            itunes_image="http://image.png",
+        )
+        for i in range(1, 4)
+    ]
+
+
+def create_feedgen_bytes(
+    pretty: bool, items: Optional[List[PodcastItem]] = None
+) -> bytes:
+    feed_generator = create_channel().to_feed_generator()
+    feed_generator.lastBuildDate(LAST_BUILD_DATE)
+    for item in items or create_items():
+        item.set_feed_entry(feed_generator.add_entry(order="append"))
+    return feed_generator.rss_str(pretty=pretty)
+
+
+def create_stream_bytes(
+    pretty: bool, items: Optional[List[PodcastItem]] = None
+) -> bytes:
+    f = io.BytesIO()
+    xml = _XmlStreamWriter(f, pretty=pretty)
+    _start_feed(xml, create_channel(), LAST_BUILD_DATE)
+    for item in items or create_items():
+        _write_item(xml, item)
+    _end_feed(xml)
+    return f.getvalue()
+
+
+def test_stream_writer_same_as_feedgen_pretty():
+    assert create_stream_bytes(pretty=True) == create_feedgen_bytes(pretty=True)
+
+
+def test_stream_writer_same_as_feedgen_compact():
+    assert create_stream_bytes(pretty=False) == create_feedgen_bytes(pretty=False)
+
+
+def test_stream_writer_enclosure_length_same_as_feedgen():
+    items = create_items()
+    items[0].enclosure.length = None
+    items[1].enclosure.length = 0
+    expected = create_feedgen_bytes(pretty=False, items=items)
+    assert create_stream_bytes(pretty=False, items=items) == expected
+    assert b'length="None"' in expected
+
+
+def test_stream_writer_rejects_control_characters_as_feedgen():
+    for field in ["title", "description"]:
+        items = create_items()
+        setattr(items[0], field, "control\x01character")
+        with pytest.raises(ValueError, match="XML compatible"):
+            create_feedgen_bytes(pretty=False, items=items)
+        with pytest.raises(ValueError, match="XML compatible"):
+            create_stream_bytes(pretty=False, items=items)
+    # but tabs and line breaks are allowed
+    items = create_items()
+    items[0].title = "tab\tline\nbreak"
+    expected = create_feedgen_bytes(pretty=False, items=items)
+    assert create_stream_bytes(pretty=False, items=items) == expected
+
+
+def test_render_item_fragments_same_as_feedgen():
+    for pretty in [True, False]:
+        f = io.BytesIO()
+        xml = _XmlStreamWriter(f, pretty=pretty)
+        _start_feed(xml, create_channel(), LAST_BUILD_DATE)
+        for item in create_items():
+            xml.fragment(render_item(item, pretty=pretty))
+        _end_feed(xml)
+        assert f.getvalue() == create_feedgen_bytes(pretty=pretty)
+
+
+def test_stream_writer_archive_links():
+    f = io.BytesIO()
+    xml = _XmlStreamWriter(f, pretty=False)
+    links = {
+        "current": "http://localhost/rss/feed.xml",
+        "prev-archive": "http://localhost/rss/feed/archive-1.xml",
+    }
+    _start_feed(xml, create_channel(), LAST_BUILD_DATE, links=links, archive=True)
+    _end_feed(xml)
+    actual = f.getvalue().decode("utf-8")
+
+    assert 'xmlns:fh="http://purl.org/syndication/history/1.0"' in actual
+    assert (
+        '<atom:link href="http://localhost/rss/feed.xml" rel="current"/>'
+        '<atom:link href="http://localhost/rss/feed/archive-1.xml" rel="prev-archive"/>'
+        "<fh:archive/></channel>"
+    ) in actual
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from jadio_feeder.work_queue import WorkQueue, create_owner_id
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().get_database("feeder").get_collection("queue")
+
+
+def test_claim_and_complete(collection):
+    queue = WorkQueue(collection)
+    queue.enqueue(["b", "a"])
+    assert queue.count_pending() == 2
+
+    # configs are claimed in the order of enqueueing
+    lease = queue.claim("worker")
+    assert (lease.config_id, lease.attempts) == ("b", 1)
+    assert queue.claim("other").config_id == "a"
+    assert queue.claim("other") is None
+
+    # a config enqueued again while leased is not built again in the round
+    assert queue.enqueue(["b"]) == 0
+    assert queue.complete(lease, dict(updated=True))
+    doc = collection.find_one({"_id": "b"})
+    assert doc["result"]["updated"]
+    assert doc["result"]["worker"] == "worker"
+    assert "owner" not in doc
+    assert queue.claim("other") is None
+
+
+def test_enqueue_joins_current_round(collection):
+    queue = WorkQueue(collection)
+    assert queue.enqueue(["a", "b", "c"]) == 3
+    queue.complete(queue.claim("host-a"), dict(updated=True))
+    lease = queue.claim("host-a")
+    assert lease.config_id == "b"
+
+    # another host starts in the middle of the round of host-a
+    assert queue.enqueue(["c", "b", "a", "d"]) == 1
+    assert queue.count_pending() == 2
+    assert collection.find_one({"_id": "b"})["attempts"] == 1
+    leases = [queue.claim("host-b") for _ in range(2)]
+    assert [lease.config_id for lease in leases] == ["c", "d"]
+    assert queue.claim("host-b") is None
+
+    # the round finishes, and configs are built again in the next round
+    for lease in [lease] + leases:
+        assert queue.complete(lease, dict(updated=True))
+    assert queue.enqueue(["a", "b", "c", "d"]) == 4
+
+
+def test_reclaim_expired_lease(collection):
+    queue = WorkQueue(collection, lease_seconds=0.05, max_attempts=2)
+    queue.enqueue(["a"])
+    lease = queue.claim("crashed")
+    assert queue.claim("worker") is None
+
+    time.sleep(0.1)
+    reclaimed = queue.claim("worker")
+    assert (reclaimed.config_id, reclaimed.attempts) == ("a", 2)
+    # the result of the crashed worker is discarded
+    assert not queue.complete(lease, dict(updated=True))
+    assert queue.complete(reclaimed, dict(updated=False))
+
+    # configs whose leases expired too many times are not claimed until they are
+    # enqueued again
+    queue.enqueue(["a"])
+    assert queue.claim("crashed").attempts == 1
+    time.sleep(0.1)
+    assert queue.claim("crashed").attempts == 2
+    time.sleep(0.1)
+    assert queue.claim("worker") is None
+    queue.enqueue(["a"])
+    assert queue.claim("worker").attempts == 1
+
+
+def test_heartbeat_extends_leases(collection):
+    queue = WorkQueue(collection, lease_seconds=0.15)
+    queue.enqueue(["a"])
+    owner = create_owner_id()
+    with queue.heartbeat(owner):
+        queue.claim(owner)
+        time.sleep(0.3)
+        assert queue.claim("other") is None